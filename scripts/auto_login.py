@@ -7,56 +7,601 @@ ClawCloud 自动登录脚本
 - Telegram 通知
 """
 
+import time
+STARTED_AT = time.perf_counter()  # 脚本开始加载，用于报告启动耗时
+
 import os
 import sys
-import time
+import io
+import importlib
+import importlib.util
 import base64
 import re
 import json
+import html
+import zlib
+import socket
+import hmac
+import struct
+import hashlib
+import random
 import subprocess
+import shutil
 import signal
-import requests
-from urllib.parse import urlparse, parse_qs, unquote
-from playwright.sync_api import sync_playwright
+import threading
+import queue
+import functools
+import contextvars
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager, nullcontext, redirect_stdout
+from urllib.parse import urlparse, parse_qs, parse_qsl, unquote, urlencode, quote, quote_plus
+
+# 重量级依赖（requests、Playwright、yaml、nacl）按需导入：check / history 子命令不需要浏览器，
+# 也不用为它们付出导入时间。每个模块第一次导入的耗时记在 IMPORT_TIMES 里，结束时输出
+IMPORT_TIMES = {}
+
+
+def timed_import(name):
+    if name in sys.modules:
+        return sys.modules[name]
+    start = time.perf_counter()
+    module = importlib.import_module(name)
+    IMPORT_TIMES[name] = time.perf_counter() - start
+    return module
+
+
+class LazyModule:
+    """第一次访问属性时才导入的模块"""
+
+    def __init__(self, name):
+        self._name = name
+
+    def __getattr__(self, attr):
+        return getattr(timed_import(self._name), attr)
+
+
+requests = LazyModule('requests')
+asyncio = LazyModule('asyncio')  # 只有 ENGINE=async 才用到
+sqlite3 = LazyModule('sqlite3')  # 运行历史
+statistics = LazyModule('statistics')
+CO_COROUTINE = 0x80  # inspect.CO_COROUTINE：判断 async 函数不必为此导入 inspect / asyncio
+
+
+def sync_playwright():
+    return timed_import('playwright.sync_api').sync_playwright()
+
+
+def async_playwright():
+    return timed_import('playwright.async_api').async_playwright()
+
 
 # ==================== 配置 ====================
 # 固定登录入口，OAuth后会自动跳转到实际区域
 LOGIN_ENTRY_URL = "https://ap-southeast-1.run.claw.cloud"
-SIGNIN_URL = f"{LOGIN_ENTRY_URL}/signin"
+# 区域：检测到的区域存入 Secret CLAW_REGION，下次直接从该区域的登录页进入，省掉跨区域跳转
+REGION_RE = re.compile(r'^[a-z]+-[a-z]+-\d+$')
+CLAW_REGIONS = [r.strip() for r in os.environ.get("CLAW_REGIONS", "ap-southeast-1,us-west-1,eu-central-1,ap-northeast-1").split(',')
+                if REGION_RE.match(r.strip())]
+REGION_PROBE = os.environ.get("REGION_PROBE", "0") == "1"  # 没有保存的区域时，测量各区域延迟，从最快的入口进入
 DEVICE_VERIFY_WAIT = 30  # Mobile验证 默认等 30 秒
 TWO_FACTOR_WAIT = int(os.environ.get("TWO_FACTOR_WAIT", "120"))  # 2FA验证 默认等 120 秒
 
+# 保活访问的控制台地址（逗号分隔，相对区域 URL）；"api:" 前缀只带上下文 Cookie 发 HTTP 请求，不渲染页面
+KEEPALIVE_ENDPOINTS = [e.strip() for e in (os.environ.get("KEEPALIVE_ENDPOINTS") or "/,/apps").split(',') if e.strip()]
+KEEPALIVE_CONCURRENCY = max(1, int(os.environ.get("KEEPALIVE_CONCURRENCY", "3")))  # 同时加载的标签页 / 同时发出的 API 请求上限
+KEEPALIVE_NAMES = {'/': '控制台', '/apps': '应用'}
+
+# 免浏览器快速路径：Session 仍有效且 OAuth 无需点击授权时，只用 HTTP 完成保活
+HTTP_FAST_PATH = os.environ.get("HTTP_FAST_PATH", "1") == "1"
+CLAW_OAUTH_URL = os.environ.get("CLAW_OAUTH_URL", "").strip()  # 可选：ClawCloud 的 GitHub 授权地址
+
+# 浏览器登录态（GitHub + ClawCloud 的 Cookie 和 localStorage），压缩加密后存入 Secret
+STATE_DOMAINS = ('github.com', 'claw.cloud')  # 只保留这些站点的状态
+STATE_MAX_SIZE = 48 * 1024  # GitHub Secret 上限 48KB
+
 # 代理配置
 LOCAL_PROXY_PORT = 51080  # 本地 SOCKS5 代理端口
 LOCAL_HTTP_PORT = 51081   # 本地 HTTP 代理端口
+PROXY_READY_TIMEOUT = int(os.environ.get("PROXY_READY_TIMEOUT", "15"))  # 等待隧道就绪的上限（秒）
+PROXY_PROBE_URL = os.environ.get("PROXY_PROBE_URL", "").strip()  # 可选：出口 IP 探测地址，如 https://api.ipify.org?format=json
+PROXY_SPEED_URL = os.environ.get("PROXY_SPEED_URL", "").strip()  # 可选：多节点测速下载地址（参与选择最快节点）
+HY2_LOG_LINES = 500  # 每个 hysteria 进程在内存里保留的最近日志行数
+HY2_RESTARTS = int(os.environ.get("HY2_RESTARTS", "3"))  # 节点退出或隧道中断时在原端口上重启的次数（指数退避）
+HY2_RECONNECT_GRACE = 5  # 日志报连接错误后，等客户端自己重连的秒数，超过视为隧道中断
+
+# 浏览器配置
+BROWSER_ARGS = ['--no-sandbox', '--disable-blink-features=AutomationControlled']
+USER_AGENT = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36'
+# 可选：持久化浏览器配置目录（单账号模式），复用 HTTP 缓存、HSTS、Cookie，减少冷启动和静态资源下载
+BROWSER_PROFILE_DIR = os.environ.get("BROWSER_PROFILE_DIR", "").strip()
+
+# 截图（内存环形缓冲，发送时才生成上传内容）
+SHOT_BUFFER = int(os.environ.get("SHOT_BUFFER", "8"))  # 内存中保留的截图张数
+SHOT_FORMAT = os.environ.get("SHOT_FORMAT", "jpeg")  # jpeg / png
+SHOT_QUALITY = int(os.environ.get("SHOT_QUALITY", "60"))  # JPEG 质量
+SHOT_CLIP = os.environ.get("SHOT_CLIP", "").strip()  # 可选裁剪区域 "x,y,宽,高"
+SHOT_DIR = os.environ.get("SHOT_DIR", "").strip()  # 可选：同时保存到该目录
+
+# Telegram 通知（后台队列投递）
+TG_RETRIES = 4  # 每条消息最多尝试次数
+TG_COALESCE_WINDOW = 0.3  # 合并相邻文本消息的等待窗口（秒）
+TG_FLUSH_TIMEOUT = 60  # 运行结束时等待队列发完的上限（秒）
+TG_POLL_TIMEOUT = 25  # getUpdates 长轮询时长（秒）
+
+# 线路熔断（Telegram、GitHub API）：同一站点某条线路（代理 / 直连）连续失败这么多次后暂停使用，
+# 冷却后在后台探测，通了再恢复；冷却时间每次探测失败翻倍，最长 10 分钟
+BREAKER_FAILURES = int(os.environ.get("BREAKER_FAILURES", "2"))
+BREAKER_COOLDOWN = int(os.environ.get("BREAKER_COOLDOWN", "30"))
+TG_API_BASE = os.environ.get("TG_API_BASE", "https://api.telegram.org").rstrip('/')  # 基准测试时指向本地替身
+
+# GitHub API 地址（基准测试时指向本地替身）
+GITHUB_API_URL = os.environ.get("GITHUB_API_URL", "https://api.github.com").rstrip('/')
+SECRET_CONCURRENCY = 4  # 批量写 Secret 时的并发数
+
+# 资源拦截：丢弃登录不需要的图片/字体/媒体和统计上报，节省时间和代理流量
+# 注册路由后 Chromium 会停用 HTTP 缓存，所以持久化配置模式下默认关闭（显式设置 ROUTE_BLOCK=1 仍会启用）
+ROUTE_BLOCK = os.environ.get("ROUTE_BLOCK", "0" if BROWSER_PROFILE_DIR else "1") == "1"
+# 域名 -> 要丢弃的资源类型，"*" 为默认；例如 {"*": ["image", "font"], "claw.cloud": []}
+ROUTE_POLICY = json.loads(os.environ.get("ROUTE_POLICY", "") or '{"*": ["image", "media", "font"]}')
+BLOCK_HOSTS = [
+    'collector.github.com',
+    'api.github.com/_private/browser/stats',
+    'avatars.githubusercontent.com',
+    'google-analytics.com',
+    'googletagmanager.com',
+    'doubleclick.net',
+    'sentry.io',
+    'hotjar.com',
+    'clarity.ms',
+    'segment.io',
+] + [h for h in os.environ.get("BLOCK_HOSTS", "").split(',') if h]
+# 人机验证相关，始终放行
+ALLOW_HOSTS = [
+    'challenges.cloudflare.com',
+    'hcaptcha.com',
+    'recaptcha.net',
+    'www.google.com/recaptcha',
+    'www.gstatic.com/recaptcha',
+    'arkoselabs.com',
+    'octocaptcha.com',
+] + [h for h in os.environ.get("ALLOW_HOSTS", "").split(',') if h]
+
+# 本地 TOTP：配置了 GH_TOTP_SECRET（多账号为 ACCOUNTS 里的 totp）时直接计算验证码，Telegram /code 只作备用
+TOTP_MIN_REMAINING = 3  # 当前 30 秒窗口剩余不足该秒数时等下一个窗口再填
+TOTP_TIME_URL = os.environ.get("TOTP_TIME_URL", "https://github.com").strip()  # 用其 Date 响应头校准本机时钟
+
+# 选择器学习：记录每一步实际命中的 selector，下次排在最前（LEARNED_SELECTORS Secret + 本地文件）
+SELECTOR_CACHE = os.environ.get("SELECTOR_CACHE", "selectors.json").strip()
+
+# 分段计时：TRACE_FILE 非空时每个步骤写一行 JSON（超过 TRACE_MAX_MB 后轮转为 .1）；PW_TRACE 非空时同时录制 Playwright trace（zip 路径）
+TRACE_FILE = os.environ.get("TRACE_FILE", "").strip()
+TRACE_MAX_MB = float(os.environ.get("TRACE_MAX_MB", "10"))
+PW_TRACE = os.environ.get("PW_TRACE", "").strip()
+
+# HAR 录制 / 回放（离线复现整个浏览器流程）：HAR_RECORD 录制本次会话到该 .har（结束后脱敏）；
+# HAR_REPLAY 用录好的 .har 应答所有页面请求，不出网、不写 Secret、不发 Telegram，用于对比步骤耗时、等待策略和 selector 改动
+HAR_RECORD = os.environ.get("HAR_RECORD", "").strip()
+HAR_REPLAY = os.environ.get("HAR_REPLAY", "").strip()
+HAR_REPLAY_MISS = os.environ.get("HAR_REPLAY_MISS", "abort").strip()  # HAR 里没有的请求：abort 中止 / fallback 照常联网
+
+# 运行历史（SQLite，只追加）：每次运行的结果、失败步骤和各步骤耗时，用 `auto_login.py history` 查询；留空关闭
+HISTORY_DB = os.environ.get("HISTORY_DB", "history.db").strip()
+
+# 多账号模式（ACCOUNTS 为 JSON 数组时启用）
+FLEET_CONCURRENCY = int(os.environ.get("FLEET_CONCURRENCY", "3"))  # 同时运行的账号数
+FLEET_CDP_PORT = 51090  # 共享 Chromium 的 CDP 端口，各工作线程通过它连接
+
+# 常驻模式（python scripts/auto_login.py daemon）：代理和浏览器常驻，每个账号按自己的排期保活
+DAEMON_INTERVAL = int(os.environ.get("DAEMON_INTERVAL", str(24 * 3600)))  # 同一账号两次保活的间隔（秒）
+DAEMON_JITTER = int(os.environ.get("DAEMON_JITTER", "1800"))  # 间隔随机浮动 ±秒；首次运行在 0~该值内错开
+DAEMON_RECYCLE_RUNS = int(os.environ.get("DAEMON_RECYCLE_RUNS", "20"))  # 浏览器跑满这么多次后重启，0 不限
+DAEMON_RECYCLE_RSS = int(os.environ.get("DAEMON_RECYCLE_RSS", "1024"))  # 浏览器进程总内存超过这么多 MB 后重启，0 不限
+
+# 执行引擎：sync（默认）/ async（asyncio，页面导航、Telegram 指令、代理状态同时等待，多账号共用一个事件循环）
+ENGINE = os.environ.get("ENGINE", "sync").strip().lower()
+
+
+class Tracer:
+    """
+    分段计时
+    - span() 可嵌套，调用栈存在 ContextVar 里：各线程、各 asyncio 任务互不干扰，asyncio.to_thread 里沿用调用方的栈
+    - 每个 span 结束时写一行 JSON 到 TRACE_FILE（设置了才写），文件超过 TRACE_MAX_MB 时改名为 .1 重新开始，常驻模式下不会无限增长
+    - summary() 汇总顶层步骤耗时，放进最终通知
+    - 绑定 Playwright tracing 后，span 同时作为 trace 里的分组
+    """
+
+    write_lock = threading.Lock()  # 多账号共用一个 trace 文件
+
+    def __init__(self, account=None, path=TRACE_FILE):
+        self.account = account
+        self.path = path
+        self.run_id = f"{time.strftime('%Y%m%d%H%M%S')}-{os.getpid()}"
+        self.spans = []
+        self.stack = contextvars.ContextVar(f'trace_stack_{id(self)}', default=())
+        self.pw_tracing = None  # context.tracing（仅同步 API）
+
+    @contextmanager
+    def span(self, name, **attrs):
+        stack = self.stack.get()
+        record = {
+            'run': self.run_id,
+            'account': self.account,
+            'name': name,
+            'parent': stack[-1]['name'] if stack else None,
+            'depth': len(stack),
+            'start': time.time(),
+        }
+        if attrs:
+            record['attrs'] = attrs
+        token = self.stack.set(stack + (record,))
+        grouped = self._group(name)
+        try:
+            yield record
+            record['ok'] = True
+        except BaseException as e:
+            record['ok'] = False
+            record['error'] = str(e)[:200]
+            raise
+        finally:
+            self.stack.reset(token)
+            if grouped:
+                try:
+                    self.pw_tracing.group_end()
+                except Exception:
+                    pass
+            record['dur'] = round(time.time() - record['start'], 4)
+            self.spans.append(record)
+            self.write(record)
+
+    def event(self, name, start, dur, ok=True, **attrs):
+        """补记一个已结束的步骤（并发执行、没法用 with 包住的操作），挂在当前 span 下"""
+        stack = self.stack.get()
+        record = {
+            'run': self.run_id,
+            'account': self.account,
+            'name': name,
+            'parent': stack[-1]['name'] if stack else None,
+            'depth': len(stack),
+            'start': start,
+        }
+        if attrs:
+            record['attrs'] = attrs
+        record['ok'] = ok
+        record['dur'] = round(dur, 4)
+        self.spans.append(record)
+        self.write(record)
+
+    def _group(self, name):
+        """Playwright trace 分组（需要 1.49+，旧版本忽略）"""
+        if not self.pw_tracing:
+            return False
+        try:
+            self.pw_tracing.group(name)
+            return True
+        except Exception:
+            return False
+
+    def write(self, record):
+        if not self.path:
+            return
+        try:
+            with self.write_lock:
+                if TRACE_MAX_MB > 0 and os.path.exists(self.path) and os.path.getsize(self.path) > TRACE_MAX_MB * 1024 * 1024:
+                    os.replace(self.path, self.path + '.1')
+                with open(self.path, 'a') as f:
+                    f.write(json.dumps(record, ensure_ascii=False) + "\n")
+        except Exception:
+            pass
+
+    def summary(self):
+        """顶层步骤耗时，同名步骤累加，按首次出现顺序"""
+        totals = {}
+        for record in sorted(self.spans, key=lambda r: r['start']):
+            if record['depth'] == 0:
+                totals[record['name']] = totals.get(record['name'], 0) + record['dur']
+        return totals
+
+
+def traced(name):
+    """方法计时装饰器：用实例的 tracer 包一层 span（没有 tracer 时直接调用），支持 async 方法"""
+    def decorator(fn):
+        if fn.__code__.co_flags & CO_COROUTINE:
+            @functools.wraps(fn)
+            async def async_wrapper(self, *args, **kwargs):
+                tracer = getattr(self, 'tracer', None)
+                if tracer is None:
+                    return await fn(self, *args, **kwargs)
+                with tracer.span(name):
+                    return await fn(self, *args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(fn)
+        def wrapper(self, *args, **kwargs):
+            tracer = getattr(self, 'tracer', None)
+            if tracer is None:
+                return fn(self, *args, **kwargs)
+            with tracer.span(name):
+                return fn(self, *args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def step(name=None):
+    """
+    登录流程的共享步骤：fn 写成生成器，页面操作、截图、等待等引擎相关的调用都 yield 出去，由 self.drive() 执行
+    同步引擎里直接得到返回值，asyncio 引擎里得到协程（调用方 await）；name 非空时整个步骤包一层 span
+    """
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(self, *args, **kwargs):
+            return self.drive(fn(self, *args, **kwargs), name)
+        return wrapper
+    return decorator
+
+
+class Hysteria2Client:
+    """
+    单个 Hysteria2 客户端进程（一个节点 + 一组本地端口）
+    - 后台线程持续读取日志（避免管道写满卡住客户端），只保留最近 HY2_LOG_LINES 行
+    - 从日志解析连接次数、TCP/UDP 请求、流量和 RTT；报连接错误后记下 down_since，用于判断隧道中断
+    """
+
+    def __init__(self, url, config, socks_port, http_port):
+        self.url = url
+        self.config = config
+        self.socks_port = socks_port
+        self.http_port = http_port
+        self.name = url.rsplit('#', 1)[1] if '#' in url else config['server']
+        self.config_file = f'/tmp/hy2_config_{socks_port}.yaml'
+        self.process = None
+        self.output = deque(maxlen=HY2_LOG_LINES)  # hysteria 客户端最近的日志
+        self.output_event = threading.Event()  # 有新日志时触发
+        self.stats = {'connects': 0, 'tcp': 0, 'tcp_errors': 0, 'udp': 0, 'errors': 0,
+                      'tx': 0, 'rx': 0, 'rtt': None, 'last_error': None}
+        self.down_since = None  # 日志报连接错误、尚未重连上的时间
+        self.debug_seen = False  # 见过 debug 日志：请求数和流量统计才有意义
+        self.connected = threading.Event()  # 日志里出现 "connected to server"
+        self.latency = None  # 启动到隧道就绪的耗时（握手延迟）
+        self.throughput = None  # 测速结果（字节/秒）
+
+    def generate_config(self):
+        """生成 Hysteria2 配置文件"""
+        yaml = timed_import('yaml')
+        
+        with open(self.config_file, 'w') as f:
+            yaml.dump(self.config, f, default_flow_style=False)
+        
+        return self.config_file
+    
+    def generate_config_json(self):
+        """生成 Hysteria2 JSON 配置文件（备选）"""
+        json_file = self.config_file.replace('.yaml', '.json')
+        with open(json_file, 'w') as f:
+            json.dump(self.config, f, indent=2)
+        
+        return json_file
+
+    def start(self, timeout=PROXY_READY_TIMEOUT):
+        """启动客户端并等待隧道就绪"""
+        # 尝试使用 YAML 配置
+        try:
+            config_file = self.generate_config()
+        except ImportError:
+            # 如果没有 PyYAML，使用 JSON
+            config_file = self.generate_config_json()
+
+        start = time.time()
+        self.output.clear()
+        self.connected.clear()
+        self.down_since = None
+        # TCP/UDP 请求和流量只在 debug 级别的日志里出现，默认 info 级别下统计会一直是 0
+        env = {**os.environ, 'HYSTERIA_LOG_LEVEL': os.environ.get('HYSTERIA_LOG_LEVEL', 'debug')}
+        self.process = subprocess.Popen(
+            ['hysteria', 'client', '-c', config_file],
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+            preexec_fn=os.setsid,
+            env=env
+        )
+        threading.Thread(target=self.read_output, args=(self.process,), daemon=True).start()
+
+        # 等待隧道就绪（端口监听 + 客户端连上服务器）
+        if not self.wait_ready(timeout):
+            self.stop()
+            return False
+        self.latency = time.time() - start
+        return True
+
+    def read_output(self, process):
+        """后台读取 hysteria 日志（合并 stdout/stderr），识别连接成功并更新统计"""
+        for raw in iter(process.stdout.readline, b''):
+            line = raw.decode(errors='replace').rstrip()
+            self.output.append(line)
+            try:
+                self.parse_line(line)
+            except Exception:
+                pass
+            self.output_event.set()
+        self.output_event.set()
+
+    def parse_line(self, line):
+        """解析一行日志：时间<TAB>级别<TAB>消息<TAB>{JSON 字段}（字段可省略）"""
+        parts = line.split('\t')
+        level = parts[1].strip().upper() if len(parts) > 2 else parts[0].strip().upper()
+        message = (parts[2] if len(parts) > 2 else parts[-1]).strip().lower()
+        fields = {}
+        if line.endswith('}') and '{' in line:
+            try:
+                fields = json.loads(line[line.index('{'):])
+            except ValueError:
+                pass
+
+        stats = self.stats
+        if level == 'DEBUG':
+            self.debug_seen = True
+        if 'connected to server' in message:
+            stats['connects'] += 1
+            self.down_since = None
+            self.connected.set()
+        elif message.startswith('tcp request'):
+            stats['tcp'] += 1
+        elif message.startswith('tcp error'):
+            stats['tcp_errors'] += 1
+        elif message.startswith('udp request'):
+            stats['udp'] += 1
+        for key in ('tx', 'rx'):
+            if isinstance(fields.get(key), (int, float)):
+                stats[key] += fields[key]
+        if 'rtt' in fields:
+            stats['rtt'] = self.to_ms(fields['rtt'])
+
+        if level in ('ERROR', 'FATAL') and not message.startswith(('tcp', 'udp')):
+            stats['errors'] += 1
+            stats['last_error'] = str(fields.get('error') or message)[:200]
+            text = f"{message} {stats['last_error']}".lower()
+            if any(k in text for k in ('connect', 'network activity', 'timeout', 'closed')):
+                self.down_since = self.down_since or time.time()
+
+    @staticmethod
+    def to_ms(value):
+        """RTT 字段：数字按毫秒，字符串如 "35ms" / "1.2s" """
+        if isinstance(value, (int, float)):
+            return float(value)
+        m = re.match(r'^([\d.]+)\s*(ms|s|us|µs)?$', str(value).strip())
+        if not m:
+            return None
+        return float(m.group(1)) * {'ms': 1, 's': 1000, 'us': 0.001, 'µs': 0.001}[m.group(2) or 'ms']
+
+    def describe(self):
+        """一行统计：连接次数、请求数、流量（有 debug 日志时）、RTT"""
+        stats = self.stats
+        parts = [f"连接 {stats['connects']} 次"]
+        # 请求数和流量来自 debug 日志；HYSTERIA_LOG_LEVEL 调高后没有这些行，不输出一串 0
+        if self.debug_seen:
+            parts.append(f"TCP {stats['tcp']}（失败 {stats['tcp_errors']}）")
+            if stats['udp']:
+                parts.append(f"UDP {stats['udp']}")
+            if stats['tx'] or stats['rx']:
+                parts.append(f"↑{stats['tx'] / 1048576:.1f}MB ↓{stats['rx'] / 1048576:.1f}MB")
+        if stats['rtt'] is not None:
+            parts.append(f"RTT {stats['rtt']:.0f}ms")
+        if stats['errors']:
+            parts.append(f"错误 {stats['errors']}")
+        return "，".join(parts)
+
+    @staticmethod
+    def port_open(port):
+        """本地端口是否已在监听"""
+        try:
+            with socket.create_connection(('127.0.0.1', port), timeout=0.2):
+                return True
+        except OSError:
+            return False
+
+    def wait_ready(self, timeout):
+        """
+        等待隧道就绪：SOCKS5/HTTP 端口都在监听且日志出现 "connected to server" 立即返回
+        进程退出时立即失败；超时但端口已监听时视为就绪（旧版本客户端可能不打印连接日志）
+        """
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            if self.process.poll() is not None:
+                # 给读线程一点时间收完最后的输出
+                self.output_event.wait(0.2)
+                return False
+            if (self.connected.is_set()
+                    and self.port_open(self.socks_port) and self.port_open(self.http_port)):
+                return True
+            self.output_event.wait(0.05)
+            self.output_event.clear()
+
+        if self.process.poll() is None and self.port_open(self.socks_port):
+            print(f"⚠️ [{self.name}] 未看到连接日志，端口已监听，继续使用")
+            return True
+        return False
+
+    def alive(self):
+        return self.process is not None and self.process.poll() is None
+
+    def proxies(self):
+        return {
+            'http': f'socks5://127.0.0.1:{self.socks_port}',
+            'https': f'socks5://127.0.0.1:{self.socks_port}'
+        }
+
+    def measure_throughput(self, url):
+        """通过本节点下载测速地址，记录吞吐量（字节/秒）"""
+        try:
+            start = time.time()
+            r = requests.get(url, proxies=self.proxies(), timeout=15)
+            elapsed = time.time() - start
+            if r.status_code == 200 and elapsed > 0:
+                self.throughput = len(r.content) / elapsed
+        except Exception as e:
+            print(f"  ⚠️ [{self.name}] 测速失败: {e}")
+        return self.throughput
+
+    def score(self):
+        """越小越好：握手延迟 + 按吞吐量估算的 1MB 下载时间"""
+        cost = self.latency if self.latency is not None else float('inf')
+        if self.throughput:
+            cost += (1024 * 1024) / self.throughput
+        return cost
+
+    def stop(self):
+        """停止客户端进程"""
+        if self.process:
+            try:
+                os.killpg(os.getpgid(self.process.pid), signal.SIGTERM)
+                self.process.wait(timeout=5)
+            except Exception as e:
+                print(f"⚠️ 停止 Hysteria2 [{self.name}] 时出错: {e}")
+                try:
+                    self.process.kill()
+                except:
+                    pass
 
 
 class Hysteria2Proxy:
-    """Hysteria2 代理管理器"""
+    """
+    Hysteria2 代理管理器
+    - PROXY_HY2 可以是一个或多个节点 URL（换行、空格或分号分隔）
+    - 多个节点时并行启动测速，选最快的；其余按速度排序作为备用
+    - 运行中当前节点进程退出时，在同一组本地端口上切换到下一个节点，浏览器上下文无需重建
+    """
     
     def __init__(self):
-        self.hy2_url = os.environ.get('PROXY_HY2', '').strip()
-        self.process = None
-        self.config_file = '/tmp/hy2_config.yaml'
+        self.urls = [u for u in re.split(r'[\s;]+', os.environ.get('PROXY_HY2', '').strip()) if u]
+        self.hy2_url = self.urls[0] if self.urls else ''
+        self.active = None  # 当前使用的 Hysteria2Client
+        self.backups = []  # 备用节点 URL，按测速结果排序
+        self.socks_port = LOCAL_PROXY_PORT
+        self.http_port = LOCAL_HTTP_PORT
+        self.stopping = False
+        self.lost = threading.Event()  # 当前节点退出且没有可切换的备用节点
+        self.failovers = 0  # 运行中切换备用节点的次数
+        self.restarts = 0  # 运行中在原端口上重启节点的次数
+        self.lock = threading.Lock()
         self.enabled = False
         
-        if self.hy2_url:
-            print("✅ 检测到 Hysteria2 代理配置")
+        if self.urls:
+            print(f"✅ 检测到 Hysteria2 代理配置（{len(self.urls)} 个节点）")
             self.enabled = True
         else:
             print("ℹ️ 未配置 Hysteria2 代理，将直接连接")
     
-    def parse_url(self):
+    def parse_url(self, url=None, socks_port=None, http_port=None):
         """
         解析 Hysteria2 URL
         格式: hysteria2://password@host:port?sni=xxx&alpn=xxx&insecure=1#name
         """
-        if not self.hy2_url:
+        url = url or self.hy2_url
+        if not url:
             return None
         
         try:
             # 移除 hysteria2:// 前缀
-            url = self.hy2_url
             if url.startswith('hysteria2://'):
                 url = url[12:]
             elif url.startswith('hy2://'):
@@ -96,10 +641,10 @@ class Hysteria2Proxy:
                     'insecure': params.get('insecure', ['0'])[0] == '1'
                 },
                 'socks5': {
-                    'listen': f"127.0.0.1:{LOCAL_PROXY_PORT}"
+                    'listen': f"127.0.0.1:{socks_port or LOCAL_PROXY_PORT}"
                 },
                 'http': {
-                    'listen': f"127.0.0.1:{LOCAL_HTTP_PORT}"
+                    'listen': f"127.0.0.1:{http_port or LOCAL_HTTP_PORT}"
                 }
             }
             
@@ -119,366 +664,1677 @@ class Hysteria2Proxy:
         except Exception as e:
             print(f"❌ 解析 Hysteria2 URL 失败: {e}")
             return None
-    
-    def generate_config(self, config):
-        """生成 Hysteria2 配置文件"""
-        import yaml
-        
-        with open(self.config_file, 'w') as f:
-            yaml.dump(config, f, default_flow_style=False)
-        
-        print(f"✅ 已生成配置文件: {self.config_file}")
-        return self.config_file
-    
-    def generate_config_json(self, config):
-        """生成 Hysteria2 JSON 配置文件（备选）"""
-        json_config = {
-            "server": config['server'],
-            "auth": config['auth'],
-            "tls": config['tls'],
-            "socks5": config['socks5'],
-            "http": config['http']
-        }
-        
-        json_file = '/tmp/hy2_config.json'
-        with open(json_file, 'w') as f:
-            json.dump(json_config, f, indent=2)
-        
-        return json_file
-    
+
+    def make_client(self, url, socks_port, http_port):
+        config = self.parse_url(url, socks_port, http_port)
+        return Hysteria2Client(url, config, socks_port, http_port) if config else None
+
     def start(self):
-        """启动 Hysteria2 客户端"""
+        """启动 Hysteria2 客户端（多个节点时先测速选最快）"""
         if not self.enabled:
             return True
-        
-        config = self.parse_url()
-        if not config:
-            print("❌ 无法解析代理配置")
-            return False
-        
-        # 尝试使用 YAML 配置
-        try:
-            import yaml
-            config_file = self.generate_config(config)
-        except ImportError:
-            # 如果没有 PyYAML，使用 JSON
-            print("⚠️ PyYAML 未安装，使用 JSON 配置")
-            config_file = self.generate_config_json(config)
-        
+
         try:
-            # 启动 Hysteria2
             print("🚀 启动 Hysteria2 代理...")
-            
-            self.process = subprocess.Popen(
-                ['hysteria', 'client', '-c', config_file],
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-                preexec_fn=os.setsid
-            )
-            
-            # 等待代理启动
-            time.sleep(3)
-            
-            # 检查进程是否还在运行
-            if self.process.poll() is not None:
-                stdout, stderr = self.process.communicate()
-                print(f"❌ Hysteria2 启动失败")
-                print(f"  stdout: {stdout.decode()}")
-                print(f"  stderr: {stderr.decode()}")
-                return False
-            
-            # 测试代理连接
-            if self.test_proxy():
-                print(f"✅ Hysteria2 代理已启动")
-                print(f"  SOCKS5: 127.0.0.1:{LOCAL_PROXY_PORT}")
-                print(f"  HTTP: 127.0.0.1:{LOCAL_HTTP_PORT}")
-                return True
+            if len(self.urls) == 1:
+                client = self.make_client(self.urls[0], LOCAL_PROXY_PORT, LOCAL_HTTP_PORT)
+                if not client:
+                    print("❌ 无法解析代理配置")
+                    return False
+                if not client.start():
+                    print(f"❌ Hysteria2 启动失败")
+                    for line in list(client.output)[-10:]:
+                        print(f"  {line}")
+                    return False
             else:
-                print("❌ 代理测试失败")
-                self.stop()
-                return False
-                
+                client = self.race()
+                if not client:
+                    print("❌ 所有 Hysteria2 节点都启动失败")
+                    return False
         except FileNotFoundError:
             print("❌ 找不到 hysteria 命令，请确保已安装")
             return False
         except Exception as e:
             print(f"❌ 启动 Hysteria2 失败: {e}")
             return False
-    
-    def test_proxy(self, retries=3):
-        """测试代理是否可用"""
-        for i in range(retries):
+
+        self.use(client)
+        print(f"✅ Hysteria2 代理已启动: {client.name}（{client.latency:.2f}s）")
+        print(f"  SOCKS5: 127.0.0.1:{self.socks_port}")
+        print(f"  HTTP: 127.0.0.1:{self.http_port}")
+
+        # 可选的出口探测，失败只提示，不放弃代理
+        if PROXY_PROBE_URL:
+            self.test_proxy(PROXY_PROBE_URL)
+        return True
+
+    def race(self):
+        """并行启动所有节点测握手延迟（和可选的吞吐量），保留最快的，其余停掉作为备用"""
+        clients = []
+        for i, url in enumerate(self.urls):
+            client = self.make_client(url, LOCAL_PROXY_PORT + 100 + 2 * i, LOCAL_HTTP_PORT + 100 + 2 * i)
+            if client:
+                clients.append(client)
+
+        def probe(client):
             try:
-                proxies = {
-                    'http': f'socks5://127.0.0.1:{LOCAL_PROXY_PORT}',
-                    'https': f'socks5://127.0.0.1:{LOCAL_PROXY_PORT}'
-                }
-                
-                r = requests.get(
-                    'https://api.ipify.org?format=json',
-                    proxies=proxies,
-                    timeout=10
-                )
-                
-                if r.status_code == 200:
-                    ip = r.json().get('ip', 'unknown')
-                    print(f"✅ 代理测试成功，出口 IP: {ip}")
-                    return True
-                    
+                if client.start() and PROXY_SPEED_URL:
+                    client.measure_throughput(PROXY_SPEED_URL)
             except Exception as e:
-                print(f"  代理测试 {i+1}/{retries} 失败: {e}")
-                time.sleep(2)
-        
+                print(f"  ❌ {client.name}: {e}")
+
+        threads = [threading.Thread(target=probe, args=(c,), daemon=True) for c in clients]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        ready = sorted([c for c in clients if c.alive()], key=lambda c: c.score())
+        for c in clients:
+            if c.alive():
+                speed = f"，{c.throughput / 1024:.0f} KB/s" if c.throughput else ""
+                print(f"  🏁 {c.name}: {c.latency:.2f}s{speed}")
+            else:
+                print(f"  ❌ {c.name}: 启动失败")
+        if not ready:
+            return None
+
+        best = ready[0]
+        for c in ready[1:]:
+            c.stop()
+        # 备用顺序：测速成功的在前，失败的在后
+        self.backups = [c.url for c in ready[1:]] + [c.url for c in clients if c not in ready]
+        return best
+
+    def use(self, client):
+        """切换当前节点并开始监控进程"""
+        with self.lock:
+            self.active = client
+            self.hy2_url = client.url
+            self.socks_port = client.socks_port
+            self.http_port = client.http_port
+        self.lost.clear()
+        threading.Thread(target=self.watch, args=(client,), daemon=True).start()
+
+    def watch(self, client):
+        """
+        监控当前节点：进程退出立即恢复；进程还在但日志报连接错误、
+        HY2_RECONNECT_GRACE 秒内没有重连上，视为隧道中断，同样恢复
+        """
+        while True:
+            try:
+                client.process.wait(timeout=1)
+                reason = f"进程已退出（code {client.process.returncode}）"
+            except subprocess.TimeoutExpired:
+                down = client.down_since
+                if self.stopping or client is not self.active:
+                    return
+                if down is None or time.time() - down < HY2_RECONNECT_GRACE:
+                    continue
+                reason = f"隧道中断（{client.stats['last_error']}）"
+                client.stop()
+            if self.stopping or client is not self.active:
+                return
+            print(f"⚠️ Hysteria2 节点 {client.name} {reason}")
+            for line in list(client.output)[-5:]:
+                print(f"  {line}")
+            self.recover(client)
+            return
+
+    def recover(self, dead):
+        """在原端口上重启同一节点（指数退避，最多 HY2_RESTARTS 次），有备用节点时只重试一次就切换"""
+        delay = 0.5
+        for attempt in range(1, HY2_RESTARTS + 1):
+            if self.stopping:
+                return False
+            client = self.make_client(dead.url, self.socks_port, self.http_port)
+            if client and client.start():
+                self.restarts += 1
+                print(f"✅ Hysteria2 节点 {client.name} 已在原端口重启（第 {attempt} 次尝试，{client.latency:.2f}s）")
+                self.use(client)
+                return True
+            if self.backups:
+                break
+            time.sleep(delay)
+            delay *= 2
+        return self.failover()
+
+    def failover(self):
+        """依次尝试备用节点，成功后继续使用原来的本地端口"""
+        while self.backups and not self.stopping:
+            url = self.backups.pop(0)
+            client = self.make_client(url, self.socks_port, self.http_port)
+            if client and client.start():
+                print(f"✅ 已切换到备用节点: {client.name}（{client.latency:.2f}s）")
+                self.failovers += 1
+                self.use(client)
+                return True
+        print("❌ 没有可用的备用节点")
+        self.lost.set()
         return False
+
+    def test_proxy(self, url):
+        """通过代理请求探测地址，打印出口信息（仅提示，不影响是否使用代理）"""
+        try:
+            r = requests.get(url, proxies=self.get_requests_proxies(), timeout=10)
+            try:
+                info = r.json().get('ip', r.text[:64])
+            except ValueError:
+                info = r.text[:64]
+            print(f"✅ 代理探测成功（{r.status_code}），出口: {info}")
+            return True
+        except Exception as e:
+            print(f"⚠️ 代理探测失败（继续使用代理）: {e}")
+            return False
     
     def stop(self):
         """停止 Hysteria2 客户端"""
-        if self.process:
-            try:
-                os.killpg(os.getpgid(self.process.pid), signal.SIGTERM)
-                self.process.wait(timeout=5)
-                print("✅ Hysteria2 已停止")
-            except Exception as e:
-                print(f"⚠️ 停止 Hysteria2 时出错: {e}")
-                try:
-                    self.process.kill()
-                except:
-                    pass
+        self.stopping = True
+        if self.active:
+            self.active.stop()
+            print(f"✅ Hysteria2 已停止（{self.active.name}：{self.active.describe()}"
+                  f"，重启 {self.restarts} 次，切换备用节点 {self.failovers} 次）")
+
+    def restart(self):
+        """常驻模式：节点全部失效后停掉旧进程，重新从全部节点中测速启动"""
+        self.stop()
+        self.stopping = False
+        self.active = None
+        self.backups = []
+        self.enabled = bool(self.urls)
+        if not self.start():
+            self.enabled = False
+            return False
+        return True
     
+    def endpoint(self):
+        """运行历史里记录的代理节点：节点名；配置了代理但启动失败改为直连时为 direct"""
+        if not self.urls:
+            return None
+        if not self.enabled or not self.active:
+            return 'direct'
+        return self.active.name
+
+    def get_requests_proxies(self):
+        """获取 requests 代理配置"""
+        if not self.enabled:
+            return None
+
+        return {
+            'http': f'socks5://127.0.0.1:{self.socks_port}',
+            'https': f'socks5://127.0.0.1:{self.socks_port}'
+        }
+
     def get_playwright_proxy(self):
         """获取 Playwright 代理配置"""
         if not self.enabled:
             return None
         
         return {
-            'server': f'socks5://127.0.0.1:{LOCAL_PROXY_PORT}'
+            'server': f'socks5://127.0.0.1:{self.socks_port}'
         }
 
 
-class Telegram:
-    """Telegram 通知"""
-    
-    def __init__(self, proxy=None):
-        self.token = os.environ.get('TG_BOT_TOKEN')
-        self.chat_id = os.environ.get('TG_CHAT_ID')
-        self.ok = bool(self.token and self.chat_id)
-        self.proxy = proxy
-    
-    def _get_proxies(self):
-        """获取请求代理配置"""
-        if self.proxy and self.proxy.enabled:
-            return {
-                'http': f'socks5://127.0.0.1:{LOCAL_PROXY_PORT}',
-                'https': f'socks5://127.0.0.1:{LOCAL_PROXY_PORT}'
-            }
-        return None
-    
-    def send(self, msg):
-        if not self.ok:
-            return
-        try:
-            requests.post(
-                f"https://api.telegram.org/bot{self.token}/sendMessage",
-                data={"chat_id": self.chat_id, "text": msg, "parse_mode": "HTML"},
-                timeout=30,
-                proxies=self._get_proxies()
-            )
-        except:
-            # 如果代理失败，尝试直连
+class Frame:
+    """一张内存中的截图，上传或落盘时才生成文件名和请求体"""
+
+    def __init__(self, name, data, fmt):
+        self.name = name
+        self.data = data
+        self.format = fmt
+        self.ts = time.time()
+
+    @property
+    def filename(self):
+        return f"{self.name}.{'jpg' if self.format == 'jpeg' else 'png'}"
+
+    def payload(self):
+        """multipart 上传用的 (文件名, 内容, MIME)"""
+        return (self.filename, self.data, f"image/{self.format}")
+
+    def save(self, directory):
+        path = os.path.join(directory, self.filename)
+        with open(path, 'wb') as f:
+            f.write(self.data)
+        return path
+
+
+class ShotBuffer:
+    """
+    截图环形缓冲
+    - 只在内存里保留最近 SHOT_BUFFER 张，不再每步写 1920x1080 PNG 到磁盘
+    - 按 SHOT_FORMAT/SHOT_QUALITY/SHOT_CLIP 截图；SHOT_DIR 非空时额外落盘方便调试
+    """
+
+    def __init__(self, size=SHOT_BUFFER):
+        self.frames = deque(maxlen=size)
+        self.options = {'type': SHOT_FORMAT}
+        if SHOT_FORMAT == 'jpeg':
+            self.options['quality'] = SHOT_QUALITY
+        if SHOT_CLIP:
+            x, y, w, h = (float(v) for v in SHOT_CLIP.split(','))
+            self.options['clip'] = {'x': x, 'y': y, 'width': w, 'height': h}
+
+    def add(self, name, data):
+        """放入一张已截好的图（截图由引擎执行，见 LoginFlow.shot）"""
+        frame = Frame(name, data, SHOT_FORMAT)
+        self.frames.append(frame)
+        if SHOT_DIR:
             try:
-                requests.post(
-                    f"https://api.telegram.org/bot{self.token}/sendMessage",
-                    data={"chat_id": self.chat_id, "text": msg, "parse_mode": "HTML"},
-                    timeout=30
-                )
+                os.makedirs(SHOT_DIR, exist_ok=True)
+                frame.save(SHOT_DIR)
             except:
                 pass
-    
-    def photo(self, path, caption=""):
-        if not self.ok or not os.path.exists(path):
-            return
-        try:
-            with open(path, 'rb') as f:
-                requests.post(
-                    f"https://api.telegram.org/bot{self.token}/sendPhoto",
-                    data={"chat_id": self.chat_id, "caption": caption[:1024]},
-                    files={"photo": f},
-                    timeout=60,
-                    proxies=self._get_proxies()
-                )
-        except:
-            # 如果代理失败，尝试直连
+        return frame
+
+    def last(self, n):
+        return list(self.frames)[-n:]
+
+    def __len__(self):
+        return len(self.frames)
+
+    def __getitem__(self, i):
+        return self.frames[i]
+
+
+class RouteSelector:
+    """
+    按站点选择线路（代理 / 直连）的熔断器
+    - 记住每个站点上次成功的线路，之后先走它
+    - 某条线路连续失败 BREAKER_FAILURES 次后熔断，冷却期内直接跳过，不再白等超时
+    - 冷却到期后后台探测一次（半开），能连上就恢复，否则冷却时间翻倍
+    Telegram 和 SecretUpdater 共用一个，多账号模式下所有账号共享
+    """
+
+    LABELS = {'proxy': "代理", 'direct': "直连"}
+
+    def __init__(self, proxy=None):
+        self.proxy = proxy
+        self.lock = threading.Lock()
+        self.preferred = {}  # 站点 -> 上次成功的线路
+        self.circuits = {}  # (站点, 线路) -> {'failures', 'open_until', 'cooldown', 'probing'}
+
+    def proxies(self, route):
+        return self.proxy.get_requests_proxies() if route == 'proxy' and self.proxy else None
+
+    def routes(self, url, default='proxy'):
+        """
+        本次依次尝试的线路 [(线路, proxies)]：上次成功的在前，没有记录时 default 在前；
+        熔断中的跳过（冷却到期的安排后台探测）；全部熔断时仍尝试第一条
+        """
+        host = urlparse(url).hostname
+        available = ['proxy', 'direct'] if self.proxies('proxy') else ['direct']
+        first = self.preferred.get(host, default)
+        order = sorted(available, key=lambda route: route != first)
+        chosen = []
+        with self.lock:
+            for route in order:
+                circuit = self.circuits.get((host, route))
+                if circuit and circuit['open_until']:
+                    if time.time() >= circuit['open_until'] and not circuit['probing']:
+                        circuit['probing'] = True
+                        threading.Thread(target=self.probe, args=(url, route), daemon=True).start()
+                    continue
+                chosen.append(route)
+        return [(route, self.proxies(route)) for route in chosen or order[:1]]
+
+    def success(self, url, route):
+        host = urlparse(url).hostname
+        with self.lock:
+            self.preferred[host] = route
+            circuit = self.circuits.pop((host, route), None)
+        if circuit and circuit['open_until']:
+            print(f"✅ {host} 的{self.LABELS[route]}线路已恢复")
+
+    def failure(self, url, route, error):
+        host = urlparse(url).hostname
+        with self.lock:
+            if self.preferred.get(host) == route:
+                del self.preferred[host]
+            circuit = self.circuits.setdefault((host, route), {
+                'failures': 0, 'open_until': None, 'cooldown': BREAKER_COOLDOWN, 'probing': False})
+            circuit['failures'] += 1
+            if circuit['open_until'] or circuit['failures'] < BREAKER_FAILURES:
+                return
+            circuit['open_until'] = time.time() + circuit['cooldown']
+        print(f"⚡ {host} 的{self.LABELS[route]}线路熔断 {circuit['cooldown']}s: {str(error)[:120]}")
+
+    def probe(self, url, route):
+        """半开探测：请求站点根路径，有任何 HTTP 响应就算线路通"""
+        parsed = urlparse(url)
+        host = parsed.hostname
+        try:
+            requests.head(f"{parsed.scheme}://{parsed.netloc}/", proxies=self.proxies(route), timeout=5)
+            ok = True
+        except Exception:
+            ok = False
+        with self.lock:
+            circuit = self.circuits.get((host, route))
+            if not circuit:
+                return
+            if ok:
+                del self.circuits[(host, route)]
+            else:
+                circuit['cooldown'] = min(circuit['cooldown'] * 2, 600)
+                circuit['open_until'] = time.time() + circuit['cooldown']
+                circuit['probing'] = False
+        if ok:
+            print(f"✅ {host} 的{self.LABELS[route]}线路探测恢复")
+
+    def request(self, method, url, session=None, default='proxy', **kwargs):
+        """
+        按 routes() 的顺序发请求，返回第一个正常的响应；5xx（如代理返回 502/503）和连接错误一样记为该线路失败，换下一条
+        所有线路都是 5xx 时返回最后一个响应，都出错时抛出最后一个异常
+        """
+        error, last = None, None
+        for route, proxies in self.routes(url, default):
             try:
-                with open(path, 'rb') as f:
-                    requests.post(
-                        f"https://api.telegram.org/bot{self.token}/sendPhoto",
-                        data={"chat_id": self.chat_id, "caption": caption[:1024]},
-                        files={"photo": f},
-                        timeout=60
-                    )
-            except:
-                pass
+                r = (session or requests).request(method, url, proxies=proxies, **kwargs)
+            except requests.RequestException as e:
+                self.failure(url, route, e)
+                error = e
+                continue
+            if r.status_code >= 500:
+                self.failure(url, route, f"HTTP {r.status_code}")
+                last = r
+                continue
+            self.success(url, route)
+            return r
+        if last is not None:
+            return last
+        raise error
+
+
+class Telegram:
+    """
+    Telegram 通知
+    - send/photo 只入队，由后台线程按顺序投递，不阻塞登录流程
+    - 复用一个 keep-alive 的 HTTP 会话
+    - 429 按 retry_after 等待，其它失败指数退避，超过重试次数丢弃
+    - 紧挨着的文本消息合并成一条发送
+    - 代理 / 直连由 RouteSelector 选择，坏掉的线路熔断后不再尝试
+    """
+    
+    def __init__(self, proxy=None, tracer=None):
+        self.token = os.environ.get('TG_BOT_TOKEN')
+        self.chat_id = os.environ.get('TG_CHAT_ID')
+        self.ok = bool(self.token and self.chat_id) and not HAR_REPLAY  # 回放模式不发通知
+        self.proxy = proxy
+        self.session = requests.Session()
+        self.routes = RouteSelector(proxy)
+        self.queue = queue.Queue()
+        self.worker = None
+        self.lock = threading.Lock()
+        self.updates = UpdateConsumer(self)  # /code、/done、/abort 等指令
+        self.tracer = tracer
+    
+    def _get_proxies(self):
+        """获取请求代理配置"""
+        if self.proxy:
+            return self.proxy.get_requests_proxies()
+        return None
+
+    def _enqueue(self, item):
+        with self.lock:
+            if self.worker is None or not self.worker.is_alive():
+                self.worker = threading.Thread(target=self._work, daemon=True)
+                self.worker.start()
+        self.queue.put(item)
     
-    def flush_updates(self):
-        """刷新 offset 到最新，避免读到旧消息"""
+    def send(self, msg):
         if not self.ok:
-            return 0
-        try:
-            r = requests.get(
-                f"https://api.telegram.org/bot{self.token}/getUpdates",
-                params={"timeout": 0},
-                timeout=10,
-                proxies=self._get_proxies()
-            )
-            data = r.json()
-            if data.get("ok") and data.get("result"):
-                return data["result"][-1]["update_id"] + 1
-        except:
-            pass
-        return 0
+            return
+        self._enqueue(('text', msg))
+    
+    def photo(self, shot, caption=""):
+        """shot: 内存截图 Frame 或图片路径"""
+        if not self.ok or not shot:
+            return
+        if not isinstance(shot, Frame) and not os.path.exists(shot):
+            return
+        self._enqueue(('photo', shot, caption))
+
+    def media_group(self, shots, caption=""):
+        """多张截图合成一次 sendMediaGroup 上传（只有一张时退回 sendPhoto）"""
+        shots = [s for s in shots if s][:10]
+        if not self.ok or not shots:
+            return
+        if len(shots) == 1:
+            return self.photo(shots[0], caption)
+        self._enqueue(('album', shots, caption))
+
+    def flush(self, timeout=TG_FLUSH_TIMEOUT):
+        """等待队列里的消息发完（最多 timeout 秒）"""
+        if not self.ok or self.worker is None:
+            return True
+        done = threading.Event()
+        self._enqueue(('flush', done))
+        return done.wait(timeout)
+
+    def _work(self):
+        """后台投递线程"""
+        pending = []
+        while True:
+            item = pending.pop(0) if pending else self.queue.get()
+            kind = item[0]
+            if kind == 'text':
+                texts = [item[1]]
+                # 合并紧接着的文本（同一步骤的多条提示合成一条）
+                while True:
+                    try:
+                        nxt = self.queue.get(timeout=TG_COALESCE_WINDOW)
+                    except queue.Empty:
+                        break
+                    if nxt[0] == 'text' and len("\n\n".join(texts + [nxt[1]])) <= 4096:
+                        texts.append(nxt[1])
+                    else:
+                        pending.append(nxt)
+                        break
+                self._deliver('sendMessage', {"chat_id": self.chat_id, "text": "\n\n".join(texts), "parse_mode": "HTML"})
+            elif kind == 'photo':
+                _, shot, caption = item
+                self._deliver('sendPhoto', {"chat_id": self.chat_id, "caption": caption[:1024]}, {"photo": shot})
+            elif kind == 'album':
+                _, shots, caption = item
+                media = [{"type": "photo", "media": f"attach://p{i}"} for i in range(len(shots))]
+                media[0]["caption"] = caption[:1024]
+                self._deliver('sendMediaGroup', {"chat_id": self.chat_id, "media": json.dumps(media)},
+                              {f"p{i}": s for i, s in enumerate(shots)})
+            elif kind == 'flush':
+                item[1].set()
+
+    @traced('telegram')
+    def _deliver(self, method, data, files=None):
+        """
+        带重试预算的投递：按 RouteSelector 选线路（默认先代理），失败换另一条，一轮都失败后退避重试，最多 TG_RETRIES 轮
+        - 连接错误、5xx 和其它异常都记到该线路上（连续失败会熔断），然后重试
+        - 429 按 retry_after 等待；其它 4xx 重试也没用，直接放弃
+        """
+        url = f"{TG_API_BASE}/bot{self.token}/{method}"
+        delay = 1
+        for attempt in range(TG_RETRIES):
+            for route, proxies in self.routes.routes(url):
+                opened = []
+                try:
+                    payload = {}
+                    for k, v in (files or {}).items():
+                        if isinstance(v, Frame):
+                            payload[k] = v.payload()
+                        else:
+                            opened.append(open(v, 'rb'))
+                            payload[k] = opened[-1]
+                except OSError as e:
+                    for f in opened:
+                        f.close()
+                    print(f"⚠️ Telegram {method} 读取图片失败: {e}")
+                    return False
+                try:
+                    r = self.session.post(url, data=data, files=payload or None,
+                                          timeout=(5, 30), proxies=proxies)
+                except Exception as e:
+                    self.routes.failure(url, route, e)
+                    continue
+                finally:
+                    for f in opened:
+                        f.close()
+                if r.status_code >= 500:
+                    self.routes.failure(url, route, f"HTTP {r.status_code}")
+                    continue
+                self.routes.success(url, route)
+                if r.status_code == 429:
+                    try:
+                        delay = r.json().get('parameters', {}).get('retry_after', delay)
+                    except ValueError:
+                        pass
+                    break
+                return r.ok
+            if attempt < TG_RETRIES - 1:
+                time.sleep(delay)
+                delay = min(delay * 2, 30)
+        print(f"⚠️ Telegram {method} 发送失败，已放弃")
+        return False
     
-    def wait_code(self, timeout=120):
+    def listen(self, pattern, account=None):
         """
-        等待你在 TG 里发 /code 123456
-        只接受来自 TG_CHAT_ID 的消息
+        注册一个消息等待方，只接收匹配 pattern 的消息（未配置 Telegram 时返回 None）
+        account: 多账号模式下的账号名，指令里写了账号名（如 /code alice 123456）时只交给该账号
         """
         if not self.ok:
             return None
-        
-        # 先刷新 offset，避免读到旧的 /code
-        offset = self.flush_updates()
-        deadline = time.time() + timeout
-        pattern = re.compile(r"^/code\s+(\d{6,8})$")  # 6位TOTP 或 8位恢复码也行
-        
-        while time.time() < deadline:
+        return self.updates.register(pattern, account)
+
+    def unlisten(self, waiter):
+        if waiter:
+            self.updates.unregister(waiter)
+
+
+class UpdateWaiter:
+    """一个消息等待方：收到匹配的消息放进自己的队列"""
+
+    def __init__(self, pattern, account=None):
+        self.regex = re.compile(pattern)
+        self.account = (account or '').lower()
+        self.queue = queue.Queue()
+        self.callbacks = []  # 收到消息时调用（在消费者线程里），asyncio 引擎借此唤醒事件循环
+
+    def put(self, match):
+        self.queue.put(match)
+        for callback in list(self.callbacks):
+            callback()
+
+    def get(self, timeout=None):
+        """等待下一条匹配的消息，返回 re.Match，超时返回 None"""
+        try:
+            return self.queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def poll(self):
+        return self.get(timeout=0.001) if self.pending() else None
+
+    def pending(self):
+        return not self.queue.empty()
+
+
+class UpdateConsumer:
+    """
+    Telegram 消息消费者
+    - 有等待方时一个后台线程持续 getUpdates 长轮询，消息一到立即返回，没有额外 sleep
+    - 只处理来自 TG_CHAT_ID 的消息，每条只交给一个等待方：
+      指令第一个参数是账号名时（/code alice 123456、/abort alice）去掉账号名后交给该账号，
+      否则交给最早注册、正则匹配的等待方，多个账号同时等待时不会一起收下同一条 /code
+    - 最后一个等待方注销后线程退出；重新启动时跳过期间的旧消息
+    """
+
+    def __init__(self, tg):
+        self.tg = tg
+        self.session = requests.Session()  # 长轮询单独一个连接，不占用发送会话
+        self.waiters = []
+        self.thread = None
+        self.offset = None
+        self.lock = threading.Lock()
+
+    def register(self, pattern, account=None):
+        waiter = UpdateWaiter(pattern, account)
+        with self.lock:
+            self.waiters.append(waiter)
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._run, daemon=True)
+                self.thread.start()
+        return waiter
+
+    def unregister(self, waiter):
+        with self.lock:
+            if waiter in self.waiters:
+                self.waiters.remove(waiter)
+
+    def _get_updates(self, timeout):
+        r = self.tg.routes.request(
+            'GET', f"{TG_API_BASE}/bot{self.tg.token}/getUpdates", session=self.session,
+            params={"timeout": timeout, "offset": self.offset, "allowed_updates": '["message"]'},
+            timeout=timeout + 10
+        )
+        data = r.json()
+        return data.get("result", []) if data.get("ok") else None
+
+    def _run(self):
+        # 先跳到最新 offset，避免读到启动前的旧 /code
+        self.offset = None
+        try:
+            result = self._get_updates(0) or []
+            if result:
+                self.offset = result[-1]["update_id"] + 1
+        except Exception:
+            pass
+
+        while True:
+            with self.lock:
+                if not self.waiters:
+                    self.thread = None
+                    return
             try:
-                r = requests.get(
-                    f"https://api.telegram.org/bot{self.token}/getUpdates",
-                    params={"timeout": 20, "offset": offset},
-                    timeout=30,
-                    proxies=self._get_proxies()
-                )
-                data = r.json()
-                if not data.get("ok"):
-                    time.sleep(2)
-                    continue
-                
-                for upd in data.get("result", []):
-                    offset = upd["update_id"] + 1
-                    msg = upd.get("message") or {}
-                    chat = msg.get("chat") or {}
-                    if str(chat.get("id")) != str(self.chat_id):
-                        continue
-                    
-                    text = (msg.get("text") or "").strip()
-                    m = pattern.match(text)
-                    if m:
-                        return m.group(1)
-            
+                result = self._get_updates(TG_POLL_TIMEOUT)
             except Exception:
-                pass
-            
-            time.sleep(2)
-        
-        return None
+                # 两条线路都出错（RouteSelector 已记下失败），短暂退避
+                time.sleep(1)
+                continue
+            if result is None:
+                time.sleep(1)
+                continue
+            for upd in result:
+                self.offset = upd["update_id"] + 1
+                self.dispatch(upd.get("message") or {})
+
+    def dispatch(self, msg):
+        chat = msg.get("chat") or {}
+        if str(chat.get("id")) != str(self.tg.chat_id):
+            return
+        text = (msg.get("text") or "").strip()
+        with self.lock:
+            waiters = list(self.waiters)
+        # /cmd <账号> [参数]：只交给该账号，正则匹配去掉账号名后的指令
+        named = re.match(r'^(/\w+)\s+@?(\S+)(.*)$', text)
+        if named and named.group(2).lower() in {w.account for w in waiters if w.account}:
+            account = named.group(2).lower()
+            waiters = [w for w in waiters if w.account == account]
+            text = named.group(1) + named.group(3)
+        for waiter in waiters:
+            m = waiter.regex.match(text)
+            if m:
+                waiter.put(m)
+                return
 
 
 class SecretUpdater:
-    """GitHub Secret 更新器"""
+    """
+    GitHub Secret 更新器
+    - 一次运行只获取一次仓库公钥，所有请求复用同一个连接池
+    - update_many() 以 SECRET_CONCURRENCY 并发批量写入
+    - 内容指纹与上次写入（或账号启动时读到的当前值，见 baseline()）相同则跳过，节省 API 配额
+    - 默认直连；与 Telegram 共用 RouteSelector 时，直连坏了自动改走代理并熔断
+    """
     
-    def __init__(self):
+    def __init__(self, routes=None):
         self.token = os.environ.get('REPO_TOKEN')
         self.repo = os.environ.get('GITHUB_REPOSITORY')
-        self.ok = bool(self.token and self.repo)
+        self.ok = bool(self.token and self.repo) and not HAR_REPLAY  # 回放得到的 Cookie 是脱敏占位符，不能写回
+        self.session = requests.Session()
+        self.session.headers.update({
+            "Authorization": f"token {self.token}",
+            "Accept": "application/vnd.github.v3+json"
+        })
+        self.routes = routes or RouteSelector()
+        self.key = None  # (key_id, SealedBox)
+        self.written = {}  # Secret 名 -> 本次运行写入内容的指纹
+        self.loaded = {}  # Secret 名 -> 启动时读到的当前值的指纹
+        self.lock = threading.Lock()
         if self.ok:
             print("✅ Secret 自动更新已启用")
+        elif HAR_REPLAY:
+            print("ℹ️ HAR 回放模式，不写入 Secret")
         else:
             print("⚠️ Secret 自动更新未启用（需要 REPO_TOKEN）")
-    
-    def update(self, name, value):
+
+    @staticmethod
+    def fingerprint(value):
+        return hashlib.sha256(value.encode()).hexdigest()
+
+    def baseline(self, loaded):
+        """
+        记下账号启动时实际读到的 Secret {名称: 内容}（多账号时名称带后缀，如 GH_SESSION_ALICE），
+        之后写入同样的内容就跳过；空值表示 Secret 不存在，不记录
+        """
+        with self.lock:
+            for name, value in loaded.items():
+                if value and value.strip():
+                    self.loaded.setdefault(name, self.fingerprint(value.strip()))
+
+    def unchanged(self, name, value):
+        """与上次写入的内容相同；本次还没写过时，与启动时读到的值比较"""
+        fp = self.fingerprint(value)
+        with self.lock:
+            if name in self.written:
+                return self.written[name] == fp
+            return self.loaded.get(name) == fp
+
+    def public_key(self):
+        with self.lock:
+            if self.key is None:
+                encoding, public = timed_import('nacl.encoding'), timed_import('nacl.public')
+                r = self.routes.request('GET', f"{GITHUB_API_URL}/repos/{self.repo}/actions/secrets/public-key",
+                                        session=self.session, default='direct', timeout=30)
+                if r.status_code != 200:
+                    raise RuntimeError(f"获取公钥失败: HTTP {r.status_code}")
+                data = r.json()
+                pk = public.PublicKey(data['key'].encode(), encoding.Base64Encoder())
+                self.key = (data['key_id'], public.SealedBox(pk))
+            return self.key
+
+    def write(self, name, value):
+        """写入一个 Secret，返回 'saved' / 'unchanged' / 'failed' / 'disabled'"""
         if not self.ok:
-            return False
+            return 'disabled'
+        if self.unchanged(name, value):
+            return 'unchanged'
         try:
-            from nacl import encoding, public
-            
-            headers = {
-                "Authorization": f"token {self.token}",
-                "Accept": "application/vnd.github.v3+json"
-            }
-            
-            # 获取公钥
-            r = requests.get(
-                f"https://api.github.com/repos/{self.repo}/actions/secrets/public-key",
-                headers=headers, timeout=30
-            )
-            if r.status_code != 200:
-                return False
-            
-            key_data = r.json()
-            pk = public.PublicKey(key_data['key'].encode(), encoding.Base64Encoder())
-            encrypted = public.SealedBox(pk).encrypt(value.encode())
-            
-            # 更新 Secret
-            r = requests.put(
-                f"https://api.github.com/repos/{self.repo}/actions/secrets/{name}",
-                headers=headers,
-                json={"encrypted_value": base64.b64encode(encrypted).decode(), "key_id": key_data['key_id']},
+            key_id, box = self.public_key()
+            encrypted = box.encrypt(value.encode())
+            r = self.routes.request(
+                'PUT', f"{GITHUB_API_URL}/repos/{self.repo}/actions/secrets/{name}", session=self.session,
+                default='direct', json={"encrypted_value": base64.b64encode(encrypted).decode(), "key_id": key_id},
                 timeout=30
             )
-            return r.status_code in [201, 204]
         except Exception as e:
-            print(f"更新 Secret 失败: {e}")
-            return False
+            print(f"更新 Secret {name} 失败: {e}")
+            return 'failed'
+        if r.status_code not in [201, 204]:
+            print(f"更新 Secret {name} 失败: HTTP {r.status_code}")
+            return 'failed'
+        with self.lock:
+            self.written[name] = self.fingerprint(value)
+        return 'saved'
+
+    def update(self, name, value):
+        """写入一个 Secret，已写入或内容未变返回 True"""
+        return self.write(name, value) in ('saved', 'unchanged')
+
+    def update_many(self, secrets):
+        """批量写入 {名称: 内容}，返回 {名称: 状态}"""
+        if not secrets:
+            return {}
+        if not self.ok:
+            return {name: 'disabled' for name in secrets}
+        with ThreadPoolExecutor(max_workers=min(SECRET_CONCURRENCY, len(secrets))) as pool:
+            return dict(zip(secrets, pool.map(lambda item: self.write(*item), secrets.items())))
 
 
-class AutoLogin:
-    """自动登录"""
-    
+class HttpFastPath:
+    """
+    免浏览器快速路径
+    - 用普通 HTTP 会话验证 GH_SESSION 是否仍然有效
+    - 跟随 GitHub OAuth authorize 重定向链（之前已授权时不需要点击）
+    - 直接请求控制台页面保活
+    遇到密码、设备验证、两步验证、Authorize 按钮或需要前端 JS 才能完成的回调时返回 None，
+    由调用方回退到 Playwright 流程
+    """
+
+    AUTHORIZE_RE = re.compile(r'https://github\.com/login/oauth/authorize[^"\'\s<>]+')
+
+    def __init__(self, bot):
+        self.bot = bot
+        self.session = requests.Session()
+        self.session.headers['User-Agent'] = USER_AGENT
+        self.session.proxies = bot.proxy.get_requests_proxies() or {}
+
+    def find_authorize_url(self):
+        """优先用 CLAW_OAUTH_URL，否则从登录页 HTML 中查找授权链接"""
+        if CLAW_OAUTH_URL:
+            return CLAW_OAUTH_URL
+        r = self.session.get(self.bot.signin_url(), timeout=15)
+        m = self.AUTHORIZE_RE.search(html.unescape(r.text))
+        return m.group(0) if m else None
+
+    def run(self):
+        """成功返回最新的 user_session（可能未变化），需要浏览器时返回 None"""
+        bot = self.bot
+        if not bot.gh_session:
+            bot.log("快速路径: 没有 Session，跳过", "INFO")
+            return None
+
+        self.session.cookies.set('user_session', bot.gh_session, domain='github.com', path='/')
+        self.session.cookies.set('logged_in', 'yes', domain='github.com', path='/')
+
+        # 1. Session 是否有效（失效会被重定向到 /login）
+        r = self.session.get('https://github.com/settings/profile', allow_redirects=False, timeout=15)
+        if r.status_code != 200:
+            bot.log(f"快速路径: Session 已失效（{r.status_code}）", "INFO")
+            return None
+        bot.log("快速路径: Session 有效", "SUCCESS")
+
+        # 2. 跟随 OAuth 重定向链
+        authorize_url = self.find_authorize_url()
+        if not authorize_url:
+            bot.log("快速路径: 登录页没有授权地址（需要前端渲染）", "INFO")
+            return None
+
+        r = self.session.get(authorize_url, timeout=30)
+        final = r.url
+        bot.log(f"快速路径: {len(r.history)} 次跳转后到达 {final}")
+        if 'github.com' in urlparse(final).netloc:
+            # 停在 GitHub：需要登录、设备验证、两步验证或点击 Authorize
+            bot.log("快速路径: GitHub 需要交互操作", "INFO")
+            return None
+        if not bot.is_console(final) or 'code' in parse_qs(urlparse(final).query):
+            # 回调里的 code 没被服务端消费，说明换取登录态要靠前端 JS
+            bot.log("快速路径: 回调需要浏览器完成", "INFO")
+            return None
+
+        # 3. 保活
+        bot.detect_region(final)
+        targets = bot.keepalive_targets()
+        with ThreadPoolExecutor(max_workers=min(KEEPALIVE_CONCURRENCY, len(targets))) as pool:
+            results = list(pool.map(lambda target: self.visit(*target), targets))
+        failed = [result for result in results if not result['ok']]
+        if failed:
+            # 不计入保活结果：回退的浏览器流程会重新访问并记录，通知里每个地址只出现一次
+            bot.log(f"快速路径: 保活未全部成功（{'、'.join(r['name'] for r in failed)}）", "INFO")
+            return None
+        bot.report_keepalive(results)
+
+        # GitHub 可能轮换了 user_session
+        return self.session.cookies.get('user_session', domain='github.com') or bot.gh_session
+
+    def visit(self, name, url, api):
+        start = time.time()
+        try:
+            r = self.session.get(url, timeout=30, allow_redirects=not api)
+        except Exception as e:
+            return self.bot.keepalive_result(name, url, api, None, start, error=e)
+        return self.bot.keepalive_result(name, url, api, r.status_code, start, final=None if api else r.url)
+
+
+class ResourcePolicy:
+    """
+    请求拦截策略（context.route）
+    - 按域名（或 域名/路径前缀）配置要丢弃的资源类型（ROUTE_POLICY，默认所有站点丢弃图片/字体/媒体）
+    - 丢弃统计上报和第三方跟踪请求（BLOCK_HOSTS）
+    - 人机验证相关域名（ALLOW_HOSTS）始终放行；脚本、样式、XHR 默认都放行，保证登录和 OAuth 正常
+    - 统计拦截的请求数，并按同类型已下载资源的平均大小估算节省的流量
+    """
+
+    # 没见过同类型响应时用的估算大小（字节）
+    DEFAULT_SIZES = {'image': 30 * 1024, 'font': 40 * 1024, 'media': 200 * 1024}
+
     def __init__(self):
-        self.username = os.environ.get('GH_USERNAME')
-        self.password = os.environ.get('GH_PASSWORD')
-        self.gh_session = os.environ.get('GH_SESSION', '').strip()
-        
+        self.policy = ROUTE_POLICY
+        self.blocked = {}  # 拦截原因 -> 个数
+        self.blocked_types = {}  # 资源类型 -> 拦截个数
+        self.loaded = {}  # 资源类型 -> [个数, 字节]
+
+    @staticmethod
+    def match(rules, host, path):
+        """规则为域名后缀，或 域名/路径前缀"""
+        for rule in rules:
+            rule_host, _, rule_path = rule.partition('/')
+            if (host == rule_host or host.endswith('.' + rule_host)) and path.lstrip('/').startswith(rule_path):
+                return True
+        return False
+
+    def verdict(self, url, resource_type):
+        """返回拦截原因，放行返回 None"""
+        parsed = urlparse(url)
+        if parsed.scheme not in ('http', 'https'):
+            return None
+        host, path = parsed.hostname or '', parsed.path
+        if self.match(ALLOW_HOSTS, host, path):
+            return None
+        if self.match(BLOCK_HOSTS, host, path):
+            return 'tracker'
+        # 最长匹配的规则（域名或 域名/路径前缀）优先，其次是 "*"
+        rule = max((h for h in self.policy if h != '*' and self.match([h], host, path)), key=len, default='*')
+        if resource_type in self.policy.get(rule, []):
+            return resource_type
+        return None
+
+    def attach(self, context):
+        """返回 context.route() 的结果：asyncio 引擎里是协程，由调用方 await"""
+        context.on("response", self.on_response)
+        return context.route("**/*", self.handle)
+
+    def check(self, request):
+        """判定并计数，返回拦截原因（放行返回 None）"""
+        reason = self.verdict(request.url, request.resource_type)
+        if reason:
+            self.blocked[reason] = self.blocked.get(reason, 0) + 1
+            self.blocked_types[request.resource_type] = self.blocked_types.get(request.resource_type, 0) + 1
+        return reason
+
+    def handle(self, route):
+        """两种引擎共用：async_api 里 route 方法返回协程，Playwright 会 await 处理器的返回值"""
+        if not self.check(route.request):
+            return route.fallback()  # 交给后注册的路由处理器（没有则正常发出）
+        return route.abort('blockedbyclient')
+
+    def on_response(self, response):
+        try:
+            size = int(response.headers.get('content-length', 0))
+        except ValueError:
+            size = 0
+        stat = self.loaded.setdefault(response.request.resource_type, [0, 0])
+        stat[0] += 1
+        stat[1] += size
+
+    def saved_bytes(self):
+        total = 0
+        for resource_type, count in self.blocked_types.items():
+            n, size = self.loaded.get(resource_type, [0, 0])
+            avg = size / n if n and size else self.DEFAULT_SIZES.get(resource_type, 5 * 1024)
+            total += count * avg
+        return total
+
+    def report(self, log):
+        if not self.blocked:
+            return
+        blocked = sum(self.blocked.values())
+        loaded = sum(n for n, _ in self.loaded.values())
+        loaded_bytes = sum(b for _, b in self.loaded.values())
+        detail = "，".join(f"{k} {v}" for k, v in sorted(self.blocked.items()))
+        log(f"资源拦截: {blocked} 个请求（{detail}），约节省 {self.saved_bytes() / 1024:.0f} KB；"
+            f"实际加载 {loaded} 个请求 {loaded_bytes / 1024:.0f} KB", "INFO")
+
+
+class BrowserProfile:
+    """
+    持久化浏览器配置目录（BROWSER_PROFILE_DIR）
+    - 配合 launch_persistent_context 复用磁盘缓存、HSTS、Cookie 和 localStorage
+    - 正常关闭后写入标记文件；启动时没有标记（上次异常退出）或关键 JSON 损坏就整个丢弃重建
+    - 清理 Chromium 崩溃后残留的 Singleton* 锁，否则无法启动
+    """
+
+    MARKER = '.claw-profile.json'
+    JSON_FILES = ('Local State', os.path.join('Default', 'Preferences'))
+    LOCKS = ('SingletonLock', 'SingletonSocket', 'SingletonCookie')
+
+    def __init__(self, path):
+        self.path = os.path.abspath(os.path.expanduser(path))
+        self.info = {}
+
+    @classmethod
+    def open(cls, path):
+        """目录不存在、为空或是之前的配置目录时返回 BrowserProfile；其它非空目录不碰，返回 None"""
+        profile = cls(path)
+        if os.path.isdir(profile.path) and os.listdir(profile.path) and not profile.owned():
+            print(f"⚠️ {profile.path} 不是浏览器配置目录，不使用持久化配置")
+            return None
+        return profile
+
+    def owned(self):
+        return any(os.path.exists(os.path.join(self.path, n)) for n in (self.MARKER, 'Local State', 'Default'))
+
+    def prepare(self):
+        """检查并准备目录，返回 'warm'（复用）或 'cold'（新建或已丢弃）"""
+        if os.path.isdir(self.path) and os.listdir(self.path):
+            problem = self.check()
+            if not problem:
+                self.clear_locks()
+                # 运行期间去掉标记，正常关闭后再写回
+                os.remove(os.path.join(self.path, self.MARKER))
+                return 'warm'
+            print(f"⚠️ 浏览器配置不可用（{problem}），丢弃重建")
+            shutil.rmtree(self.path, ignore_errors=True)
+        os.makedirs(self.path, exist_ok=True)
+        self.info = {'created': time.time(), 'runs': 0}
+        return 'cold'
+
+    def check(self):
+        """返回问题描述，完好时返回 None"""
+        try:
+            with open(os.path.join(self.path, self.MARKER)) as f:
+                self.info = json.load(f)
+        except FileNotFoundError:
+            return "上次未正常关闭"
+        except Exception:
+            return "标记文件损坏"
+        for name in self.JSON_FILES:
+            path = os.path.join(self.path, name)
+            if not os.path.exists(path):
+                continue
+            try:
+                with open(path, encoding='utf-8') as f:
+                    json.load(f)
+            except Exception:
+                return f"{name} 损坏"
+        return None
+
+    def clear_locks(self):
+        for name in self.LOCKS:
+            path = os.path.join(self.path, name)
+            if os.path.lexists(path):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+    def mark_clean(self):
+        """浏览器正常关闭后调用"""
+        self.info['runs'] = self.info.get('runs', 0) + 1
+        self.info['last_used'] = time.time()
+        try:
+            with open(os.path.join(self.path, self.MARKER), 'w') as f:
+                json.dump(self.info, f)
+        except Exception as e:
+            print(f"⚠️ 写入浏览器配置标记失败: {e}")
+
+
+class HarArchive:
+    """
+    HAR 录制脱敏与回放（HAR_RECORD / HAR_REPLAY）
+    - 脱敏：表单里的密码 / 验证码 / token、URL 里的 OAuth code、Cookie、Authorization 换成按名字固定的占位符，
+      同一个值在整个文件里（含响应正文、重定向地址）一起替换，回放时前后仍然对得上
+    - 回放：route_from_har 按 URL + 方法 + POST 正文应答；实时请求的表单正文先按同样规则脱敏再去匹配，
+      所以回放不需要真实密码，验证码每次不同也能命中
+    """
+
+    SENSITIVE = re.compile(r'pass|otp|token|secret|code', re.I)  # 表单字段名 / 查询参数名
+    MIN_LENGTH = 8  # 按字段名识别的值，短于此（如 6 位验证码）只在表单里替换，不做全文替换
+    COOKIE_MIN_LENGTH = 16  # Cookie 只替换像凭据的长值，区域、用户名之类的短值保留
+
+    def __init__(self, path):
+        self.path = path
+
+    @staticmethod
+    def placeholder(name):
+        return f"REDACTED_{re.sub(r'[^0-9A-Za-z]+', '_', name).strip('_').upper()}"
+
+    @classmethod
+    def redact_form(cls, body, content_type):
+        """表单正文里的敏感字段换成占位符；不是表单或没有敏感字段返回 None"""
+        if not body or 'application/x-www-form-urlencoded' not in (content_type or ''):
+            return None
+        fields = parse_qsl(body, keep_blank_values=True)
+        if not any(cls.SENSITIVE.search(k) for k, _ in fields):
+            return None
+        return urlencode([(k, cls.placeholder(k) if cls.SENSITIVE.search(k) else v) for k, v in fields])
+
+    def redact(self, known=None):
+        """
+        原地脱敏录制好的 HAR，返回替换掉的不同值个数
+        known: {值: 名字}，额外要替换的已知凭据（密码、GH_SESSION），占位符与同名字段一致
+        """
+        with open(self.path, encoding='utf-8') as f:
+            har = json.load(f)
+        secrets = {}  # 原值 -> 占位符
+
+        def remember(name, value, min_length=self.MIN_LENGTH):
+            if value and len(value) >= min_length and not value.startswith('REDACTED_'):
+                secrets.setdefault(value, self.placeholder(name))
+
+        for value, name in (known or {}).items():
+            remember(name, value)
+        for entry in har['log']['entries']:
+            request, response = entry['request'], entry['response']
+            for url in (request['url'], response.get('redirectURL', '')):
+                for k, v in parse_qsl(urlparse(url).query):
+                    if self.SENSITIVE.search(k):
+                        remember(k, v)
+            for cookie in request.get('cookies', []) + response.get('cookies', []):
+                remember(f"cookie_{cookie['name']}", cookie.get('value'), self.COOKIE_MIN_LENGTH)
+            for header in request['headers'] + response['headers']:
+                name = header['name'].lower()
+                if name in ('authorization', 'proxy-authorization'):
+                    header['value'] = 'REDACTED'
+                elif name in ('cookie', 'set-cookie'):
+                    pairs = (header['value'].split(';') if name == 'cookie'
+                             else [line.split(';')[0] for line in header['value'].split('\n')])
+                    for pair in pairs:
+                        k, _, v = pair.strip().partition('=')
+                        remember(f"cookie_{k}", v, self.COOKIE_MIN_LENGTH)
+            post = request.get('postData')
+            if post:
+                redacted = self.redact_form(post.get('text'), post.get('mimeType'))
+                if redacted is not None:
+                    for k, v in parse_qsl(post['text'], keep_blank_values=True):
+                        if self.SENSITIVE.search(k):
+                            remember(k, v)
+                    post['text'] = redacted
+                    post['params'] = [{'name': k, 'value': v} for k, v in parse_qsl(redacted, keep_blank_values=True)]
+
+        # 长的先换，避免一个值是另一个值的一部分时只换掉一半
+        text = json.dumps(har, ensure_ascii=False)
+        for value in sorted(secrets, key=len, reverse=True):
+            for form in {json.dumps(value, ensure_ascii=False)[1:-1], quote_plus(value), quote(value, safe='')}:
+                text = text.replace(form, secrets[value])
+        with open(self.path, 'w', encoding='utf-8') as f:
+            f.write(text)
+        return len(secrets)
+
+    def entry_url(self):
+        """回放时的登录入口：录制里第一个 claw.cloud 请求所在的站点"""
+        with open(self.path, encoding='utf-8') as f:
+            entries = json.load(f)['log']['entries']
+        for entry in entries:
+            parsed = urlparse(entry['request']['url'])
+            if (parsed.hostname or '').endswith('claw.cloud'):
+                return f"{parsed.scheme}://{parsed.netloc}"
+        return None
+
+    def live_form(self, request):
+        try:
+            return self.redact_form(request.post_data, request.headers.get('content-type'))
+        except Exception:
+            return None
+
+    def handle(self, route):
+        """回放时注册在 route_from_har 之后（先执行）：表单正文脱敏后交给它匹配；两种引擎共用，同 ResourcePolicy.handle"""
+        return route.fallback(post_data=self.live_form(route.request))
+
+
+class Totp:
+    """
+    RFC 6238 TOTP（HMAC-SHA1、30 秒、6 位，与 GitHub 一致）
+    - 用服务器 Date 头校准本机时钟偏差（所有账号共用一次）
+    - 当前窗口快过期时等到下一个窗口，避免填进去就失效
+    """
+
+    offset = None  # 服务器时间 - 本机时间（秒）
+    lock = threading.Lock()
+
+    def __init__(self, secret, digits=6, period=30):
+        key = re.sub(r'[\s-]', '', secret).upper()
+        self.key = base64.b32decode(key + '=' * (-len(key) % 8))
+        self.digits = digits
+        self.period = period
+
+    def at(self, t):
+        counter = struct.pack('>Q', int(t // self.period))
+        mac = hmac.new(self.key, counter, hashlib.sha1).digest()
+        i = mac[-1] & 0x0F
+        value = struct.unpack('>I', mac[i:i + 4])[0] & 0x7FFFFFFF
+        return str(value % 10 ** self.digits).zfill(self.digits)
+
+    @classmethod
+    def sync_clock(cls, proxies=None):
+        """对比 TOTP_TIME_URL 的 Date 头得到时钟偏差；Date 只精确到秒，偏差不足 1 秒时不修正"""
+        with cls.lock:
+            if cls.offset is not None:
+                return cls.offset
+            cls.offset = 0.0
+            try:
+                sent = time.time()
+                r = requests.head(TOTP_TIME_URL, timeout=10, proxies=proxies, allow_redirects=False)
+                received = time.time()
+                server = timed_import('email.utils').parsedate_to_datetime(r.headers['Date']).timestamp() + 0.5
+                offset = server - (sent + received) / 2
+                if abs(offset) >= 1:
+                    cls.offset = offset
+                    print(f"⚠️ 本机时钟偏差 {offset:+.1f}s，TOTP 已按服务器时间计算")
+            except Exception as e:
+                print(f"⚠️ 获取服务器时间失败，TOTP 使用本机时钟: {e}")
+            return cls.offset
+
+    def now(self, min_remaining=TOTP_MIN_REMAINING):
+        """当前窗口的验证码；剩余时间不足 min_remaining 秒时等到下一个窗口"""
+        t = time.time() + (self.offset or 0)
+        remaining = self.period - t % self.period
+        if remaining < min_remaining:
+            time.sleep(remaining + 0.1)
+            t = time.time() + (self.offset or 0)
+        return self.at(t)
+
+
+class RegionProbe:
+    """
+    通过当前代理测量 CLAW_REGIONS 各区域登录页的响应延迟（所有账号共用一次）
+    """
+
+    results = None  # [(区域, 毫秒)]，按延迟排序，超时的为 None 排在最后
+    lock = threading.Lock()
+
+    @staticmethod
+    def measure(region, proxies=None):
+        try:
+            start = time.time()
+            requests.head(f"https://{region}.run.claw.cloud/signin", timeout=5, proxies=proxies, allow_redirects=False)
+            return (time.time() - start) * 1000
+        except:
+            return None
+
+    @classmethod
+    def run(cls, proxies=None):
+        with cls.lock:
+            if cls.results is None:
+                cls.results = []
+                if CLAW_REGIONS:
+                    with ThreadPoolExecutor(max_workers=len(CLAW_REGIONS)) as pool:
+                        latency = list(pool.map(lambda region: cls.measure(region, proxies), CLAW_REGIONS))
+                    cls.results = sorted(zip(CLAW_REGIONS, latency), key=lambda x: (x[1] is None, x[1] or 0))
+                    print("📡 区域延迟: " + "，".join(f"{region} {f'{ms:.0f}ms' if ms is not None else '超时'}"
+                                                   for region, ms in cls.results))
+            return cls.results
+
+    @classmethod
+    def fastest(cls, proxies=None):
+        results = cls.run(proxies)
+        return results[0][0] if results and results[0][1] is not None else None
+
+
+# 登录页首次绘制时间（first-paint / first-contentful-paint，毫秒）
+PAINT_JS = "() => Object.fromEntries(performance.getEntriesByType('paint').map(e => [e.name, Math.round(e.startTime)]))"
+
+# 两步验证页面的候选 selector（并行查找，顺序只作为同时可见时的优先级）
+MORE_OPTIONS = [
+    'a:has-text("Use an authentication app")',
+    'a:has-text("Enter a code")',
+    'button:has-text("Use an authentication app")',
+    '[href*="two-factor/app"]'
+]
+OTP_INPUTS = [
+    'input[autocomplete="one-time-code"]',
+    'input[name="app_otp"]',
+    'input[name="otp"]',
+    'input#app_totp',
+    'input#otp',
+    'input[inputmode="numeric"]'
+]
+VERIFY_BUTTONS = [
+    'button:has-text("Verify")',
+    'button[type="submit"]',
+    'input[type="submit"]'
+]
+
+
+class SelectorCache:
+    """
+    选择器学习缓存：步骤名 -> 上次命中的 selector
+    - 启动时合并 LEARNED_SELECTORS（Secret）和 SELECTOR_CACHE 文件
+    - 查找时命中的 selector 排在候选列表最前
+    - 有变化时 stage() 写回文件，Secret 交给 flush_secrets() 与 Cookie 等同一批写入
+    """
+
+    def __init__(self, path=SELECTOR_CACHE):
+        self.path = path
+        self.lock = threading.Lock()
+        self.learned = {}
+        for raw in (os.environ.get('LEARNED_SELECTORS', ''), self._read_file()):
+            try:
+                self.learned.update(json.loads(raw) if raw else {})
+            except Exception as e:
+                print(f"⚠️ 选择器缓存解析失败，忽略: {e}")
+        self.loaded = dict(self.learned)
+
+    def _read_file(self):
+        if not self.path or not os.path.exists(self.path):
+            return ''
+        try:
+            with open(self.path) as f:
+                return f.read()
+        except:
+            return ''
+
+    def order(self, key, sels):
+        """上次命中的排第一，其余保持原顺序（不在候选里的旧记录忽略）"""
+        won = self.learned.get(key)
+        if won in sels:
+            return [won] + [s for s in sels if s != won]
+        return list(sels)
+
+    def learn(self, key, sel):
+        with self.lock:
+            self.learned[key] = sel
+
+    def stage(self):
+        """有新学到的 selector 时写回文件，返回待写入的 {'LEARNED_SELECTORS': 内容}，没有变化返回 {}"""
+        with self.lock:
+            if self.learned == self.loaded:
+                return {}
+            value = json.dumps(self.learned, ensure_ascii=False, sort_keys=True, separators=(',', ':'))
+            self.loaded = dict(self.learned)
+        if self.path:
+            try:
+                with open(self.path, 'w') as f:
+                    f.write(value)
+            except Exception as e:
+                print(f"⚠️ 写入选择器缓存失败: {e}")
+        return {'LEARNED_SELECTORS': value}
+
+
+class History:
+    """
+    运行历史（SQLite，只追加）
+    - runs：每次运行一行（账号、区域、代理节点、引擎、结果、失败步骤、总耗时）
+    - steps：该次运行各步骤耗时，同名步骤累加，包含嵌套步骤（如 wait_two_factor）
+    - report() 按步骤统计时间窗口内的 p50/p90/p99，并标出比滚动基线慢太多的运行
+    多账号线程共用一个文件，每次写入单独连接
+    """
+
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS runs (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        run_id TEXT, started REAL, account TEXT, region TEXT, proxy TEXT, failovers INTEGER,
+        engine TEXT, ok INTEGER, error TEXT, failed_step TEXT, elapsed REAL
+    );
+    CREATE TABLE IF NOT EXISTS steps (run INTEGER REFERENCES runs(id), name TEXT, dur REAL);
+    CREATE INDEX IF NOT EXISTS runs_started ON runs(started);
+    CREATE INDEX IF NOT EXISTS steps_run ON steps(run);
+    """
+
+    lock = threading.Lock()
+
+    def __init__(self, path=HISTORY_DB):
+        self.path = path
+
+    def connect(self):
+        db = sqlite3.connect(self.path, timeout=30)
+        db.executescript(self.SCHEMA)
+        return db
+
+    def add(self, run, steps):
+        """run: runs 表的字段；steps: {步骤名: 耗时秒}"""
+        if not self.path:
+            return
+        try:
+            with self.lock:
+                db = self.connect()
+                try:
+                    with db:
+                        cur = db.execute(f"INSERT INTO runs ({', '.join(run)}) VALUES ({', '.join('?' * len(run))})",
+                                         list(run.values()))
+                        db.executemany("INSERT INTO steps (run, name, dur) VALUES (?, ?, ?)",
+                                       [(cur.lastrowid, name, round(dur, 3)) for name, dur in steps.items()])
+                finally:
+                    db.close()
+        except Exception as e:
+            print(f"⚠️ 写入运行历史失败: {e}")
+
+    def load(self, since, account=None):
+        """时间窗口内的运行，按时间排序，每条带 steps 字典"""
+        db = self.connect()
+        db.row_factory = sqlite3.Row
+        try:
+            sql = "SELECT * FROM runs WHERE started >= ?" + (" AND account = ?" if account else "") + " ORDER BY started"
+            runs = [dict(row) for row in db.execute(sql, (since, account) if account else (since,))]
+            by_id = {run['id']: run for run in runs}
+            for run in runs:
+                run['steps'] = {}
+            if runs:
+                for run_id, name, dur in db.execute("SELECT run, name, dur FROM steps WHERE run >= ?", (runs[0]['id'],)):
+                    if run_id in by_id:
+                        by_id[run_id]['steps'][name] = dur
+            return runs
+        finally:
+            db.close()
+
+    @staticmethod
+    def percentile(values, q):
+        """线性插值百分位，values 已排序"""
+        if len(values) == 1:
+            return values[0]
+        k = (len(values) - 1) * q / 100
+        i = int(k)
+        return values[i] + (values[min(i + 1, len(values) - 1)] - values[i]) * (k - i)
+
+    def regressions(self, runs, history, threshold, baseline, min_samples=5, min_delta=1.0):
+        """
+        runs 中每个步骤与同账号之前 baseline 次运行的中位数比较（history 为包含基线的更长时间段），
+        超过中位数 threshold 倍且至少慢 min_delta 秒的记为回归
+        """
+        flagged = []
+        for run in runs:
+            earlier = [h for h in history if h['account'] == run['account'] and h['started'] < run['started']]
+            for name, dur in run['steps'].items():
+                samples = [h['steps'][name] for h in earlier if name in h['steps']][-baseline:]
+                if len(samples) < min_samples:
+                    continue
+                median = statistics.median(samples)
+                if dur > median * (1 + threshold) and dur - median >= min_delta:
+                    flagged.append((run, name, dur, median))
+        return flagged
+
+    def report(self, days=7, account=None, threshold=0.5, baseline=20):
+        since = time.time() - days * 86400
+        # 基线要往前多取一段，窗口最早的几次运行也有可比的数据
+        history = self.load(since - days * 86400 * 4, account)
+        runs = [run for run in history if run['started'] >= since]
+        if not runs:
+            print(f"ℹ️ 最近 {days:g} 天没有运行记录（{self.path}）")
+            return 0
+
+        ok_count = sum(1 for run in runs if run['ok'])
+        print(f"📊 最近 {days:g} 天 {len(runs)} 次运行，成功 {ok_count}（{ok_count * 100 // len(runs)}%）"
+              + (f"，账号 {account}" if account else ""))
+
+        durations = {}
+        for run in runs:
+            for name, dur in run['steps'].items():
+                durations.setdefault(name, []).append(dur)
+        print(f"\n{'步骤':<24}{'次数':>4}{'p50':>9}{'p90':>9}{'p99':>9}")
+        for name, values in sorted(durations.items(), key=lambda item: -statistics.median(item[1])):
+            values.sort()
+            print(f"{name:<26}{len(values):>6}" + "".join(f"{self.percentile(values, q):>8.1f}s" for q in (50, 90, 99)))
+
+        def counts(items, key):
+            totals = {}
+            for run in items:
+                totals[run[key]] = totals.get(run[key], 0) + 1
+            return "，".join(f"{k or '-'} {v}" for k, v in sorted(totals.items(), key=lambda item: -item[1]))
+
+        failed = [run for run in runs if not run['ok']]
+        if failed:
+            print(f"\n❌ 失败步骤: {counts(failed, 'failed_step')}")
+        print(f"📍 区域: {counts(runs, 'region')}")
+        print(f"🌐 代理: {counts(runs, 'proxy')}，切换备用节点 {sum(run['failovers'] or 0 for run in runs)} 次")
+
+        flagged = self.regressions(runs, history, threshold, baseline)
+        if flagged:
+            print(f"\n⚠️ 耗时回归（比前 {baseline} 次的中位数慢 {threshold:.0%} 以上）:")
+            for run, name, dur, median in flagged:
+                print(f"  {time.strftime('%m-%d %H:%M', time.localtime(run['started']))} {run['account']} "
+                      f"{name} {dur:.1f}s（基线 {median:.1f}s，+{(dur / median - 1) if median else 0:.0%}）")
+        else:
+            print("\n✅ 没有发现耗时回归")
+        return 1 if flagged else 0
+
+
+class LoginFlow:
+    """
+    自动登录流程（与执行引擎无关的部分）
+    - 每一步的判断只写一遍：@step 生成器把页面操作、截图、等待 yield 出去，由引擎执行
+    - 引擎子类只提供 drive()、blocking()、wait_until()、保活的并发方式和浏览器启动：
+      AutoLogin（同步，默认）/ AsyncAutoLogin（asyncio）
+    """
+    
+    def __init__(self, account=None, proxy=None, tg=None, secret=None, selectors=None):
+        """
+        account: 账号信息 dict（username/password/session/state/totp/region/secret_suffix/tag），
+        为空时从环境变量读取；proxy/tg/secret/selectors 在多账号模式下由 FleetRunner 共享传入
+        """
+        if account is None:
+            account = self.env_account()
+        self.username = account.get('username')
+        self.password = account.get('password')
+        self.gh_session = (account.get('session') or '').strip()
+        self.state_raw = (account.get('state') or '').strip()  # 上次保存的登录态（编码后）
+        self.state = self.decode_state(self.state_raw)
+        self.secret_suffix = account.get('secret_suffix', '')  # Secret 名后缀，如 GH_SESSION_ALICE
+        self.history = History()
+        region = (account.get('region') or '').strip()
+        self.saved_region = region if REGION_RE.match(region) else ''  # 上次检测到的区域
+        self.tag = account.get('tag', '')  # 日志前缀，多账号模式下区分输出
+        self.tracer = Tracer(account=self.username)
+        self.totp = None  # 本地 TOTP 生成器（有密钥时）
+        if (account.get('totp') or '').strip():
+            try:
+                self.totp = Totp(account['totp'].strip())
+            except Exception as e:
+                print(f"⚠️ TOTP 密钥无效，忽略: {e}")
+
         # 初始化代理
-        self.proxy = Hysteria2Proxy()
-        
-        self.tg = Telegram(proxy=self.proxy)
-        self.secret = SecretUpdater()
-        self.shots = []
+        self.proxy = proxy or Hysteria2Proxy()
+
+        self.tg = tg or Telegram(proxy=self.proxy, tracer=self.tracer)
+        self.secret = secret or SecretUpdater(self.tg.routes)
+        # 账号启动时读到的 Secret 当前值：内容没变就不重复写入
+        self.secret.baseline({**account.get('loaded', {}), 'LEARNED_SELECTORS': os.environ.get('LEARNED_SELECTORS', '')})
+        self.selectors = selectors or SelectorCache()
+        self.secret_writes = {}  # 待写入的 Secret，流程结束时由 flush_secrets() 一次批量写入
+        self.shots = ShotBuffer()
         self.logs = []
+        self.waits = []  # 每步实际等待时长 vs 旧固定等待
+        self.keepalive_results = []  # 每个保活地址的状态码和耗时
+        self.policy = ResourcePolicy() if ROUTE_BLOCK else None
+        self.context_hooks = []  # 新建上下文后依次调用 hook(context)，如基准测试的本地替身路由
         self.n = 0
+        self.started = time.time()
+        self.failed_step = None  # 失败的步骤，写入运行历史
         
         # 区域相关
         self.detected_region = None  # 检测到的区域，如 "ap-southeast-1"
         self.region_base_url = None  # 检测到的区域基础 URL
+        self.region_hosts = {}  # 域名 -> (区域, 基础 URL)，同一域名不重复解析
+        self.entry_url = None  # 本次的登录入口，见 signin_url()
+        self.traced_context = None  # 正在录制 Playwright trace 的上下文
+
+        # HAR 回放：入口取录制时的站点，密码可以不配（表单正文匹配前会脱敏）
+        self.har = HarArchive(self.suffixed(HAR_REPLAY)) if HAR_REPLAY else None
+        if self.har:
+            self.entry_url = self.har.entry_url()
+            self.password = self.password or HarArchive.placeholder('password')
         
+    @staticmethod
+    def env_account():
+        """单账号模式：从环境变量读取账号信息"""
+        return {
+            'username': os.environ.get('GH_USERNAME'),
+            'password': os.environ.get('GH_PASSWORD'),
+            'session': os.environ.get('GH_SESSION', ''),
+            'state': os.environ.get('CLAW_STATE', ''),
+            'totp': os.environ.get('GH_TOTP_SECRET', ''),
+            'region': os.environ.get('CLAW_REGION', ''),
+            'loaded': {name: os.environ.get(name, '') for name in ('GH_SESSION', 'CLAW_STATE', 'CLAW_REGION')},
+        }
+
     def log(self, msg, level="INFO"):
         icons = {"INFO": "ℹ️", "SUCCESS": "✅", "ERROR": "❌", "WARN": "⚠️", "STEP": "🔹"}
         line = f"{icons.get(level, '•')} {msg}"
-        print(line)
+        print(f"[{self.tag}] {line}" if self.tag else line)
         self.logs.append(line)
-    
-    def shot(self, page, name):
+
+    def suffixed(self, path):
+        """多账号模式下给输出文件名加账号后缀，如 trace_ALICE.zip"""
+        base, ext = os.path.splitext(path)
+        return f"{base}_{self.secret_suffix}{ext}" if self.secret_suffix else path
+
+    def secret_name(self, name):
+        """多账号模式下给 Secret 名加账号后缀"""
+        return f"{name}_{self.secret_suffix}" if self.secret_suffix else name
+
+    def command(self, cmd, arg=''):
+        """提示里的 Telegram 指令：多账号模式下带上账号名（/code alice 123456），只交给本账号"""
+        return ' '.join(x for x in (cmd, self.tag, arg) if x)
+
+    def shot_name(self, name):
+        """截图编号和多账号前缀"""
         self.n += 1
-        f = f"{self.n:02d}_{name}.png"
+        f = f"{self.n:02d}_{name}"
+        if self.tag:
+            f = f"{self.secret_suffix or self.tag}_{f}"
+        return f
+
+    @step()
+    def shot(self, page, name):
+        """截图到内存缓冲，返回 Frame（失败返回 None）"""
+        name = self.shot_name(name)
         try:
-            page.screenshot(path=f)
-            self.shots.append(f)
+            data = yield page.screenshot(**self.shots.options)
         except:
-            pass
-        return f
+            return None
+        return self.shots.add(name, data)
     
-    def click(self, page, sels, desc=""):
+    @step()
+    def click(self, page, sels, desc="", timeout=3):
+        el, _ = yield self.find(page, f"click:{desc}", sels, timeout)
+        if not el:
+            return False
+        try:
+            yield el.click()
+        except:
+            return False
+        self.log(f"已点击: {desc}", "SUCCESS")
+        return True
+
+    @staticmethod
+    def visible(page, selector):
+        """只匹配可见元素的定位器：前面有隐藏的同类元素（如页头表单里的 submit 按钮）时取第一个可见的"""
+        return page.locator(f"{selector} >> visible=true")
+
+    @classmethod
+    def combine(cls, page, sels):
+        """候选 selector 各自先过滤可见，再合成一个 or 定位器"""
+        combined = cls.visible(page, sels[0])
+        for s in sels[1:]:
+            combined = combined.or_(cls.visible(page, s))
+        return combined.first
+
+    @step()
+    def find(self, page, key, sels, timeout=3):
+        """
+        并行查找元素：所有候选合成一个定位器，一次等待任一可见，最坏只花一个 timeout
+        再确认是哪个候选命中并记入 SelectorCache；返回 (locator, selector)，找不到返回 (None, None)
+        """
+        sels = self.selectors.order(key, sels)
+        try:
+            yield self.combine(page, sels).wait_for(state='visible', timeout=timeout * 1000)
+        except:
+            return None, None
         for s in sels:
             try:
-                el = page.locator(s).first
-                if el.is_visible(timeout=3000):
-                    el.click()
-                    self.log(f"已点击: {desc}", "SUCCESS")
-                    return True
+                el = self.visible(page, s).first
+                if (yield el.is_visible()):
+                    self.selectors.learn(key, s)
+                    return el, s
             except:
                 pass
-        return False
+        return None, None
+
+    @staticmethod
+    def is_console(url):
+        """是否已进入 ClawCloud 控制台（离开 signin）"""
+        return 'claw.cloud' in url and 'signin' not in url.lower()
+
+    def record_wait(self, step, start, budget, ok):
+        self.waits.append({'step': step, 'waited': time.time() - start, 'budget': budget, 'ok': ok})
+
+    @step()
+    def settle(self, page, step, budget=0, timeout=30):
+        """等待当前页面 DOM 就绪（不等 networkidle）"""
+        start = time.time()
+        ok = True
+        try:
+            yield page.wait_for_load_state('domcontentloaded', timeout=timeout * 1000)
+        except:
+            ok = False
+        self.record_wait(step, start, budget, ok)
+        return ok
+
+    @step()
+    def report_paint(self, page):
+        """首次绘制时间（冷/热启动对比用）"""
+        try:
+            self.log_paint((yield page.evaluate(PAINT_JS)))
+        except:
+            pass
+
+    def log_paint(self, paint):
+        if not paint:
+            return
+        detail = "，".join(f"{name} {ms}ms" for name, ms in paint.items())
+        self.log(f"登录页绘制: {detail}", "INFO")
+
+    def mark_failed_step(self, error=None):
+        """
+        记下失败的步骤：异常时取抛出该异常的最内层步骤；
+        否则取当前步骤里刚结束的那个子步骤（返回失败后由调用方 fail()）
+        """
+        if self.failed_step:
+            return
+        spans = self.tracer.spans
+        if error is not None:
+            failed = [r for r in spans if not r.get('ok', True) and r.get('error') == str(error)[:200]]
+            step = max(failed, key=lambda r: r['depth'])['name'] if failed else None
+        else:
+            stack = self.tracer.stack.get()
+            step = next((r['name'] for r in reversed(spans) if r['depth'] == len(stack)), None)
+            step = step or (stack[-1]['name'] if stack else None)
+        self.failed_step = step
+
+    def record_history(self, ok, err=""):
+        """本次运行追加到运行历史；各步骤耗时按名字累加（含嵌套步骤）"""
+        steps = {}
+        for record in self.tracer.spans:
+            steps[record['name']] = steps.get(record['name'], 0) + record['dur']
+        self.history.add({
+            'run_id': self.tracer.run_id,
+            'started': self.started,
+            'account': self.username,
+            'region': self.detected_region,
+            'proxy': self.proxy.endpoint(),
+            'failovers': self.proxy.failovers,
+            'engine': self.engine,
+            'ok': int(bool(ok)),
+            'error': err or None,
+            'failed_step': None if ok else self.failed_step,
+            'elapsed': round(time.time() - self.started, 3),
+        }, steps)
+
+    def report_waits(self):
+        """输出每步实际等待时长，与旧的固定等待对比"""
+        if not self.waits:
+            return
+        waited = sum(w['waited'] for w in self.waits)
+        budget = sum(w['budget'] for w in self.waits)
+        self.log(f"等待统计: 实际 {waited:.1f}s / 旧固定等待 {budget}s", "INFO")
+        for w in self.waits:
+            print(f"  ⏱ {w['step']}: {w['waited']:.2f}s（旧 {w['budget']}s）{'' if w['ok'] else ' ⚠️未满足'}")
     
     def detect_region(self, url):
         """
@@ -488,6 +2344,9 @@ class AutoLogin:
         try:
             parsed = urlparse(url)
             host = parsed.netloc  # 如 "ap-southeast-1.console.claw.cloud"
+            if host in self.region_hosts:
+                self.detected_region, self.region_base_url = self.region_hosts[host]
+                return self.detected_region
             
             # 检查是否是区域子域名格式
             # 格式: {region}.console.claw.cloud
@@ -497,6 +2356,7 @@ class AutoLogin:
                 if region and region != 'console':  # 排除无效情况
                     self.detected_region = region
                     self.region_base_url = f"https://{host}"
+                    self.region_hosts[host] = (region, self.region_base_url)
                     self.log(f"检测到区域: {region}", "SUCCESS")
                     self.log(f"区域 URL: {self.region_base_url}", "INFO")
                     return region
@@ -527,373 +2387,574 @@ class AutoLogin:
         """获取当前应该使用的基础 URL"""
         if self.region_base_url:
             return self.region_base_url
-        return LOGIN_ENTRY_URL
+        return self.entry_url or LOGIN_ENTRY_URL
+
+    def signin_url(self):
+        """登录页：已保存的区域 > 延迟最低的区域（REGION_PROBE）> 默认入口"""
+        if not self.entry_url:
+            region = self.saved_region
+            if not region and REGION_PROBE:
+                region = RegionProbe.fastest(self.proxy.get_requests_proxies())
+            self.entry_url = f"https://{region}.run.claw.cloud" if region else LOGIN_ENTRY_URL
+        return f"{self.entry_url}/signin"
     
+    @step()
     def get_session(self, context):
         """提取 Session Cookie"""
         try:
-            for c in context.cookies():
-                if c['name'] == 'user_session' and 'github' in c.get('domain', ''):
-                    return c['value']
+            return self.find_session((yield context.cookies()))
         except:
-            pass
+            return None
+
+    @staticmethod
+    def find_session(cookies):
+        for c in cookies:
+            if c['name'] == 'user_session' and 'github' in c.get('domain', ''):
+                return c['value']
         return None
     
+    @staticmethod
+    def encode_state(state):
+        """storage_state -> zlib + base64 文本"""
+        raw = json.dumps(state, separators=(',', ':'), sort_keys=True).encode()
+        return base64.b64encode(zlib.compress(raw, 9)).decode()
+
+    @staticmethod
+    def decode_state(value):
+        """encode_state 的逆过程，无效时返回 None"""
+        if not value:
+            return None
+        try:
+            return json.loads(zlib.decompress(base64.b64decode(value)))
+        except Exception as e:
+            print(f"⚠️ 登录态解析失败，忽略: {e}")
+            return None
+
+    @step()
+    def get_state(self, context):
+        """导出完整登录态（storage_state），只保留登录相关域名"""
+        try:
+            return self.filter_state((yield context.storage_state()))
+        except Exception as e:
+            self.log(f"读取登录态失败: {e}", "WARN")
+            return None
+
+    @staticmethod
+    def filter_state(state):
+        return {
+            'cookies': [c for c in state.get('cookies', [])
+                        if any(d in c.get('domain', '') for d in STATE_DOMAINS)],
+            'origins': [o for o in state.get('origins', [])
+                        if any(d in o.get('origin', '') for d in STATE_DOMAINS)],
+        }
+
+    @step('save_state')
+    def save_state(self, context):
+        """导出登录态，与旧值不同时加入待写入的 Secret"""
+        self.store_state((yield self.get_state(context)))
+
+    def store_state(self, state):
+        if not state:
+            return
+
+        value = self.encode_state(state)
+        if value == self.state_raw:
+            self.log("登录态未变化", "INFO")
+            return
+        if len(value) > STATE_MAX_SIZE:
+            self.log(f"登录态过大（{len(value)} 字节），不保存", "WARN")
+            return
+
+        name = self.secret_name('CLAW_STATE')
+        self.secret_writes[name] = value
+        self.state_raw = value
+        self.log(f"登录态待保存（{len(state['cookies'])} 个 Cookie，{len(state['origins'])} 个站点存储）", "INFO")
+
     def save_cookie(self, value):
-        """保存新 Cookie"""
+        """记下新 Cookie，随 flush_secrets() 一起写入"""
         if not value:
             return
         
         self.log(f"新 Cookie: {value[:15]}...{value[-8:]}", "SUCCESS")
-        
-        # 自动更新 Secret
-        if self.secret.update('GH_SESSION', value):
-            self.log("已自动更新 GH_SESSION", "SUCCESS")
-            self.tg.send("🔑 <b>Cookie 已自动更新</b>\n\nGH_SESSION 已保存")
-        else:
+        self.secret_writes[self.secret_name('GH_SESSION')] = value
+        self.gh_session = value
+
+    @traced('save_secrets')
+    def flush_secrets(self):
+        """把本次流程要保存的 Secret（Cookie、登录态、区域、学到的选择器）一次批量写入，内容未变的跳过"""
+        if self.detected_region and self.detected_region != self.saved_region:
+            self.secret_writes[self.secret_name('CLAW_REGION')] = self.detected_region
+            self.saved_region = self.detected_region
+        self.secret_writes.update(self.selectors.stage())
+        writes, self.secret_writes = self.secret_writes, {}
+        if not writes:
+            return
+        with self.tracer.span('secret.update', names=",".join(writes)):
+            results = self.secret.update_many(writes)
+        for name, status in results.items():
+            if status == 'saved':
+                self.log(f"已自动更新 {name}", "SUCCESS")
+            elif status == 'unchanged':
+                self.log(f"{name} 未变化，跳过写入", "INFO")
+            else:
+                reason = ('HAR 回放模式' if HAR_REPLAY else '需要 REPO_TOKEN') if status == 'disabled' else '写入失败'
+                self.log(f"{name} 未保存（{reason}）", "WARN")
+
+        name = self.secret_name('GH_SESSION')
+        status = results.get(name)
+        if status == 'saved':
+            self.tg.send(f"🔑 <b>Cookie 已自动更新</b>\n\n{name} 已保存")
+        elif status in ('failed', 'disabled'):
             # 通过 Telegram 发送
             self.tg.send(f"""🔑 <b>新 Cookie</b>
 
-请更新 Secret <b>GH_SESSION</b>:
-<code>{value}</code>""")
+请更新 Secret <b>{name}</b>:
+<code>{writes[name]}</code>""")
             self.log("已通过 Telegram 发送 Cookie", "SUCCESS")
     
+    @step('wait_device')
     def wait_device(self, page):
         """等待设备验证"""
         self.log(f"需要设备验证，等待 {DEVICE_VERIFY_WAIT} 秒...", "WARN")
-        self.shot(page, "设备验证")
+        shot = yield self.shot(page, "设备验证")
         
         self.tg.send(f"""⚠️ <b>需要设备验证</b>
 
 请在 {DEVICE_VERIFY_WAIT} 秒内批准：
 1️⃣ 检查邮箱点击链接
-2️⃣ 或在 GitHub App 批准""")
+2️⃣ 或在 GitHub App 批准
+
+批准后可发送 {self.command('/done')} 立即检查，{self.command('/abort')} 放弃""")
         
-        if self.shots:
-            self.tg.photo(self.shots[-1], "设备验证页面")
+        if shot:
+            self.tg.photo(shot, "设备验证页面")
         
-        for i in range(DEVICE_VERIFY_WAIT):
-            time.sleep(1)
-            if i % 5 == 0:
-                self.log(f"  等待... ({i}/{DEVICE_VERIFY_WAIT}秒)")
-                url = page.url
-                if 'verified-device' not in url and 'device-verification' not in url:
-                    self.log("设备验证通过！", "SUCCESS")
-                    self.tg.send("✅ <b>设备验证通过</b>")
-                    return True
+        def left(u):
+            return 'verified-device' not in u and 'device-verification' not in u
+
+        # 页面离开验证页立即返回；每 5 秒或收到 /done 时刷新（在别处批准后本页不会自动跳转）
+        cmd = self.tg.listen(r"^/(done|abort)$", self.tag)
+        start = time.time()
+        deadline = start + DEVICE_VERIFY_WAIT
+        try:
+            while time.time() < deadline:
+                self.log(f"  等待... ({int(time.time() - start)}/{DEVICE_VERIFY_WAIT}秒)")
+                hit = yield self.wait_until(page, "设备验证", url=left, timeout=min(5, deadline - time.time()),
+                                            record=False, cancel=cmd)
+                if hit in ('url', 'proxy'):
+                    break
+                if hit == 'cancel' and cmd.poll().group(1) == 'abort':
+                    self.log("收到 /abort，放弃设备验证", "ERROR")
+                    self.record_wait("设备验证", start, 0, False)
+                    return False
                 try:
-                    page.reload(timeout=10000)
-                    page.wait_for_load_state('networkidle', timeout=10000)
+                    yield page.reload(timeout=10000, wait_until='domcontentloaded')
                 except:
                     pass
-        
-        if 'verified-device' not in page.url:
+        finally:
+            self.tg.unlisten(cmd)
+        self.record_wait("设备验证", start, 0, left(page.url))
+
+        if left(page.url):
+            self.log("设备验证通过！", "SUCCESS")
+            self.tg.send("✅ <b>设备验证通过</b>")
             return True
         
         self.log("设备验证超时", "ERROR")
         self.tg.send("❌ <b>设备验证超时</b>")
         return False
     
+    @step('wait_two_factor_mobile')
     def wait_two_factor_mobile(self, page):
         """等待 GitHub Mobile 两步验证批准，并把数字截图提前发到电报"""
         self.log(f"需要两步验证（GitHub Mobile），等待 {TWO_FACTOR_WAIT} 秒...", "WARN")
         
         # 先截图并立刻发出去（让你看到数字）
-        shot = self.shot(page, "两步验证_mobile")
+        shot = yield self.shot(page, "两步验证_mobile")
         self.tg.send(f"""⚠️ <b>需要两步验证（GitHub Mobile）</b>
 
 请打开手机 GitHub App 批准本次登录（会让你确认一个数字）。
-等待时间：{TWO_FACTOR_WAIT} 秒""")
+等待时间：{TWO_FACTOR_WAIT} 秒（{self.command('/abort')} 放弃）""")
         if shot:
             self.tg.photo(shot, "两步验证页面（数字在图里）")
         
-        # 不要频繁 reload，避免把流程刷回登录页
-        for i in range(TWO_FACTOR_WAIT):
-            time.sleep(1)
-            
-            url = page.url
-            
-            # 如果离开 two-factor 流程页面，认为通过
-            if "github.com/sessions/two-factor/" not in url:
-                self.log("两步验证通过！", "SUCCESS")
-                self.tg.send("✅ <b>两步验证通过</b>")
-                return True
-            
-            # 如果被刷回登录页，说明这次流程断了（不要硬等）
-            if "github.com/login" in url:
-                self.log("两步验证后回到了登录页，需重新登录", "ERROR")
-                return False
-            
-            # 每 10 秒打印一次，并补发一次截图（防止你没看到数字）
-            if i % 10 == 0 and i != 0:
+        # 手机批准后页面会自己跳转，按导航事件等待；不要频繁 reload，避免把流程刷回登录页
+        def left(u):
+            return "github.com/sessions/two-factor/" not in u or "github.com/login" in u
+
+        cmd = self.tg.listen(r"^/abort$", self.tag)
+        start = time.time()
+        deadline = start + TWO_FACTOR_WAIT
+        try:
+            while True:
+                hit = yield self.wait_until(page, "两步验证", url=left, timeout=min(10, deadline - time.time()),
+                                            record=False, cancel=cmd)
+                url = page.url
+                i = int(time.time() - start)
+
+                if hit in ('cancel', 'proxy'):
+                    self.record_wait("两步验证", start, 0, False)
+                    if hit == 'cancel':
+                        self.log("收到 /abort，放弃两步验证", "ERROR")
+                    return False
+                
+                # 如果被刷回登录页，说明这次流程断了（不要硬等）
+                if "github.com/login" in url:
+                    self.record_wait("两步验证", start, 0, False)
+                    self.log("两步验证后回到了登录页，需重新登录", "ERROR")
+                    return False
+                
+                # 如果离开 two-factor 流程页面，认为通过
+                if "github.com/sessions/two-factor/" not in url:
+                    self.record_wait("两步验证", start, 0, True)
+                    self.log("两步验证通过！", "SUCCESS")
+                    self.tg.send("✅ <b>两步验证通过</b>")
+                    return True
+
+                if time.time() >= deadline:
+                    break
+                
+                # 每 10 秒打印一次，并补发一次截图（防止你没看到数字）
                 self.log(f"  等待... ({i}/{TWO_FACTOR_WAIT}秒)")
-                shot = self.shot(page, f"两步验证_{i}s")
+                shot = yield self.shot(page, f"两步验证_{i}s")
                 if shot:
                     self.tg.photo(shot, f"两步验证页面（第{i}秒）")
-            
-            # 只在 30 秒、60 秒... 做一次轻刷新（可选，频率很低）
-            if i % 30 == 0 and i != 0:
-                try:
-                    page.reload(timeout=30000)
-                    page.wait_for_load_state('domcontentloaded', timeout=30000)
-                except:
-                    pass
+                
+                # 大约每 30 秒做一次轻刷新（可选，频率很低）
+                if i >= 30 and (i // 10) % 3 == 0:
+                    try:
+                        yield page.reload(timeout=30000, wait_until='domcontentloaded')
+                    except:
+                        pass
+        finally:
+            self.tg.unlisten(cmd)
         
+        self.record_wait("两步验证", start, 0, False)
         self.log("两步验证超时", "ERROR")
         self.tg.send("❌ <b>两步验证超时</b>")
         return False
-    
+
+    @step('handle_2fa_code_input')
     def handle_2fa_code_input(self, page):
-        """处理 TOTP 验证码输入（通过 Telegram 发送 /code 123456）"""
+        """
+        处理 TOTP 验证码输入
+        - 有 TOTP 密钥时本地计算直接填入
+        - 没有密钥或本地验证码未通过时，通过 Telegram 发送 /code 123456
+        - 等 /code 的同时监视页面：在别处通过验证、页面跳走后立即继续
+        """
         self.log("需要输入验证码", "WARN")
-        shot = self.shot(page, "两步验证_code")
+        shot = yield self.shot(page, "两步验证_code")
         
         # 先尝试点击"Use an authentication app"或类似按钮（如果在 mobile 页面）
-        try:
-            more_options = [
-                'a:has-text("Use an authentication app")',
-                'a:has-text("Enter a code")',
-                'button:has-text("Use an authentication app")',
-                '[href*="two-factor/app"]'
-            ]
-            for sel in more_options:
-                try:
-                    el = page.locator(sel).first
-                    if el.is_visible(timeout=2000):
-                        el.click()
-                        time.sleep(2)
-                        page.wait_for_load_state('networkidle', timeout=15000)
-                        self.log("已切换到验证码输入页面", "SUCCESS")
-                        shot = self.shot(page, "两步验证_code_切换后")
-                        break
-                except:
-                    pass
-        except:
-            pass
+        el, _ = yield self.find(page, "2fa:more_options", MORE_OPTIONS, timeout=0.5)
+        if el:
+            try:
+                yield el.click()
+                yield self.wait_until(page, "切换验证码页", url=lambda u: 'two-factor/app' in u, timeout=15, budget=2)
+                yield self.settle(page, "切换验证码页_加载")
+                self.log("已切换到验证码输入页面", "SUCCESS")
+                shot = yield self.shot(page, "两步验证_code_切换后")
+            except:
+                pass
         
-        # 发送提示并等待验证码
-        self.tg.send(f"""🔐 <b>需要验证码登录</b>
+        if self.totp:
+            self.log("使用本地 TOTP 生成验证码", "SUCCESS")
+            result = yield self.submit_code(page, (yield self.blocking(self.totp_code)))
+            if result is not False:
+                return self.code_result(result)
+            self.log("本地 TOTP 验证码未通过，改用 Telegram 输入", "WARN")
+            shot = yield self.shot(page, "两步验证_TOTP未通过")
+
+        if HAR_REPLAY:
+            # 回放时验证码在匹配前会被脱敏，填什么都一样
+            self.log("HAR 回放，填入占位验证码", "INFO")
+            return self.code_result((yield self.submit_code(page, '000000')))
+
+        if not self.tg.ok:
+            self.log("未配置 Telegram，无法接收验证码", "ERROR")
+            return False
+
+        # 6 位 TOTP 或 8 位恢复码，/abort 放弃
+        waiter = self.tg.listen(r"^/(?:code\s+(\d{6,8})|abort)$", self.tag)
+        try:
+            # 发送提示并等待验证码
+            self.tg.send(f"""🔐 <b>需要验证码登录</b>
 
 请在 Telegram 里发送：
-<code>/code 你的6位验证码</code>
+<code>{self.command('/code', '你的6位验证码')}</code>
 
-等待时间：{TWO_FACTOR_WAIT} 秒""")
-        if shot:
-            self.tg.photo(shot, "两步验证页面")
-        
-        self.log(f"等待验证码（{TWO_FACTOR_WAIT}秒）...", "WARN")
-        code = self.tg.wait_code(timeout=TWO_FACTOR_WAIT)
-        
+等待时间：{TWO_FACTOR_WAIT} 秒（{self.command('/abort')} 放弃）""")
+            if shot:
+                self.tg.photo(shot, "两步验证页面")
+
+            self.log(f"等待验证码（{TWO_FACTOR_WAIT}秒）...", "WARN")
+            hit = yield self.wait_until(page, "等待验证码", url=lambda u: "github.com/sessions/two-factor/" not in u,
+                                        timeout=TWO_FACTOR_WAIT, cancel=waiter)
+            m = waiter.poll() if hit == 'cancel' else None
+        finally:
+            self.tg.unlisten(waiter)
+
+        if hit == 'url':
+            self.log("页面已离开两步验证（已在别处通过）", "SUCCESS")
+            return True
+        code = m.group(1) if m else None
         if not code:
-            self.log("等待验证码超时", "ERROR")
-            self.tg.send("❌ <b>等待验证码超时</b>")
+            self.log("等待验证码超时" if not hit else "放弃输入验证码", "ERROR")
+            self.tg.send("❌ <b>等待验证码超时</b>" if not hit else "❌ <b>已放弃输入验证码</b>")
             return False
         
         # 不打印验证码明文，只提示收到
         self.log("收到验证码，正在填入...", "SUCCESS")
         self.tg.send("✅ 收到验证码，正在填入...")
-        
-        # 常见 OTP 输入框 selector（优先级排序）
-        selectors = [
-            'input[autocomplete="one-time-code"]',
-            'input[name="app_otp"]',
-            'input[name="otp"]',
-            'input#app_totp',
-            'input#otp',
-            'input[inputmode="numeric"]'
-        ]
-        
-        for sel in selectors:
-            try:
-                el = page.locator(sel).first
-                if el.is_visible(timeout=2000):
-                    el.fill(code)
-                    self.log(f"已填入验证码", "SUCCESS")
-                    time.sleep(1)
-                    
-                    # 优先点击 Verify 按钮，不行再 Enter
-                    submitted = False
-                    verify_btns = [
-                        'button:has-text("Verify")',
-                        'button[type="submit"]',
-                        'input[type="submit"]'
-                    ]
-                    for btn_sel in verify_btns:
-                        try:
-                            btn = page.locator(btn_sel).first
-                            if btn.is_visible(timeout=1000):
-                                btn.click()
-                                submitted = True
-                                self.log("已点击 Verify 按钮", "SUCCESS")
-                                break
-                        except:
-                            pass
-                    
-                    if not submitted:
-                        page.keyboard.press("Enter")
-                        self.log("已按 Enter 提交", "SUCCESS")
-                    
-                    time.sleep(3)
-                    page.wait_for_load_state('networkidle', timeout=30000)
-                    self.shot(page, "验证码提交后")
-                    
-                    # 检查是否通过
-                    if "github.com/sessions/two-factor/" not in page.url:
-                        self.log("验证码验证通过！", "SUCCESS")
-                        self.tg.send("✅ <b>验证码验证通过</b>")
-                        return True
-                    else:
-                        self.log("验证码可能错误", "ERROR")
-                        self.tg.send("❌ <b>验证码可能错误，请检查后重试</b>")
-                        return False
-            except:
-                pass
-        
-        self.log("没找到验证码输入框", "ERROR")
-        self.tg.send("❌ <b>没找到验证码输入框</b>")
-        return False
+        return self.code_result((yield self.submit_code(page, code)))
+
+    def totp_code(self):
+        Totp.sync_clock(self.proxy.get_requests_proxies())
+        return self.totp.now()
+
+    @step()
+    def submit_code(self, page, code):
+        """填入验证码并提交，返回 True 通过 / False 未通过 / None 没找到输入框"""
+        # OTP 输入框：所有候选一起等，命中的记下来下次优先
+        el, _ = yield self.find(page, "2fa:otp_input", OTP_INPUTS, timeout=5)
+        if not el:
+            return None
+        try:
+            yield el.fill(code)
+            self.log(f"已填入验证码", "SUCCESS")
+
+            # 优先点击 Verify 按钮，不行再 Enter
+            if not (yield self.click(page, VERIFY_BUTTONS, "Verify", timeout=2)):
+                yield page.keyboard.press("Enter")
+                self.log("已按 Enter 提交", "SUCCESS")
+
+            # 离开 two-factor 或出现错误提示即返回
+            yield self.wait_until(page, "验证码提交", url=lambda u: "github.com/sessions/two-factor/" not in u,
+                                  selector='.flash-error', timeout=30, budget=4)
+            yield self.shot(page, "验证码提交后")
+        except:
+            return None
+        return "github.com/sessions/two-factor/" not in page.url
+
+    def code_result(self, result):
+        """submit_code 结果的日志和通知"""
+        if result:
+            self.log("验证码验证通过！", "SUCCESS")
+            self.tg.send("✅ <b>验证码验证通过</b>")
+        elif result is False:
+            self.log("验证码可能错误", "ERROR")
+            self.tg.send("❌ <b>验证码可能错误，请检查后重试</b>")
+        else:
+            self.log("没找到验证码输入框", "ERROR")
+            self.tg.send("❌ <b>没找到验证码输入框</b>")
+        return bool(result)
     
+    @step('login_github')
     def login_github(self, page, context):
         """登录 GitHub"""
         self.log("登录 GitHub...", "STEP")
-        self.shot(page, "github_登录页")
+        yield self.shot(page, "github_登录页")
         
         try:
-            page.locator('input[name="login"]').fill(self.username)
-            page.locator('input[name="password"]').fill(self.password)
+            yield page.locator('input[name="login"]').fill(self.username)
+            yield page.locator('input[name="password"]').fill(self.password)
             self.log("已输入凭据")
         except Exception as e:
             self.log(f"输入失败: {e}", "ERROR")
             return False
         
-        self.shot(page, "github_已填写")
+        yield self.shot(page, "github_已填写")
         
+        before = page.url
         try:
-            page.locator('input[type="submit"], button[type="submit"]').first.click()
+            yield self.visible(page, 'input[type="submit"], button[type="submit"]').first.click()
         except:
             pass
         
-        time.sleep(3)
-        page.wait_for_load_state('networkidle', timeout=30000)
-        self.shot(page, "github_登录后")
+        # 提交后地址一定会变（/session、设备验证、两步验证或直接回到 OAuth）
+        yield self.wait_until(page, "提交登录", url=lambda u: u != before, timeout=30, budget=3)
+        yield self.settle(page, "提交登录_加载")
+        yield self.shot(page, "github_登录后")
         
         url = page.url
         self.log(f"当前: {url}")
         
         # 设备验证
         if 'verified-device' in url or 'device-verification' in url:
-            if not self.wait_device(page):
+            if not (yield self.wait_device(page)):
                 return False
-            time.sleep(2)
-            page.wait_for_load_state('networkidle', timeout=30000)
-            self.shot(page, "验证后")
+            yield self.settle(page, "设备验证后", budget=2)
+            yield self.shot(page, "验证后")
         
         # 2FA
         if 'two-factor' in page.url:
             self.log("需要两步验证！", "WARN")
-            self.shot(page, "两步验证")
+            yield self.shot(page, "两步验证")
             
             # GitHub Mobile：等待你在手机上批准
             if 'two-factor/mobile' in page.url:
-                if not self.wait_two_factor_mobile(page):
+                if not (yield self.wait_two_factor_mobile(page)):
                     return False
                 # 通过后等页面稳定
-                try:
-                    page.wait_for_load_state('networkidle', timeout=30000)
-                    time.sleep(2)
-                except:
-                    pass
+                yield self.settle(page, "两步验证后", budget=2)
             
             else:
                 # 其它两步验证方式（TOTP/恢复码等），尝试通过 Telegram 输入验证码
-                if not self.handle_2fa_code_input(page):
+                if not (yield self.handle_2fa_code_input(page)):
                     return False
                 # 通过后等页面稳定
-                try:
-                    page.wait_for_load_state('networkidle', timeout=30000)
-                    time.sleep(2)
-                except:
-                    pass
+                yield self.settle(page, "验证码通过后", budget=2)
         
         # 错误
         try:
-            err = page.locator('.flash-error').first
-            if err.is_visible(timeout=2000):
-                self.log(f"错误: {err.inner_text()}", "ERROR")
+            err = self.visible(page, '.flash-error').first
+            if (yield err.is_visible()):
+                self.log(f"错误: {(yield err.inner_text())}", "ERROR")
                 return False
         except:
             pass
         
         return True
     
+    @step('oauth')
     def oauth(self, page):
         """处理 OAuth"""
         if 'github.com/login/oauth/authorize' in page.url:
             self.log("处理 OAuth...", "STEP")
-            self.shot(page, "oauth")
-            self.click(page, ['button[name="authorize"]', 'button:has-text("Authorize")'], "授权")
-            time.sleep(3)
-            page.wait_for_load_state('networkidle', timeout=30000)
+            yield self.shot(page, "oauth")
+            yield self.click(page, ['button[name="authorize"]', 'button:has-text("Authorize")'], "授权")
+            yield self.wait_until(page, "OAuth 授权", url=lambda u: 'github.com/login/oauth/authorize' not in u,
+                                  timeout=30, budget=3)
     
+    @step('wait_redirect')
     def wait_redirect(self, page, wait=60):
         """等待重定向并检测区域"""
         self.log("等待重定向...", "STEP")
-        for i in range(wait):
+        deadline = time.time() + wait
+
+        def ready(u):
+            return self.is_console(u) or 'github.com/login/oauth/authorize' in u
+
+        while True:
+            hit = yield self.wait_until(page, "重定向", url=ready, timeout=deadline - time.time(), budget=1)
             url = page.url
             
             # 检查是否已跳转到 claw.cloud
-            if 'claw.cloud' in url and 'signin' not in url.lower():
+            if self.is_console(url):
                 self.log("重定向成功！", "SUCCESS")
                 
                 # 检测并记录区域
                 self.detect_region(url)
                 
                 return True
-            
+
+            # 代理中断或到期就停：停在授权页时 ready() 会立即命中，不能靠 hit 退出
+            if hit == 'proxy' or time.time() >= deadline:
+                break
             if 'github.com/login/oauth/authorize' in url:
-                self.oauth(page)
-            
-            time.sleep(1)
-            if i % 10 == 0:
-                self.log(f"  等待... ({i}秒)")
+                yield self.oauth(page)
+            elif not hit:
+                break
         
         self.log("重定向超时", "ERROR")
         return False
     
+    def keepalive_targets(self):
+        """KEEPALIVE_ENDPOINTS -> [(名称, URL, 是否只发 API 请求)]，相对地址拼在检测到的区域 URL 后"""
+        base_url = self.get_base_url()
+        targets = []
+        for endpoint in KEEPALIVE_ENDPOINTS:
+            api = endpoint.startswith('api:')
+            path = endpoint[4:].strip() if api else endpoint
+            url = path if path.startswith('https://') else f"{base_url}/{path.lstrip('/')}"
+            targets.append((KEEPALIVE_NAMES.get(path, path), url, api))
+        return targets
+
+    def keepalive_result(self, name, url, api, status, start, error=None, final=None):
+        """记录一个保活地址的结果；页面被重定向回登录页也算失败"""
+        result = {
+            'name': name,
+            'url': url,
+            'kind': 'api' if api else 'page',
+            'status': status,
+            'start': start,
+            'ms': round((time.time() - start) * 1000),
+        }
+        if error is None and final and not self.is_console(final):
+            error = f"跳转到 {final}"
+        if error is None and (status is None or status >= (300 if api else 400)):
+            error = f"HTTP {status}"
+        result['ok'] = error is None
+        if error is not None:
+            result['error'] = str(error)[:200]
+        return result
+
+    def report_keepalive(self, results):
+        """输出并记录每个保活地址的状态码和耗时，同时补记到 trace"""
+        for result in results:
+            label = f"{result['name']}{'（API）' if result['kind'] == 'api' else ''}"
+            if result['ok']:
+                self.log(f"已访问: {label} ({result['url']}) {result['status']} · {result['ms']}ms", "SUCCESS")
+            else:
+                self.log(f"访问 {label} 失败: {result['error']}", "WARN")
+            self.tracer.event(f"keepalive.{result['kind']}", result['start'], result['ms'] / 1000, ok=result['ok'],
+                              url=result['url'], status=result['status'])
+        self.keepalive_results.extend(results)
+
+    def keepalive_api(self, name, url, cookies):
+        """只带上下文 Cookie 发一个 GET，不渲染页面；重定向视为失败（通常是登录态失效）"""
+        start = time.time()
+        try:
+            r = requests.get(url, timeout=30, allow_redirects=False, proxies=self.proxy.get_requests_proxies(), headers={
+                'User-Agent': USER_AGENT,
+                'Cookie': '; '.join(f"{c['name']}={c['value']}" for c in cookies),
+            })
+        except Exception as e:
+            return self.keepalive_result(name, url, True, None, start, error=e)
+        return self.keepalive_result(name, url, True, r.status_code, start)
+
+    @step('keepalive')
     def keepalive(self, page):
-        """保活 - 使用检测到的区域 URL"""
+        """
+        保活 - 使用检测到的区域 URL
+        API 地址只带 Cookie 发请求，页面最多 KEEPALIVE_CONCURRENCY 个标签页同时加载，第一个用当前页面
+        （并发方式见引擎的 visit_keepalive()）
+        """
         self.log("保活...", "STEP")
         
         # 使用检测到的区域 URL，如果没有则使用默认
         base_url = self.get_base_url()
         self.log(f"使用区域 URL: {base_url}", "INFO")
-        
-        pages_to_visit = [
-            (f"{base_url}/", "控制台"),
-            (f"{base_url}/apps", "应用"),
-        ]
-        
-        # 如果检测到了区域，可以额外访问一些区域特定页面
         if self.detected_region:
             self.log(f"当前区域: {self.detected_region}", "INFO")
+
+        self.report_keepalive((yield self.visit_keepalive(page, self.keepalive_targets())))
         
-        for url, name in pages_to_visit:
+        yield self.shot(page, "完成")
+
+    @step()
+    def keepalive_visit(self, page, tab, name, url, start, response):
+        """保活页面导航发起之后：等网络空闲、记录结果、再次检测区域，关闭额外的标签页"""
+        if isinstance(response, Exception):
+            result = self.keepalive_result(name, url, False, None, start, error=response)
+        else:
             try:
-                page.goto(url, timeout=30000)
-                page.wait_for_load_state('networkidle', timeout=15000)
-                self.log(f"已访问: {name} ({url})", "SUCCESS")
-                
-                # 再次检测区域（以防中途跳转）
-                current_url = page.url
-                if 'claw.cloud' in current_url:
-                    self.detect_region(current_url)
-                
-                time.sleep(2)
+                yield tab.wait_for_load_state('networkidle', timeout=15000)
+                result = self.keepalive_result(name, url, False, response.status if response else None,
+                                               start, final=tab.url)
             except Exception as e:
-                self.log(f"访问 {name} 失败: {e}", "WARN")
-        
-        self.shot(page, "完成")
-    
+                result = self.keepalive_result(name, url, False, None, start, error=e)
+            # 再次检测区域（以防中途跳转）
+            if 'claw.cloud' in tab.url:
+                self.detect_region(tab.url)
+        if tab is not page:
+            try:
+                yield tab.close()
+            except:
+                pass
+        return result
+
+    @traced('notify')
     def notify(self, ok, err=""):
         if not self.tg.ok:
             return
@@ -911,16 +2972,320 @@ class AutoLogin:
             msg += f"\n<b>错误:</b> {err}"
         
         msg += "\n\n<b>日志:</b>\n" + "\n".join(self.logs[-6:])
+
+        steps = self.tracer.summary()
+        if steps:
+            msg += "\n\n<b>耗时:</b>\n" + "\n".join(f"⏱ {k}: {v:.1f}s" for k, v in steps.items())
+
+        if self.keepalive_results:
+            msg += "\n\n<b>保活:</b>\n" + "\n".join(
+                f"{'✅' if r['ok'] else '❌'} {r['name']}{'（API）' if r['kind'] == 'api' else ''} "
+                f"{r['status'] or '-'} · {r['ms']}ms" for r in self.keepalive_results)
         
         self.tg.send(msg)
         
         if self.shots:
             if not ok:
-                for s in self.shots[-3:]:
-                    self.tg.photo(s, s)
+                frames = self.shots.last(3)
+                self.tg.media_group(frames, " → ".join(f.name for f in frames))
             else:
                 self.tg.photo(self.shots[-1], "完成")
     
+    @step()
+    def new_context(self, browser):
+        """创建带代理和 Session Cookie 的浏览器上下文"""
+        context = yield browser.new_context(**self.context_options())
+        return (yield self.setup_context(context))
+
+    @step()
+    def setup_context(self, context):
+        """上下文创建后的公共设置：HAR 回放、hook、资源拦截、trace、Session Cookie"""
+        # HAR 回放最先注册、最后处理：拦截和 hook 放行的请求才由录制的响应应答
+        if self.har:
+            yield context.route_from_har(self.har.path, not_found=HAR_REPLAY_MISS)
+            yield context.route("**/*", self.har.handle)
+
+        # hook 可以是普通函数，asyncio 引擎下也可以是 async 函数
+        for hook in self.context_hooks:
+            yield hook(context)
+
+        # 拦截非必要资源（后注册先执行，放行的请求再交给 hook 注册的路由）
+        if self.policy:
+            yield self.policy.attach(context)
+
+        # 录制 Playwright trace；同步引擎下 span 同时作为 trace 分组
+        if PW_TRACE:
+            try:
+                yield context.tracing.start(screenshots=True, snapshots=True, title=self.username)
+                self.traced_context = context
+                if self.engine == 'sync':
+                    self.tracer.pw_tracing = context.tracing
+            except Exception as e:
+                self.log(f"启动 Playwright trace 失败: {e}", "WARN")
+
+        # 预加载 Cookie（GH_SESSION 比登录态里的更新时以它为准）
+        if self.gh_session:
+            try:
+                yield context.add_cookies(self.session_cookies())
+                self.log("已加载 Session Cookie", "SUCCESS")
+            except:
+                self.log("加载 Cookie 失败", "WARN")
+
+        return context
+
+    def session_cookies(self):
+        return [
+            {'name': 'user_session', 'value': self.gh_session, 'domain': 'github.com', 'path': '/'},
+            {'name': 'logged_in', 'value': 'yes', 'domain': 'github.com', 'path': '/'}
+        ]
+
+    def context_options(self):
+        """上下文参数：视口、UA、代理和上次保存的登录态"""
+        # 获取代理配置
+        proxy_config = self.proxy.get_playwright_proxy()
+
+        # 创建带代理的上下文
+        context_options = {
+            'viewport': {'width': 1920, 'height': 1080},
+            'user_agent': USER_AGENT
+        }
+
+        if proxy_config:
+            context_options['proxy'] = proxy_config
+            self.log(f"Playwright 使用代理: {proxy_config['server']}", "INFO")
+
+        if HAR_RECORD:
+            context_options['record_har_path'] = self.suffixed(HAR_RECORD)
+
+        # 恢复上次的完整登录态（ClawCloud 未过期时直接进入控制台）
+        if self.state:
+            context_options['storage_state'] = self.state
+            self.log(f"已恢复登录态（{len(self.state.get('cookies', []))} 个 Cookie）", "SUCCESS")
+
+        return context_options
+
+    @step()
+    def fail(self, page, err, shot_name=None):
+        """记录失败截图，返回 (False, 错误信息)"""
+        self.mark_failed_step()
+        if shot_name:
+            yield self.shot(page, shot_name)
+        return False, err
+
+    @step()
+    def save_session(self, context, warn=False):
+        """提取并保存新 Cookie 和登录态"""
+        new = yield self.get_session(context)
+        if new:
+            self.save_cookie(new)
+        elif warn:
+            self.log("未获取到新 Cookie", "WARN")
+        yield self.save_state(context)
+
+    @step()
+    def login_flow(self, page, context):
+        """登录并保活，返回 (成功, 错误信息)"""
+        # 1. 访问 ClawCloud 登录入口
+        self.log("步骤1: 打开 ClawCloud 登录页", "STEP")
+        github_buttons = [
+            'button:has-text("GitHub")',
+            'a:has-text("GitHub")',
+            '[data-provider="github"]'
+        ]
+        # 入口可能要先测各区域延迟（REGION_PROBE），放在 blocking() 里
+        signin_url = yield self.blocking(self.signin_url)
+        with self.tracer.span('goto_signin'):
+            yield page.goto(signin_url, timeout=60000, wait_until='domcontentloaded')
+        # 已登录会被前端跳走，未登录则等到 GitHub 按钮出现
+        yield self.wait_until(page, "登录页", url=self.is_console, selector=', '.join(github_buttons),
+                              timeout=30, budget=2)
+        yield self.report_paint(page)
+        yield self.shot(page, "clawcloud")
+
+        # 检查当前 URL，可能已经自动跳转到区域
+        current_url = page.url
+        self.log(f"当前 URL: {current_url}")
+
+        if self.is_console(current_url):
+            self.log("已登录！", "SUCCESS")
+            # 检测区域
+            self.detect_region(current_url)
+            yield self.keepalive(page)
+            # 提取并保存新 Cookie
+            yield self.save_session(context)
+            return True, ""
+
+        # 2. 点击 GitHub
+        self.log("步骤2: 点击 GitHub", "STEP")
+        if not (yield self.click(page, github_buttons, "GitHub")):
+            self.log("找不到按钮", "ERROR")
+            return (yield self.fail(page, "找不到 GitHub 按钮"))
+
+        yield self.wait_until(page, "跳转 GitHub", url=lambda u: 'github.com' in u or self.is_console(u),
+                              timeout=30, budget=3)
+        yield self.settle(page, "跳转 GitHub_加载")
+        yield self.shot(page, "点击后")
+
+        url = page.url
+        self.log(f"当前: {url}")
+
+        # 3. GitHub 登录
+        self.log("步骤3: GitHub 认证", "STEP")
+
+        if 'github.com/login' in url or 'github.com/session' in url:
+            if not (yield self.login_github(page, context)):
+                return (yield self.fail(page, "GitHub 登录失败", "登录失败"))
+        elif 'github.com/login/oauth/authorize' in url:
+            self.log("Cookie 有效", "SUCCESS")
+            yield self.oauth(page)
+
+        # 4. 等待重定向（会自动检测区域）
+        self.log("步骤4: 等待重定向", "STEP")
+        if not (yield self.wait_redirect(page)):
+            return (yield self.fail(page, "重定向失败", "重定向失败"))
+
+        yield self.shot(page, "重定向成功")
+
+        # 5. 验证
+        self.log("步骤5: 验证", "STEP")
+        current_url = page.url
+        if not self.is_console(current_url):
+            return (yield self.fail(page, "验证失败"))
+
+        # 再次确认区域检测
+        if not self.detected_region:
+            self.detect_region(current_url)
+
+        # 6. 保活（使用检测到的区域 URL）
+        yield self.keepalive(page)
+
+        # 7. 提取并保存新 Cookie
+        self.log("步骤6: 更新 Cookie", "STEP")
+        yield self.save_session(context, warn=True)
+
+        return True, ""
+
+    @traced('fast_path')
+    def try_fast_path(self):
+        """尝试免浏览器快速路径，成功则完成保存 Cookie 和通知"""
+        if not HTTP_FAST_PATH or HAR_RECORD or HAR_REPLAY:  # 录制 / 回放要走完整的浏览器流程
+            return False
+        self.log("尝试免浏览器快速路径", "STEP")
+        try:
+            new = HttpFastPath(self).run()
+        except Exception as e:
+            self.log(f"快速路径异常: {e}", "WARN")
+            new = None
+        if not new:
+            self.log("回退到浏览器流程", "INFO")
+            return False
+
+        self.save_cookie(new)
+        self.flush_secrets()
+        self.record_history(True)
+        self.notify(True)
+        return True
+
+    @step()
+    def run_in_browser(self, browser):
+        """在已启动的浏览器里新建独立上下文完成登录保活，并发送通知"""
+        return (yield self.run_in_context((yield self.new_context(browser))))
+
+    @step()
+    def run_in_context(self, context):
+        """在给定上下文里完成登录保活（结束时关闭上下文），并发送通知"""
+        page = context.pages[0] if context.pages else (yield context.new_page())
+        try:
+            ok, err = yield self.login_flow(page, context)
+        except Exception as e:
+            self.log(f"异常: {e}", "ERROR")
+            yield self.shot(page, "异常")
+            import traceback
+            traceback.print_exc()
+            ok, err = False, str(e)
+            self.mark_failed_step(e)
+        finally:
+            if self.traced_context is context:
+                path = self.suffixed(PW_TRACE)
+                try:
+                    yield context.tracing.stop(path=path)
+                    self.log(f"Playwright trace 已保存: {path}", "INFO")
+                except Exception as e:
+                    self.log(f"保存 Playwright trace 失败: {e}", "WARN")
+                self.traced_context = self.tracer.pw_tracing = None
+            try:
+                yield context.close()
+            except:
+                pass
+            yield self.blocking(self.redact_har)
+
+        yield self.blocking(self.flush_secrets)
+        self.report_waits()
+        if self.policy:
+            self.policy.report(self.log)
+        yield self.blocking(self.record_history, ok, err)
+        self.notify(ok, err)
+        return ok, err
+
+    def redact_har(self):
+        """上下文关闭后 HAR 才写出，原地脱敏；脱敏失败时删掉文件，不留下明文凭据"""
+        if not HAR_RECORD:
+            return
+        path = self.suffixed(HAR_RECORD)
+        if not os.path.exists(path):
+            return
+        try:
+            n = HarArchive(path).redact({self.password: 'password', self.gh_session: 'cookie_user_session'})
+            self.log(f"HAR 已保存（脱敏 {n} 个值）: {path}", "INFO")
+        except Exception as e:
+            os.remove(path)
+            self.log(f"HAR 脱敏失败，已删除: {e}", "WARN")
+
+    def profile_options(self):
+        """持久化配置启动参数：storage_state 不能用于 launch_persistent_context，单独取出 Cookie 恢复"""
+        options = self.context_options()
+        state = options.pop('storage_state', None) or {}
+        return options, state.get('cookies', [])
+
+    def log_launch(self, profile, kind, span):
+        runs = profile.info.get('runs', 0)
+        self.log(f"浏览器{'热' if kind == 'warm' else '冷'}启动（持久化配置，已使用 {runs} 次）: {span['dur']:.2f}s", "INFO")
+
+    @step()
+    def run_profile(self, p, profile):
+        """持久化配置模式：launch_persistent_context 直接得到上下文，关闭后标记配置完好"""
+        kind = profile.prepare()
+        options, cookies = self.profile_options()
+        with self.tracer.span('browser.launch', profile=kind) as span:
+            context = yield p.chromium.launch_persistent_context(profile.path, headless=True, args=BROWSER_ARGS,
+                                                                 **options)
+        self.log_launch(profile, kind, span)
+        if cookies:
+            try:
+                yield context.add_cookies(cookies)
+            except Exception as e:
+                self.log(f"恢复登录态 Cookie 失败: {e}", "WARN")
+        ok, _ = yield self.run_in_context((yield self.setup_context(context)))
+        profile.mark_clean()
+        return ok
+
+    @step()
+    def launch(self, p):
+        """用 Playwright 实例 p 启动浏览器完成登录保活，返回是否成功"""
+        profile = BrowserProfile.open(BROWSER_PROFILE_DIR) if BROWSER_PROFILE_DIR else None
+        if profile:
+            return (yield self.run_profile(p, profile))
+        with self.tracer.span('browser.launch'):
+            browser = yield p.chromium.launch(
+                headless=True,
+                args=BROWSER_ARGS
+            )
+        try:
+            ok, _ = yield self.run_in_browser(browser)
+        finally:
+            yield browser.close()
+        return ok
+
     def run(self):
         print("\n" + "="*50)
         print("🚀 ClawCloud 自动登录")
@@ -930,165 +3295,810 @@ class AutoLogin:
         self.log(f"Session: {'有' if self.gh_session else '无'}")
         self.log(f"密码: {'有' if self.password else '无'}")
         self.log(f"代理: {'Hysteria2' if self.proxy.enabled else '无'}")
-        self.log(f"登录入口: {LOGIN_ENTRY_URL}")
+        self.log(f"登录入口: {f'{self.saved_region}（上次检测到的区域）' if self.saved_region else LOGIN_ENTRY_URL}")
         
         if not self.username or not self.password:
             self.log("缺少凭据", "ERROR")
             self.notify(False, "凭据未配置")
+            self.tg.flush()
             sys.exit(1)
         
-        # 启动代理
+        # 启动代理（HAR 回放不出网，不需要）
+        if HAR_REPLAY:
+            self.log(f"HAR 回放: {self.har.path}（入口 {self.entry_url}）", "INFO")
+            self.proxy.enabled = False
         if self.proxy.enabled:
-            if not self.proxy.start():
+            with self.tracer.span('proxy.start'):
+                started = self.proxy.start()
+            if not started:
                 self.log("代理启动失败，继续尝试直连...", "WARN")
                 self.proxy.enabled = False
         
         try:
-            with sync_playwright() as p:
-                # 配置浏览器启动参数
-                browser_args = ['--no-sandbox', '--disable-blink-features=AutomationControlled']
-                
-                # 获取代理配置
-                proxy_config = self.proxy.get_playwright_proxy()
-                
+            # Session 仍有效时只走 HTTP，不启动浏览器
+            ok = self.try_fast_path() or self.run_browser()
+        finally:
+            # 先把排队的通知发完（可能还要走代理），再停止代理
+            self.tg.flush()
+            self.proxy.stop()
+
+        if not ok:
+            sys.exit(1)
+
+        print("\n" + "="*50)
+        print("✅ 成功！")
+        if self.detected_region:
+            print(f"📍 区域: {self.detected_region}")
+        if self.proxy.enabled:
+            print("🌐 代理: Hysteria2")
+        print("="*50 + "\n")
+
+
+class AutoLogin(LoginFlow):
+    """
+    同步引擎（ENGINE=sync，默认）
+    - 基于 playwright.sync_api：步骤里 yield 出来的调用已经执行完，drive() 把结果原样送回
+    - 等待靠导航事件和短轮询；保活的 API 请求放线程池，页面分批同时发起导航
+    """
+
+    engine = 'sync'
+
+    def drive(self, steps, name=None):
+        """执行一个 @step 生成器，返回它的返回值"""
+        with self.tracer.span(name) if name else nullcontext():
+            value = None
+            try:
+                while True:
+                    value = steps.send(value)
+            except StopIteration as e:
+                return e.value
+
+    def blocking(self, fn, *args):
+        """阻塞调用（HTTP、文件），同步引擎里直接执行"""
+        return fn(*args)
+
+    def wait_until(self, page, step, url=None, selector=None, timeout=30, budget=0, record=True, cancel=None):
+        """
+        事件驱动等待，条件成立立即返回，替代固定 sleep + networkidle
+        - url: 以当前地址为参数的判断函数，基于导航事件（wait_for_url）
+        - selector: 元素可见即成立；两次检查之间等待导航事件，最多 0.25 秒
+        - budget: 旧实现在这一步的固定等待秒数，仅用于统计对比
+        - record: 是否记入等待统计（分片轮询时由调用方统一记录）
+        - cancel: 可选的 UpdateWaiter，收到匹配的 Telegram 消息即成立（不取出消息），检查方式同 selector
+        返回命中的条件 'url' / 'selector' / 'cancel'，超时返回 None
+        """
+        with self.tracer.span(f"wait:{step}") as span:
+            hit = self._wait_until(page, url, selector, cancel, time.time() + timeout)
+        if record:
+            self.record_wait(step, span['start'], budget, hit is not None)
+        return hit
+
+    def _wait_until(self, page, url, selector, cancel, deadline):
+        hit = None
+        while not page.is_closed():
+            if url and url(page.url):
+                hit = 'url'
+                break
+            if selector:
+                try:
+                    if self.visible(page, selector).first.is_visible():
+                        hit = 'selector'
+                        break
+                except:
+                    pass
+            if cancel and cancel.pending():
+                hit = 'cancel'
+                break
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                break
+            try:
+                if selector or cancel or not url:
+                    page.wait_for_event('framenavigated', timeout=min(remaining, 0.25) * 1000)
+                else:
+                    page.wait_for_url(url, timeout=remaining * 1000, wait_until='commit')
+            except:
+                pass
+        return hit
+
+    def visit_keepalive(self, page, targets):
+        """API 地址在线程池里并发请求；页面每批最多 KEEPALIVE_CONCURRENCY 个标签页同时加载"""
+        apis = [(name, url, page.context.cookies(url)) for name, url, api in targets if api]
+        pages = [(name, url) for name, url, api in targets if not api]
+        results = []
+        with ThreadPoolExecutor(max_workers=KEEPALIVE_CONCURRENCY) as pool:
+            pending = [pool.submit(self.keepalive_api, *target) for target in apis]
+            for i in range(0, len(pages), KEEPALIVE_CONCURRENCY):
+                results += self.keepalive_pages(page, pages[i:i + KEEPALIVE_CONCURRENCY], reuse=i == 0)
+            results += [future.result() for future in pending]
+        return results
+
+    def keepalive_pages(self, page, batch, reuse):
+        """一批页面先全部发起导航，再逐个等加载完成，浏览器里同时加载"""
+        started = []
+        for j, (name, url) in enumerate(batch):
+            tab = page if reuse and j == 0 else page.context.new_page()
+            start = time.time()
+            try:
+                started.append((tab, name, url, start, tab.goto(url, timeout=30000, wait_until='commit')))
+            except Exception as e:
+                started.append((tab, name, url, start, e))
+        return [self.keepalive_visit(page, *visit) for visit in started]
+
+    def run_browser(self):
+        """启动浏览器完成登录保活，返回是否成功"""
+        with sync_playwright() as p:
+            return self.launch(p)
+
+
+async def first_completed(waits, timeout):
+    """
+    同时等待多个协程，返回最先正常完成的那个的名字（同时完成时按 waits 的顺序）
+    超时或全部失败返回 None；返回前取消其余协程
+    """
+    tasks = {asyncio.ensure_future(coro): name for name, coro in waits.items()}
+    pending = set(tasks)
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + max(timeout, 0)
+    hit = None
+    try:
+        while pending and hit is None:
+            done, pending = await asyncio.wait(pending, timeout=max(deadline - loop.time(), 0),
+                                               return_when=asyncio.FIRST_COMPLETED)
+            if not done:
+                break
+            for task in tasks:
+                if task in done and not task.cancelled() and task.exception() is None:
+                    hit = tasks[task]
+                    break
+    finally:
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+        # 同一批完成、没轮到检查的失败协程也要取走异常，否则退出时报 "Task exception was never retrieved"
+        for task in tasks:
+            if task.done() and not task.cancelled():
+                task.exception()
+    return hit
+
+
+class AsyncAutoLogin(LoginFlow):
+    """
+    asyncio 引擎（ENGINE=async）
+    - 基于 playwright.async_api，步骤与 AutoLogin 共用（LoginFlow），drive() 逐个 await 步骤 yield 出来的协程
+    - 每次等待同时挂上页面导航、元素出现、Telegram 指令和代理中断，先发生的先处理
+    - 等人工批准时页面也在监视：例如等 /code 期间在手机上批准了，页面一跳转就继续
+    - 多账号时所有账号在同一个事件循环里并发（AsyncFleetRunner）
+    Secret 更新、快速路径等阻塞的 HTTP 调用放到线程里执行
+    """
+
+    engine = 'async'
+
+    async def drive(self, steps, name=None):
+        """执行一个 @step 生成器：yield 出来的可等待对象逐个 await，异常抛回生成器里，由步骤自己的 try 处理"""
+        with self.tracer.span(name) if name else nullcontext():
+            value, error = None, None
+            while True:
+                try:
+                    op = steps.throw(error) if error is not None else steps.send(value)
+                except StopIteration as e:
+                    return e.value
+                value, error = op, None
+                if hasattr(op, '__await__'):
+                    try:
+                        value = await op
+                    except BaseException as e:
+                        value, error = None, e
+
+    def blocking(self, fn, *args):
+        """阻塞调用（HTTP、文件）放到线程里"""
+        return asyncio.to_thread(fn, *args)
+
+    async def wait_until(self, page, step, url=None, selector=None, timeout=30, budget=0, record=True, cancel=None):
+        """
+        同时等待以下条件，返回最先发生的 'url' / 'selector' / 'cancel' / 'proxy'，超时返回 None
+        - url: 以当前地址为参数的判断函数（导航事件）
+        - selector: 元素可见
+        - cancel: UpdateWaiter，收到匹配的 Telegram 消息即成立（不取出消息）
+        - 代理：当前节点退出且没有备用节点可切换
+        """
+        ms = max(timeout, 0) * 1000
+        waits = {}
+        if url:
+            waits['url'] = page.wait_for_url(url, timeout=ms, wait_until='commit')
+        if selector:
+            waits['selector'] = self.visible(page, selector).first.wait_for(state='visible', timeout=ms)
+        if cancel:
+            waits['cancel'] = self.until_message(cancel)
+        if self.proxy.enabled:
+            waits['proxy'] = self.until_proxy_lost()
+        with self.tracer.span(f"wait:{step}") as span:
+            hit = await first_completed(waits, timeout)
+        if hit == 'proxy':
+            self.log("代理隧道已中断，且没有可切换的备用节点", "ERROR")
+        if record:
+            self.record_wait(step, span['start'], budget, hit not in (None, 'proxy'))
+        return hit
+
+    async def until_message(self, waiter):
+        """waiter 收到消息时返回；消费者线程通过回调唤醒事件循环"""
+        loop = asyncio.get_running_loop()
+        event = asyncio.Event()
+
+        def wake():
+            loop.call_soon_threadsafe(event.set)
+
+        waiter.callbacks.append(wake)
+        try:
+            while not waiter.pending():
+                await event.wait()
+                event.clear()
+        finally:
+            waiter.callbacks.remove(wake)
+
+    async def until_proxy_lost(self):
+        while not self.proxy.lost.is_set():
+            await asyncio.sleep(0.5)
+
+    async def visit_keepalive(self, page, targets):
+        """所有地址同时发起，最多 KEEPALIVE_CONCURRENCY 个在途；API 请求放到线程里"""
+        limit = asyncio.Semaphore(KEEPALIVE_CONCURRENCY)
+
+        async def visit_api(name, url):
+            cookies = await page.context.cookies(url)
+            async with limit:
+                return await asyncio.to_thread(self.keepalive_api, name, url, cookies)
+
+        async def visit_page(name, url, first):
+            async with limit:
+                tab = page if first else await page.context.new_page()
+                start = time.time()
+                try:
+                    response = await tab.goto(url, timeout=30000, wait_until='commit')
+                except Exception as e:
+                    response = e
+                return await self.keepalive_visit(page, tab, name, url, start, response)
+
+        first = next((i for i, (_, _, api) in enumerate(targets) if not api), None)
+        return list(await asyncio.gather(*(visit_api(name, url) if api else visit_page(name, url, i == first)
+                                           for i, (name, url, api) in enumerate(targets))))
+
+    async def _run_browser(self):
+        async with async_playwright() as p:
+            return await self.launch(p)
+
+    def run_browser(self):
+        return asyncio.run(self._run_browser())
+
+
+class FleetRunner:
+    """
+    多账号模式
+    - 只启动一个 Chromium（开放 CDP 端口）和一个 Hysteria2 代理
+    - FLEET_CONCURRENCY 个工作线程各自通过 CDP 连接，每个账号一个独立 context
+    - 每个账号单独通知、单独更新自己的 Cookie Secret
+    """
+
+    def __init__(self, accounts):
+        self.accounts = accounts
+        self.tracer = Tracer(account='fleet')
+        self.proxy = Hysteria2Proxy()
+        self.tg = Telegram(proxy=self.proxy, tracer=self.tracer)
+        self.secret = SecretUpdater(self.tg.routes)
+        self.selectors = SelectorCache()
+        self.results = []
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def load_accounts():
+        """
+        从 ACCOUNTS 读取账号列表，格式:
+        [{"username": "...", "password": "...", "session": "..."}, ...]
+        session 可省略，此时读取 GH_SESSION_<后缀>（后缀默认为大写用户名），登录态读取 CLAW_STATE_<后缀>；
+        totp（TOTP 密钥）可省略，此时读取 GH_TOTP_SECRET_<后缀>；region 可省略，此时读取 CLAW_REGION_<后缀>
+        """
+        raw = os.environ.get('ACCOUNTS', '').strip()
+        if not raw:
+            return []
+        try:
+            items = json.loads(raw)
+        except Exception as e:
+            print(f"❌ 解析 ACCOUNTS 失败: {e}")
+            return []
+        if not isinstance(items, list):
+            print(f"❌ ACCOUNTS 格式错误: 应为 JSON 数组 [{{\"username\": ...}}, ...]，实际是 {type(items).__name__}")
+            return []
+
+        accounts = []
+        for i, item in enumerate(items):
+            if not isinstance(item, dict):
+                print(f"❌ ACCOUNTS 格式错误: 第 {i + 1} 项应为对象 {{\"username\": ..., \"password\": ...}}，已跳过")
+                continue
+            username = item.get('username')
+            if not username:
+                continue
+            suffix = item.get('secret_suffix') or re.sub(r'\W', '_', username).upper()
+            accounts.append({
+                'username': username,
+                'password': item.get('password'),
+                'session': item.get('session') or os.environ.get(f'GH_SESSION_{suffix}', ''),
+                'state': os.environ.get(f'CLAW_STATE_{suffix}', ''),
+                'totp': item.get('totp') or os.environ.get(f'GH_TOTP_SECRET_{suffix}', ''),
+                'region': item.get('region') or os.environ.get(f'CLAW_REGION_{suffix}', ''),
+                'secret_suffix': suffix,
+                'tag': username,
+                # 各 Secret 的当前值（ACCOUNTS 里直接写的 session / region 不是 Secret 的内容，不算）
+                'loaded': {name: os.environ.get(name, '') for name in
+                           (f'GH_SESSION_{suffix}', f'CLAW_STATE_{suffix}', f'CLAW_REGION_{suffix}')},
+            })
+        return accounts
+
+    def worker(self, jobs):
+        """工作线程：自己的 Playwright 实例，通过 CDP 连接共享的 Chromium"""
+        with sync_playwright() as p:
+            browser = p.chromium.connect_over_cdp(f"http://127.0.0.1:{FLEET_CDP_PORT}")
+            try:
+                while True:
+                    try:
+                        account = jobs.get_nowait()
+                    except queue.Empty:
+                        return
+                    self.run_account(browser, account)
+            finally:
+                browser.close()
+
+    def run_account(self, browser, account):
+        bot = AutoLogin(account, proxy=self.proxy, tg=self.tg, secret=self.secret,
+                        selectors=self.selectors)
+        start = time.time()
+        if not bot.username or not bot.password:
+            bot.log("缺少凭据", "ERROR")
+            ok, err = False, "凭据未配置"
+        else:
+            try:
+                if bot.try_fast_path():
+                    ok, err = True, ""
+                else:
+                    ok, err = bot.run_in_browser(browser)
+            except Exception as e:
+                ok, err = False, str(e)
+        self.record(bot, ok, err, start)
+        return bot
+
+    def record(self, bot, ok, err, start):
+        with self.lock:
+            self.results.append({
+                'username': bot.username,
+                'ok': ok,
+                'err': err,
+                'region': bot.detected_region,
+                'elapsed': time.time() - start,
+            })
+
+    def run_all(self):
+        """启动共享 Chromium，工作线程通过 CDP 连接后逐个处理账号"""
+        jobs = queue.Queue()
+        for account in self.accounts:
+            jobs.put(account)
+
+        with sync_playwright() as p:
+            with self.tracer.span('browser.launch'):
                 browser = p.chromium.launch(
                     headless=True,
-                    args=browser_args
+                    args=BROWSER_ARGS + [f'--remote-debugging-port={FLEET_CDP_PORT}']
                 )
-                
-                # 创建带代理的上下文
-                context_options = {
-                    'viewport': {'width': 1920, 'height': 1080},
-                    'user_agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36'
-                }
-                
-                if proxy_config:
-                    context_options['proxy'] = proxy_config
-                    self.log(f"Playwright 使用代理: {proxy_config['server']}", "INFO")
-                
-                context = browser.new_context(**context_options)
-                page = context.new_page()
-                
+            try:
+                workers = [
+                    threading.Thread(target=self.worker, args=(jobs,), daemon=True)
+                    for _ in range(max(1, min(FLEET_CONCURRENCY, len(self.accounts))))
+                ]
+                for t in workers:
+                    t.start()
+                for t in workers:
+                    t.join()
+            finally:
+                browser.close()
+
+    def run(self):
+        print("\n" + "="*50)
+        print(f"🚀 ClawCloud 多账号自动登录（{len(self.accounts)} 个账号，并发 {FLEET_CONCURRENCY}）")
+        print("="*50 + "\n")
+
+        if BROWSER_PROFILE_DIR:
+            print("ℹ️ 多账号模式每个账号使用独立上下文，不使用 BROWSER_PROFILE_DIR")
+
+        if self.proxy.enabled:
+            with self.tracer.span('proxy.start'):
+                started = self.proxy.start()
+            if not started:
+                print("⚠️ 代理启动失败，继续尝试直连...")
+                self.proxy.enabled = False
+
+        start = time.time()
+        try:
+            self.run_all()
+
+            # 没被处理到的账号（工作线程异常退出）也要记录
+            done = {r['username'] for r in self.results}
+            for account in self.accounts:
+                if account['username'] not in done:
+                    self.results.append({'username': account['username'], 'ok': False, 'err': '未执行', 'region': None, 'elapsed': 0})
+
+            self.summary(time.time() - start)
+        finally:
+            self.tg.flush()
+            self.proxy.stop()
+
+        if not all(r['ok'] for r in self.results):
+            sys.exit(1)
+
+    def summary(self, elapsed):
+        ok_count = sum(1 for r in self.results if r['ok'])
+        lines = [f"{'✅' if r['ok'] else '❌'} {r['username']} ({r['elapsed']:.0f}s)"
+                 + (f" {r['region']}" if r['region'] else "")
+                 + (f" - {r['err']}" if r['err'] else "")
+                 for r in self.results]
+        print("\n" + "="*50)
+        print(f"📊 完成 {ok_count}/{len(self.results)}，总耗时 {elapsed:.0f}s")
+        for line in lines:
+            print(f"  {line}")
+        print("="*50 + "\n")
+
+        self.tg.send(f"""<b>🤖 ClawCloud 多账号保活</b>
+
+<b>成功:</b> {ok_count}/{len(self.results)}
+<b>耗时:</b> {elapsed:.0f}s
+<b>时间:</b> {time.strftime('%Y-%m-%d %H:%M:%S')}
+
+""" + "\n".join(lines))
+
+
+class AsyncFleetRunner(FleetRunner):
+    """
+    asyncio 多账号模式（ENGINE=async）
+    - 一个 Chromium、一个事件循环，每个账号一个协程和独立 context，不需要 CDP 和工作线程
+    - 信号量限制同时进行的账号数（FLEET_CONCURRENCY）
+    """
+
+    def run_all(self):
+        asyncio.run(self._run_all())
+
+    async def _run_all(self):
+        limit = asyncio.Semaphore(max(1, FLEET_CONCURRENCY))
+        async with async_playwright() as p:
+            with self.tracer.span('browser.launch'):
+                browser = await p.chromium.launch(headless=True, args=BROWSER_ARGS)
+            try:
+                await asyncio.gather(*(self.run_account_async(browser, a, limit) for a in self.accounts))
+            finally:
+                await browser.close()
+
+    async def run_account_async(self, browser, account, limit):
+        async with limit:
+            bot = AsyncAutoLogin(account, proxy=self.proxy, tg=self.tg, secret=self.secret,
+                                 selectors=self.selectors)
+            start = time.time()
+            if not bot.username or not bot.password:
+                bot.log("缺少凭据", "ERROR")
+                ok, err = False, "凭据未配置"
+            else:
                 try:
-                    # 预加载 Cookie
-                    if self.gh_session:
-                        try:
-                            context.add_cookies([
-                                {'name': 'user_session', 'value': self.gh_session, 'domain': 'github.com', 'path': '/'},
-                                {'name': 'logged_in', 'value': 'yes', 'domain': 'github.com', 'path': '/'}
-                            ])
-                            self.log("已加载 Session Cookie", "SUCCESS")
-                        except:
-                            self.log("加载 Cookie 失败", "WARN")
-                    
-                    # 1. 访问 ClawCloud 登录入口
-                    self.log("步骤1: 打开 ClawCloud 登录页", "STEP")
-                    page.goto(SIGNIN_URL, timeout=60000)
-                    page.wait_for_load_state('networkidle', timeout=30000)
-                    time.sleep(2)
-                    self.shot(page, "clawcloud")
-                    
-                    # 检查当前 URL，可能已经自动跳转到区域
-                    current_url = page.url
-                    self.log(f"当前 URL: {current_url}")
-                    
-                    if 'signin' not in current_url.lower() and 'claw.cloud' in current_url:
-                        self.log("已登录！", "SUCCESS")
-                        # 检测区域
-                        self.detect_region(current_url)
-                        self.keepalive(page)
-                        # 提取并保存新 Cookie
-                        new = self.get_session(context)
-                        if new:
-                            self.save_cookie(new)
-                        self.notify(True)
-                        print("\n✅ 成功！\n")
-                        return
-                    
-                    # 2. 点击 GitHub
-                    self.log("步骤2: 点击 GitHub", "STEP")
-                    if not self.click(page, [
-                        'button:has-text("GitHub")',
-                        'a:has-text("GitHub")',
-                        '[data-provider="github"]'
-                    ], "GitHub"):
-                        self.log("找不到按钮", "ERROR")
-                        self.notify(False, "找不到 GitHub 按钮")
-                        sys.exit(1)
-                    
-                    time.sleep(3)
-                    page.wait_for_load_state('networkidle', timeout=30000)
-                    self.shot(page, "点击后")
-                    
-                    url = page.url
-                    self.log(f"当前: {url}")
-                    
-                    # 3. GitHub 登录
-                    self.log("步骤3: GitHub 认证", "STEP")
-                    
-                    if 'github.com/login' in url or 'github.com/session' in url:
-                        if not self.login_github(page, context):
-                            self.shot(page, "登录失败")
-                            self.notify(False, "GitHub 登录失败")
-                            sys.exit(1)
-                    elif 'github.com/login/oauth/authorize' in url:
-                        self.log("Cookie 有效", "SUCCESS")
-                        self.oauth(page)
-                    
-                    # 4. 等待重定向（会自动检测区域）
-                    self.log("步骤4: 等待重定向", "STEP")
-                    if not self.wait_redirect(page):
-                        self.shot(page, "重定向失败")
-                        self.notify(False, "重定向失败")
-                        sys.exit(1)
-                    
-                    self.shot(page, "重定向成功")
-                    
-                    # 5. 验证
-                    self.log("步骤5: 验证", "STEP")
-                    current_url = page.url
-                    if 'claw.cloud' not in current_url or 'signin' in current_url.lower():
-                        self.notify(False, "验证失败")
-                        sys.exit(1)
-                    
-                    # 再次确认区域检测
-                    if not self.detected_region:
-                        self.detect_region(current_url)
-                    
-                    # 6. 保活（使用检测到的区域 URL）
-                    self.keepalive(page)
-                    
-                    # 7. 提取并保存新 Cookie
-                    self.log("步骤6: 更新 Cookie", "STEP")
-                    new = self.get_session(context)
-                    if new:
-                        self.save_cookie(new)
+                    if await asyncio.to_thread(bot.try_fast_path):
+                        ok, err = True, ""
                     else:
-                        self.log("未获取到新 Cookie", "WARN")
-                    
-                    self.notify(True)
-                    print("\n" + "="*50)
-                    print("✅ 成功！")
-                    if self.detected_region:
-                        print(f"📍 区域: {self.detected_region}")
-                    if self.proxy.enabled:
-                        print("🌐 代理: Hysteria2")
-                    print("="*50 + "\n")
-                    
+                        ok, err = await bot.run_in_browser(browser)
                 except Exception as e:
-                    self.log(f"异常: {e}", "ERROR")
-                    self.shot(page, "异常")
-                    import traceback
-                    traceback.print_exc()
-                    self.notify(False, str(e))
-                    sys.exit(1)
-                finally:
-                    browser.close()
-        
+                    ok, err = False, str(e)
+            self.record(bot, ok, err, start)
+
+
+class Daemon(FleetRunner):
+    """
+    常驻模式（自建服务器用）
+    - 一个 Hysteria2 代理和一个 Chromium 常驻，每次保活只新建一个上下文，省掉冷启动
+    - 每个账号独立排期：DAEMON_INTERVAL ± DAEMON_JITTER 秒，按到期先后逐个运行
+    - 浏览器跑满 DAEMON_RECYCLE_RUNS 次或内存超过 DAEMON_RECYCLE_RSS MB 时重启；代理节点全部失效时重启代理
+    - 新的 Cookie / 登录态 / 区域同时留在内存里，下一轮直接使用
+    - SIGTERM / SIGINT：跑完当前账号后关闭浏览器和代理退出
+    """
+
+    def __init__(self, accounts):
+        super().__init__(accounts)
+        self.results = deque(maxlen=100)
+        self.stop_event = threading.Event()
+        self.due = {a['username']: time.time() + random.uniform(0, DAEMON_JITTER) for a in accounts}
+        self.use_proxy = self.proxy.enabled
+        self.browser = None
+        self.browser_runs = 0
+
+    def shutdown(self, signum, frame):
+        print(f"\n🛑 收到信号 {signum}，当前账号完成后退出")
+        self.stop_event.set()
+
+    def schedule(self, account):
+        delay = max(60, DAEMON_INTERVAL + random.uniform(-DAEMON_JITTER, DAEMON_JITTER))
+        self.due[account['username']] = time.time() + delay
+        print(f"⏰ {account['username']} 下次保活: {time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(time.time() + delay))}")
+
+    @staticmethod
+    def browser_rss():
+        """本进程派生的 Chromium 进程总常驻内存（MB），读取 /proc，非 Linux 返回 None"""
+        try:
+            parents, names = {}, {}
+            for pid in os.listdir('/proc'):
+                if not pid.isdigit():
+                    continue
+                try:
+                    with open(f'/proc/{pid}/stat') as f:
+                        head, rest = f.read().rsplit(')', 1)
+                    names[int(pid)] = head.split('(', 1)[1]
+                    parents[int(pid)] = int(rest.split()[1])
+                except (OSError, IndexError, ValueError):
+                    continue
+        except OSError:
+            return None
+
+        total = 0
+        todo = [os.getpid()]
+        while todo:
+            parent = todo.pop()
+            for pid, ppid in parents.items():
+                if ppid != parent:
+                    continue
+                todo.append(pid)
+                if 'chrom' in names[pid]:
+                    try:
+                        with open(f'/proc/{pid}/statm') as f:
+                            total += int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+                    except (OSError, IndexError, ValueError):
+                        pass
+        return total / 1024 / 1024
+
+    def recycle_reason(self):
+        """需要（重新）启动浏览器的原因，不需要时返回 None"""
+        if not self.browser or not self.browser.is_connected():
+            return "浏览器未运行"
+        if DAEMON_RECYCLE_RUNS and self.browser_runs >= DAEMON_RECYCLE_RUNS:
+            return f"已运行 {self.browser_runs} 次"
+        rss = self.browser_rss()
+        if DAEMON_RECYCLE_RSS and rss and rss > DAEMON_RECYCLE_RSS:
+            return f"内存 {rss:.0f}MB"
+        return None
+
+    def close_browser(self):
+        if self.browser:
+            try:
+                self.browser.close()
+            except:
+                pass
+            self.browser = None
+
+    def cycle(self, p, account):
+        """保活一个账号：按需重启浏览器 / 代理，跑完后把最新登录信息留在内存并排下一次"""
+        reason = self.recycle_reason()
+        if reason:
+            if self.browser:
+                print(f"♻️ 重启浏览器（{reason}）")
+            self.close_browser()
+            with self.tracer.span('browser.launch'):
+                self.browser = p.chromium.launch(headless=True, args=BROWSER_ARGS)
+            self.browser_runs = 0
+
+        if self.use_proxy and (not self.proxy.enabled or self.proxy.lost.is_set()):
+            print("♻️ 代理不可用，重新启动")
+            with self.tracer.span('proxy.start'):
+                if not self.proxy.restart():
+                    print("⚠️ 代理重启失败，本轮直连")
+
+        bot = self.run_account(self.browser, account)
+        self.browser_runs += 1
+        account.update(session=bot.gh_session, state=bot.state_raw, region=bot.saved_region)
+        result = self.results[-1]
+        print(f"{'✅' if result['ok'] else '❌'} {account['username']} 本轮 {result['elapsed']:.1f}s"
+              + (f" - {result['err']}" if result['err'] else ""))
+        self.schedule(account)
+
+    def run(self):
+        print("\n" + "="*50)
+        print(f"🚀 ClawCloud 常驻模式（{len(self.accounts)} 个账号，间隔 {DAEMON_INTERVAL / 3600:.1f}h ± {DAEMON_JITTER / 60:.0f}min）")
+        print("="*50 + "\n")
+
+        self.accounts = [a for a in self.accounts if a.get('username') and a.get('password')]
+        if not self.accounts:
+            print("❌ 没有配置凭据完整的账号")
+            sys.exit(1)
+        if ENGINE == 'async' or BROWSER_PROFILE_DIR:
+            print("ℹ️ 常驻模式使用同步引擎和独立上下文，忽略 ENGINE / BROWSER_PROFILE_DIR")
+
+        signal.signal(signal.SIGTERM, self.shutdown)
+        signal.signal(signal.SIGINT, self.shutdown)
+
+        if self.proxy.enabled:
+            with self.tracer.span('proxy.start'):
+                started = self.proxy.start()
+            if not started:
+                print("⚠️ 代理启动失败，稍后重试，先直连...")
+                self.proxy.enabled = False
+
+        try:
+            with sync_playwright() as p:
+                while not self.stop_event.is_set():
+                    account = min(self.accounts, key=lambda a: self.due[a['username']])
+                    wait = self.due[account['username']] - time.time()
+                    if wait > 0:
+                        self.stop_event.wait(wait)
+                        continue
+                    self.cycle(p, account)
+                self.close_browser()
         finally:
-            # 停止代理
+            self.tg.flush()
             self.proxy.stop()
+        print("👋 常驻模式已退出")
+
+
+class Preflight:
+    """
+    不启动浏览器的配置检查（`auto_login.py check`）
+    - 凭据、ACCOUNTS、TOTP 密钥、PROXY_HY2 解析、依赖是否安装都在本地检查
+    - Telegram Bot Token 和 REPO_TOKEN 直连各发一个请求（与本地检查并行，连接和读取各 CHECK_TIMEOUT 秒超时）
+    - 不导入 Playwright
+    """
+
+    CHECK_TIMEOUT = 3
+
+    def credentials(self):
+        results = []
+        accounts = []
+        if os.environ.get('ACCOUNTS', '').strip():
+            # load_accounts() 把格式错误打印出来，这里改成检查结果
+            with redirect_stdout(io.StringIO()) as out:
+                accounts = FleetRunner.load_accounts()
+            results += [('❌', "ACCOUNTS", line.removeprefix('❌ ')) for line in out.getvalue().splitlines() if line]
+            if not accounts and not results:
+                results.append(('❌', "ACCOUNTS", "不是有效的账号列表"))
+        for account in accounts or [AutoLogin.env_account()]:
+            name = account.get('username') or 'GH_USERNAME'
+            missing = [k for k in ('username', 'password') if not account.get(k)]
+            if missing:
+                results.append(('❌', name, f"缺少 {'、'.join(missing)}"))
+                continue
+            extras = [label for key, label in (('session', "Cookie"), ('state', "登录态"), ('region', "区域"))
+                      if (account.get(key) or '').strip()]
+            detail = f"已保存 {'、'.join(extras)}" if extras else "首次运行，需要完整登录"
+            level = '✅'
+            if (account.get('totp') or '').strip():
+                try:
+                    Totp(account['totp'].strip())
+                    detail += "，TOTP 密钥有效"
+                except Exception as e:
+                    level, detail = '❌', f"TOTP 密钥无效: {e}"
+            region = (account.get('region') or '').strip()
+            if region and not REGION_RE.match(region):
+                level, detail = '⚠️', f"区域 {region} 无效，将使用默认入口"
+            results.append((level, name, detail))
+        return results
+
+    def proxy(self):
+        urls = [u for u in re.split(r'[\s;]+', os.environ.get('PROXY_HY2', '').strip()) if u]
+        if not urls:
+            return [('⚠️', "PROXY_HY2", "未配置，将直接连接（可能过不了人机验证）")]
+        results = []
+        with redirect_stdout(io.StringIO()):
+            proxy = Hysteria2Proxy()
+            configs = [proxy.parse_url(url) for url in urls]
+        for url, config in zip(urls, configs):
+            label = url.rsplit('#', 1)[1] if '#' in url else "PROXY_HY2"
+            results.append(('✅', label, config['server']) if config else ('❌', label, "无法解析"))
+        if not shutil.which('hysteria'):
+            results.append(('❌', "hysteria", "找不到 hysteria 命令"))
+        return results
+
+    def dependencies(self):
+        missing = [name for name in ('requests', 'playwright', 'nacl', 'socks')
+                   if importlib.util.find_spec(name) is None]
+        results = [('❌', "依赖", f"未安装: {', '.join(missing)}") if missing
+                   else ('✅', "依赖", "requests、playwright、pynacl、pysocks 已安装")]
+        if importlib.util.find_spec('yaml') is None:
+            # 没有 PyYAML 时 Hysteria2 配置改写成 JSON，不影响运行
+            results.append(('⚠️', "pyyaml", "未安装，Hysteria2 配置使用 JSON 格式"))
+        return results
+
+    def telegram(self):
+        token, chat_id = os.environ.get('TG_BOT_TOKEN'), os.environ.get('TG_CHAT_ID')
+        if not (token and chat_id):
+            return [('⚠️', "Telegram", "未配置 TG_BOT_TOKEN / TG_CHAT_ID，收不到通知，也不能用 /code")]
+        try:
+            r = requests.get(f"{TG_API_BASE}/bot{token}/getMe", timeout=self.CHECK_TIMEOUT)
+            data = r.json()
+        except Exception as e:
+            return [('⚠️', "Telegram", f"连接失败（运行时会走代理）: {e}")]
+        if not data.get('ok'):
+            return [('❌', "Telegram", f"Token 无效: {data.get('description', r.status_code)}")]
+        return [('✅', "Telegram", f"@{data['result'].get('username')}")]
+
+    def github(self):
+        token, repo = os.environ.get('REPO_TOKEN'), os.environ.get('GITHUB_REPOSITORY')
+        if not (token and repo):
+            return [('⚠️', "REPO_TOKEN", "未配置 REPO_TOKEN / GITHUB_REPOSITORY，Cookie 不会自动更新")]
+        try:
+            r = requests.get(f"{GITHUB_API_URL}/repos/{repo}/actions/secrets/public-key", timeout=self.CHECK_TIMEOUT,
+                             headers={"Authorization": f"token {token}", "Accept": "application/vnd.github.v3+json"})
+        except Exception as e:
+            return [('⚠️', "REPO_TOKEN", f"连接失败: {e}")]
+        if r.status_code != 200:
+            return [('❌', "REPO_TOKEN", f"无法读取 {repo} 的 Secret 公钥（HTTP {r.status_code}），检查 repo 权限")]
+        return [('✅', "REPO_TOKEN", f"可写入 {repo} 的 Secret")]
+
+    def run(self):
+        start = time.perf_counter()
+        checks = [self.credentials, self.proxy, self.dependencies, self.telegram, self.github]
+        with ThreadPoolExecutor(max_workers=len(checks)) as pool:
+            futures = [pool.submit(check) for check in checks]
+        results = []
+        for check, future in zip(checks, futures):
+            try:
+                results += future.result()
+            except Exception as e:
+                results.append(('❌', check.__name__, f"检查异常: {e}"))
+        for level, item, detail in results:
+            print(f"{level} {item}: {detail}")
+        failed = sum(1 for level, _, _ in results if level == '❌')
+        print(f"\n{'❌ ' + str(failed) + ' 项未通过' if failed else '✅ 检查通过'}（{(time.perf_counter() - start) * 1000:.0f}ms）")
+        return 1 if failed else 0
+
+
+def report_startup(loaded):
+    """脚本加载耗时和按需导入的模块耗时"""
+    imports = "，".join(f"{name} {sec * 1000:.0f}ms" for name, sec in IMPORT_TIMES.items())
+    print(f"⏱ 启动 {loaded * 1000:.0f}ms" + (f"，按需导入: {imports}" if imports else ""))
+
+
+def main(argv=None):
+    """
+    命令行入口
+      run（默认）  单账号或 ACCOUNTS 多账号运行一次
+      daemon       常驻模式
+      history      查询运行历史
+      check        不启动浏览器的配置检查
+    """
+    import argparse
+    loaded = time.perf_counter() - STARTED_AT
+    parser = argparse.ArgumentParser(prog="auto_login.py", description="ClawCloud 自动登录保活")
+    commands = parser.add_subparsers(dest='command')
+    commands.add_parser('run', help="运行一次（默认）")
+    commands.add_parser('daemon', help="常驻模式：代理和浏览器常驻，按账号定时保活")
+    commands.add_parser('check', help="检查凭据、代理、依赖、Telegram 和 REPO_TOKEN，不启动浏览器")
+    history = commands.add_parser('history', help="运行历史：各步骤耗时百分位和耗时回归")
+    history.add_argument('--days', type=float, default=7, help="时间窗口（天），默认 7")
+    history.add_argument('--account', help="只看某个账号")
+    history.add_argument('--threshold', type=float, default=0.5, help="比基线中位数慢多少算回归，默认 0.5（50%%）")
+    history.add_argument('--baseline', type=int, default=20, help="滚动基线取之前多少次运行，默认 20")
+    history.add_argument('--db', default=HISTORY_DB or "history.db", help="数据库路径（默认 HISTORY_DB）")
+    args = parser.parse_args(sys.argv[1:] if argv is None else argv)
+
+    if args.command == 'check':
+        report_startup(loaded)
+        return Preflight().run()
+    if args.command == 'history':
+        if not os.path.exists(args.db):
+            print(f"ℹ️ 没有运行历史: {args.db}")
+            return 0
+        return History(args.db).report(args.days, args.account, args.threshold, args.baseline)
+
+    report_startup(loaded)
+    try:
+        accounts = FleetRunner.load_accounts()
+        if args.command == 'daemon':
+            Daemon(accounts or [AutoLogin.env_account()]).run()
+        elif accounts:
+            (AsyncFleetRunner if ENGINE == 'async' else FleetRunner)(accounts).run()
+        else:
+            (AsyncAutoLogin if ENGINE == 'async' else AutoLogin)().run()
+    finally:
+        if IMPORT_TIMES:
+            print("⏱ 导入耗时: " + "，".join(f"{name} {sec * 1000:.0f}ms" for name, sec in IMPORT_TIMES.items()))
+    return 0
 
 
 if __name__ == "__main__":
-    AutoLogin().run()
+    sys.exit(main())
@@ -0,0 +1 @@
+"""离线基准测试用的本地替身（ClawCloud、GitHub、Telegram、GitHub API、Hysteria2）"""
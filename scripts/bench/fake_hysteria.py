@@ -0,0 +1,144 @@
+"""
+假的 hysteria 可执行文件（基准测试用）
+用法与真实客户端相同：hysteria client -c config.yaml
+- 按配置监听 socks5.listen / http.listen，直接转发到目标地址（不加密、不出网）
+- FAKE_HY2_DELAY 秒后打印 "connected to server"，模拟握手耗时
+"""
+
+import os
+import sys
+import json
+import time
+import socket
+import struct
+import threading
+
+
+def load_config(path):
+    with open(path) as f:
+        text = f.read()
+    try:
+        import yaml
+        return yaml.safe_load(text)
+    except ImportError:
+        return json.loads(text)
+
+
+def listen(addr):
+    host, port = addr.rsplit(':', 1)
+    srv = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    srv.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    srv.bind((host, int(port)))
+    srv.listen(64)
+    return srv
+
+
+def pipe(src, dst):
+    try:
+        while True:
+            data = src.recv(65536)
+            if not data:
+                break
+            dst.sendall(data)
+    except OSError:
+        pass
+    finally:
+        for s in (src, dst):
+            try:
+                s.close()
+            except OSError:
+                pass
+
+
+def relay(client, host, port):
+    upstream = socket.create_connection((host, port), timeout=10)
+    upstream.settimeout(None)
+    threading.Thread(target=pipe, args=(client, upstream), daemon=True).start()
+    pipe(upstream, client)
+
+
+def recv_exact(sock, n):
+    data = b''
+    while len(data) < n:
+        chunk = sock.recv(n - len(data))
+        if not chunk:
+            raise OSError("连接关闭")
+        data += chunk
+    return data
+
+
+def socks5(client):
+    try:
+        _, n = recv_exact(client, 2)
+        recv_exact(client, n)
+        client.sendall(b'\x05\x00')  # 无认证
+        _, cmd, _, atyp = recv_exact(client, 4)
+        if atyp == 1:
+            host = socket.inet_ntoa(recv_exact(client, 4))
+        elif atyp == 3:
+            host = recv_exact(client, recv_exact(client, 1)[0]).decode()
+        else:
+            host = socket.inet_ntop(socket.AF_INET6, recv_exact(client, 16))
+        port = struct.unpack('!H', recv_exact(client, 2))[0]
+        if cmd != 1:
+            client.sendall(b'\x05\x07\x00\x01' + b'\x00' * 6)
+            return client.close()
+        try:
+            upstream = socket.create_connection((host, port), timeout=10)
+        except OSError:
+            client.sendall(b'\x05\x05\x00\x01' + b'\x00' * 6)
+            return client.close()
+        upstream.settimeout(None)
+        client.sendall(b'\x05\x00\x00\x01' + b'\x00' * 6)
+        threading.Thread(target=pipe, args=(client, upstream), daemon=True).start()
+        pipe(upstream, client)
+    except OSError:
+        client.close()
+
+
+def http_connect(client):
+    try:
+        head = b''
+        while b'\r\n\r\n' not in head:
+            chunk = client.recv(4096)
+            if not chunk:
+                return client.close()
+            head += chunk
+        method, target = head.split(b' ', 2)[:2]
+        if method != b'CONNECT':
+            client.sendall(b'HTTP/1.1 405 Method Not Allowed\r\nContent-Length: 0\r\n\r\n')
+            return client.close()
+        host, port = target.decode().rsplit(':', 1)
+        client.sendall(b'HTTP/1.1 200 Connection established\r\n\r\n')
+        relay(client, host, int(port))
+    except OSError:
+        client.close()
+
+
+def serve(srv, handler):
+    while True:
+        conn, _ = srv.accept()
+        threading.Thread(target=handler, args=(conn,), daemon=True).start()
+
+
+def main(argv):
+    if len(argv) < 3 or argv[0] != 'client' or argv[1] != '-c':
+        print("用法: hysteria client -c <config>")
+        return 2
+    config = load_config(argv[2])
+    print(f"fake hysteria: server {config.get('server')}", flush=True)
+    threads = []
+    if config.get('socks5'):
+        threads.append(threading.Thread(target=serve, args=(listen(config['socks5']['listen']), socks5), daemon=True))
+    if config.get('http'):
+        threads.append(threading.Thread(target=serve, args=(listen(config['http']['listen']), http_connect), daemon=True))
+    for t in threads:
+        t.start()
+    time.sleep(float(os.environ.get('FAKE_HY2_DELAY', '0.2')))
+    print("INFO\tconnected to server", flush=True)
+    while True:
+        time.sleep(3600)
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
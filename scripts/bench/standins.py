@@ -0,0 +1,375 @@
+"""
+本地替身服务
+- 一个 HTTP 服务同时扮演 ClawCloud、GitHub 登录/OAuth、Telegram Bot API 和 GitHub Secrets API
+- 浏览器请求经 attach() 注册的路由转发到本服务（X-Bench-Host 标明原域名），不访问外网
+- Telegram / GitHub API 通过 TG_API_BASE / GITHUB_API_URL 指向本服务
+- 按场景模拟设备验证、GitHub Mobile 两步验证和 TOTP（Telegram 自动回复 /code）
+"""
+
+import json
+import time
+import hmac
+import base64
+import struct
+import hashlib
+import threading
+import http.client
+from collections import Counter
+from http.cookies import SimpleCookie
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs, quote, urlencode
+
+CLAW_ENTRY = 'ap-southeast-1.run.claw.cloud'  # 与 LOGIN_ENTRY_URL 一致；其他 *.run.claw.cloud 区域入口同样可用
+CLAW_CONSOLE = 'us-west-1.console.claw.cloud'  # OAuth 回调后跳到的区域控制台
+VALID_SESSION = 'bench-session'  # 预置的有效 GH_SESSION
+PASSWORD = 'bench-password'
+TOTP_CODE = '123456'  # Telegram 回复的固定验证码
+TOTP_SECRET = 'JBSWY3DPEHPK3PXP'  # 本地 TOTP 场景的密钥，服务端独立计算校验
+CHALLENGES = (None, 'device', 'mobile', 'totp')
+
+def totp(secret, t, period=30):
+    """独立实现的 RFC 6238（不复用 auto_login.Totp，用来校验它）"""
+    key = base64.b32decode(secret + '=' * (-len(secret) % 8))
+    mac = hmac.new(key, struct.pack('>Q', int(t // period)), hashlib.sha1).digest()
+    i = mac[-1] & 0x0F
+    return str((struct.unpack('>I', mac[i:i + 4])[0] & 0x7FFFFFFF) % 10 ** 6).zfill(6)
+
+
+PAGE = """<!doctype html><html><head><meta charset="utf-8"><title>{title}</title></head>
+<body>{body}</body></html>"""
+
+
+class StandIn:
+    """
+    一次场景的替身状态
+    challenge: 密码登录后的额外验证 None / device / mobile / totp
+    approve_after: 设备验证 / Mobile 批准在首次打开验证页后多少秒生效
+    reply_after: 收到 /code 提示后多少秒"用户"回复验证码
+    """
+
+    def __init__(self, challenge=None, approve_after=2.0, reply_after=0.3, chat_id='1'):
+        if challenge not in CHALLENGES:
+            raise ValueError(f"未知验证方式: {challenge}")
+        self.challenge = challenge
+        self.approve_after = approve_after
+        self.reply_after = reply_after
+        self.chat_id = chat_id
+        self.server = None
+        self.lock = threading.Lock()
+        self.hits = Counter()  # 域名 -> 请求数
+        self.navigations = 0  # 浏览器主框架导航次数
+        self.sessions = {VALID_SESSION}
+        self.claw_tokens = set()
+        self.codes = set()
+        self.seq = 0
+        self.return_to = None
+        self.device_since = None
+        self.messages = []  # 收到的 Telegram 调用 (method, 时间)
+        self.updates = []
+        self.update_cond = threading.Condition(self.lock)
+        self.secrets = {}
+
+    # ---------- 服务 ----------
+
+    def start(self):
+        standin = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_GET(self):
+                standin.dispatch(self)
+
+            do_POST = do_PUT = do_GET
+
+            def do_HEAD(self):
+                # TOTP 时钟校准只看 Date 头
+                self.send_response(200)
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        if self.server:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+
+    @property
+    def port(self):
+        return self.server.server_address[1]
+
+    @property
+    def base(self):
+        return f"http://127.0.0.1:{self.port}"
+
+    @property
+    def outbound(self):
+        return sum(self.hits.values())
+
+    def next_id(self, prefix):
+        with self.lock:
+            self.seq += 1
+            return f"{prefix}{self.seq}"
+
+    # ---------- 浏览器接入 ----------
+
+    def attach(self, context):
+        """AutoLogin.context_hooks 钩子：所有浏览器请求转发到本服务，并统计主框架导航"""
+
+        def handle(route):
+            request = route.request
+            parsed = urlparse(request.url)
+            headers = {k: v for k, v in request.headers.items() if k.lower() not in ('host', 'cookie')}
+            headers['X-Bench-Host'] = parsed.hostname or ''
+            # Cookie 由上下文提供，和真实浏览器发出的一致
+            cookies = context.cookies(request.url)
+            if cookies:
+                headers['Cookie'] = '; '.join(f"{c['name']}={c['value']}" for c in cookies)
+            path = parsed.path or '/'
+            if parsed.query:
+                path += '?' + parsed.query
+            conn = http.client.HTTPConnection('127.0.0.1', self.port, timeout=30)
+            try:
+                conn.request(request.method, path, body=request.post_data_buffer, headers=headers)
+                resp = conn.getresponse()
+                body = resp.read()
+            finally:
+                conn.close()
+            # Set-Cookie 直接写进上下文，不依赖 fulfill 是否处理该响应头
+            jar = SimpleCookie()
+            for value in resp.msg.get_all('Set-Cookie') or []:
+                jar.load(value)
+            if jar:
+                context.add_cookies([{
+                    'name': name,
+                    'value': morsel.value,
+                    # 带 Domain 属性的 Cookie 对子域名生效，Playwright 用前导点表示
+                    'domain': '.' + morsel['domain'].lstrip('.') if morsel['domain'] else parsed.hostname,
+                    'path': morsel['path'] or '/',
+                } for name, morsel in jar.items()])
+            route.fulfill(
+                status=resp.status,
+                headers={k: v for k, v in resp.getheaders()
+                         if k.lower() not in ('set-cookie', 'content-length', 'connection', 'transfer-encoding')},
+                body=body,
+            )
+
+        def on_page(page):
+            def on_nav(frame):
+                if frame == page.main_frame:
+                    self.navigations += 1
+            page.on('framenavigated', on_nav)
+
+        context.route('**/*', handle)
+        context.on('page', on_page)
+
+    # ---------- 分发 ----------
+
+    def dispatch(self, handler):
+        length = int(handler.headers.get('Content-Length') or 0)
+        body = handler.rfile.read(length) if length else b''
+        parsed = urlparse(handler.path)
+        query = {k: v[0] for k, v in parse_qs(parsed.query).items()}
+        if handler.headers.get('Content-Type', '').startswith('application/x-www-form-urlencoded'):
+            query.update({k: v[0] for k, v in parse_qs(body.decode()).items()})
+        jar = SimpleCookie(handler.headers.get('Cookie', ''))
+        cookies = {k: m.value for k, m in jar.items()}
+        host = handler.headers.get('X-Bench-Host')
+
+        if parsed.path.startswith('/telegram/'):
+            key = 'api.telegram.org'
+            status, headers, payload = self.telegram(parsed.path, query)
+        elif parsed.path.startswith('/github-api/'):
+            key = 'api.github.com'
+            status, headers, payload = self.github_api(handler.command, parsed.path, body)
+        elif host and host.endswith('claw.cloud'):
+            key = host
+            status, headers, payload = self.claw(host, parsed.path, query, cookies)
+        elif host == 'github.com':
+            key = host
+            status, headers, payload = self.github(handler.command, parsed.path, query, cookies)
+        else:
+            key = host or 'unknown'
+            status, headers, payload = 404, [], b''
+        with self.lock:
+            self.hits[key] += 1
+
+        handler.send_response(status)
+        for k, v in headers:
+            handler.send_header(k, v)
+        handler.send_header('Content-Length', str(len(payload)))
+        handler.end_headers()
+        handler.wfile.write(payload)
+
+    @staticmethod
+    def html(title, body, status=200, headers=()):
+        page = PAGE.format(title=title, body=body).encode()
+        return status, [('Content-Type', 'text/html; charset=utf-8'), *headers], page
+
+    @staticmethod
+    def redirect(location, headers=()):
+        return 302, [('Location', location), *headers], b''
+
+    @staticmethod
+    def json(data, status=200):
+        return status, [('Content-Type', 'application/json')], json.dumps(data).encode()
+
+    # ---------- ClawCloud ----------
+
+    def claw(self, host, path, query, cookies):
+        logged_in = cookies.get('claw_token') in self.claw_tokens
+        entry = host.endswith('.run.claw.cloud')
+        if entry and path.startswith('/signin'):
+            if logged_in:
+                return self.redirect(f"https://{CLAW_CONSOLE}/")
+            authorize = "https://github.com/login/oauth/authorize?" + urlencode({
+                'client_id': 'bench', 'state': 'bench',
+                'redirect_uri': f"https://{host}/callback",
+            })
+            return self.html("Sign in", f"""<h1>ClawCloud</h1>
+<button onclick="location.href='{authorize}'">Continue with GitHub</button>""")
+        if entry and path.startswith('/callback'):
+            if query.get('code') not in self.codes:
+                return self.redirect(f"https://{host}/signin")
+            self.codes.discard(query['code'])
+            token = self.next_id('claw-')
+            self.claw_tokens.add(token)
+            return self.redirect(f"https://{CLAW_CONSOLE}/",
+                                 [('Set-Cookie', f"claw_token={token}; Domain=claw.cloud; Path=/; Secure")])
+        if host == CLAW_CONSOLE:
+            if not logged_in:
+                return self.redirect(f"https://{CLAW_ENTRY}/signin")
+            return self.html("Console", f"<h1>Console</h1><p>{path}</p>")
+        return self.html("Not Found", "", status=404)
+
+    # ---------- GitHub ----------
+
+    def issue_session(self):
+        """登录完成：发放 user_session 并回到 OAuth"""
+        token = self.next_id('gh-')
+        self.sessions.add(token)
+        return self.redirect(self.return_to or "https://github.com/",
+                             [('Set-Cookie', f"user_session={token}; Path=/; Secure; HttpOnly")])
+
+    def login_page(self, return_to, error=''):
+        flash = f'<div class="flash-error">{error}</div>' if error else ''
+        return self.html("Sign in to GitHub", f"""{flash}
+<form method="post" action="https://github.com/session">
+<input type="hidden" name="return_to" value="{return_to}">
+<input name="login" type="text"><input name="password" type="password">
+<input type="submit" name="commit" value="Sign in">
+</form>""")
+
+    def github(self, method, path, query, cookies):
+        logged_in = cookies.get('user_session') in self.sessions
+
+        if path == '/login/oauth/authorize':
+            if not logged_in:
+                target = "https://github.com/login/oauth/authorize?" + urlencode(query)
+                return self.redirect(f"https://github.com/login?return_to={quote(target, safe='')}")
+            code = self.next_id('code-')
+            self.codes.add(code)
+            return self.redirect(f"{query.get('redirect_uri')}?code={code}&state={query.get('state', '')}")
+
+        if path == '/login':
+            return self.login_page(query.get('return_to', ''))
+
+        if path == '/session' and method == 'POST':
+            self.return_to = query.get('return_to')
+            if not query.get('login') or query.get('password') != PASSWORD:
+                return self.login_page(self.return_to or '', 'Incorrect username or password.')
+            if self.challenge == 'device':
+                return self.redirect("https://github.com/sessions/verified-device")
+            if self.challenge == 'mobile':
+                return self.redirect("https://github.com/sessions/two-factor/mobile")
+            if self.challenge == 'totp':
+                return self.redirect("https://github.com/sessions/two-factor/app")
+            return self.issue_session()
+
+        if path == '/sessions/verified-device':
+            # 在别处批准后本页不会自动跳转，刷新才生效（与 GitHub 一致）
+            if self.device_since is None:
+                self.device_since = time.time()
+            if time.time() - self.device_since >= self.approve_after:
+                return self.issue_session()
+            return self.html("Device verification", "<h1>Device verification</h1>")
+
+        if path == '/sessions/two-factor/mobile':
+            # 页面自己轮询，批准后跳转
+            return self.html("Two-factor", f"""<h1>GitHub Mobile</h1><p>42</p>
+<script>setTimeout(function(){{location.href='/sessions/two-factor/mobile/approved'}}, {int(self.approve_after * 1000)})</script>""")
+
+        if path == '/sessions/two-factor/mobile/approved':
+            return self.issue_session()
+
+        if path == '/sessions/two-factor/app':
+            return self.html("Two-factor", """<form method="post" action="https://github.com/sessions/two-factor">
+<input name="app_otp" autocomplete="one-time-code" inputmode="numeric">
+<button type="submit">Verify</button></form>""")
+
+        if path == '/sessions/two-factor' and method == 'POST':
+            now = time.time()
+            valid = {TOTP_CODE} | {totp(TOTP_SECRET, now + skew) for skew in (-30, 0, 30)}
+            if query.get('app_otp') in valid:
+                return self.issue_session()
+            return self.html("Two-factor", """<div class="flash-error">Two-factor authentication failed.</div>
+<form method="post" action="https://github.com/sessions/two-factor">
+<input name="app_otp" autocomplete="one-time-code" inputmode="numeric">
+<button type="submit">Verify</button></form>""")
+
+        if path == '/settings/profile':
+            return self.html("Profile", "") if logged_in else self.redirect("https://github.com/login")
+
+        return self.html("Not Found", "", status=404)
+
+    # ---------- Telegram Bot API ----------
+
+    def telegram(self, path, query):
+        method = path.rsplit('/', 1)[-1]
+        if method == 'getUpdates':
+            offset = int(query.get('offset') or 0)
+            timeout = min(float(query.get('timeout') or 0), 25)
+            deadline = time.time() + timeout
+            with self.update_cond:
+                while True:
+                    result = [u for u in self.updates if u['update_id'] >= offset]
+                    left = deadline - time.time()
+                    if result or left <= 0:
+                        break
+                    self.update_cond.wait(left)
+            return self.json({'ok': True, 'result': result})
+
+        with self.lock:
+            self.messages.append((method, time.time()))
+        if self.challenge == 'totp' and '/code' in query.get('text', ''):
+            threading.Timer(self.reply_after, self.reply, args=(f"/code {TOTP_CODE}",)).start()
+        return self.json({'ok': True, 'result': {'message_id': len(self.messages)}})
+
+    def reply(self, text):
+        """模拟用户在 Telegram 里回复"""
+        with self.update_cond:
+            self.updates.append({
+                'update_id': len(self.updates) + 1,
+                'message': {'chat': {'id': int(self.chat_id)}, 'text': text},
+            })
+            self.update_cond.notify_all()
+
+    # ---------- GitHub Secrets API ----------
+
+    def github_api(self, method, path, body):
+        if path.endswith('/actions/secrets/public-key'):
+            key = base64.b64encode(b'\x01' * 32).decode()
+            return self.json({'key_id': 'bench', 'key': key})
+        if '/actions/secrets/' in path and method == 'PUT':
+            with self.lock:
+                self.secrets[path.rsplit('/', 1)[-1]] = time.time()
+            return 204, [], b''
+        return self.json({'message': 'Not Found'}, status=404)
@@ -0,0 +1,162 @@
+"""
+离线端到端基准测试
+用本地替身（scripts/bench）代替 ClawCloud、GitHub OAuth、Telegram 和 GitHub API，
+以真实 Chromium 跑完整的 AutoLogin 流程，统计每个场景的：
+- 总耗时（含代理启动、浏览器启动、通知投递）
+- 浏览器主框架导航次数
+- 对外请求数（按域名，全部落在替身上）
+- 顶层步骤耗时（来自 Tracer）
+
+用法:
+  python scripts/benchmark.py                      # 全部场景各跑一次（cookie/password/device/mobile/totp/totp_local）
+  python scripts/benchmark.py device totp -n 3     # 指定场景，各跑 3 次
+  python scripts/benchmark.py --no-proxy --json bench.json
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import statistics
+from contextlib import redirect_stdout
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, HERE)
+
+from bench.standins import StandIn, VALID_SESSION, PASSWORD, TOTP_SECRET
+
+# 场景名 -> (说明, 预置有效 GH_SESSION, 密码登录后的额外验证, 配置本地 TOTP 密钥)
+SCENARIOS = {
+    'cookie': ("GH_SESSION 有效，直接 OAuth", True, None, False),
+    'password': ("密码登录", False, None, False),
+    'device': ("密码登录 + 设备验证", False, 'device', False),
+    'mobile': ("密码登录 + GitHub Mobile 两步验证", False, 'mobile', False),
+    'totp': ("密码登录 + TOTP（Telegram /code）", False, 'totp', False),
+    'totp_local': ("密码登录 + TOTP（本地计算）", False, 'totp', True),
+}
+
+
+def prepare_env(tmp, proxy):
+    """导入 auto_login 前设置环境：凭据、Telegram、Secret、trace 输出和假的 hysteria"""
+    for key in ('ACCOUNTS', 'CLAW_STATE', 'PW_TRACE', 'CLAW_OAUTH_URL', 'SHOT_DIR', 'LEARNED_SELECTORS', 'CLAW_REGION',
+                'HAR_RECORD', 'HAR_REPLAY'):
+        os.environ.pop(key, None)
+    os.environ.update({
+        'TG_BOT_TOKEN': 'bench',
+        'TG_CHAT_ID': '1',
+        'REPO_TOKEN': 'bench',
+        'GITHUB_REPOSITORY': 'bench/repo',
+        'TRACE_FILE': os.path.join(tmp, 'trace.jsonl'),
+        'SELECTOR_CACHE': os.path.join(tmp, 'selectors.json'),
+        'HISTORY_DB': os.path.join(tmp, 'history.db'),
+    })
+    if not proxy:
+        os.environ['PROXY_HY2'] = ''
+        return
+    bin_dir = os.path.join(tmp, 'bin')
+    os.makedirs(bin_dir, exist_ok=True)
+    exe = os.path.join(bin_dir, 'hysteria')
+    with open(exe, 'w') as f:
+        f.write(f'#!/bin/sh\nexec "{sys.executable}" "{os.path.join(HERE, "bench", "fake_hysteria.py")}" "$@"\n')
+    os.chmod(exe, 0o755)
+    os.environ['PATH'] = bin_dir + os.pathsep + os.environ.get('PATH', '')
+    os.environ['PROXY_HY2'] = 'hysteria2://bench@127.0.0.1:443?insecure=1#bench'
+
+
+def run_scenario(name, approve_after, verbose):
+    import auto_login
+
+    _, with_session, challenge, local_totp = SCENARIOS[name]
+    standin = StandIn(challenge, approve_after=approve_after).start()
+    # 模块级配置在调用时读取，直接指向本次的替身
+    auto_login.TG_API_BASE = f"{standin.base}/telegram"
+    auto_login.GITHUB_API_URL = f"{standin.base}/github-api"
+    auto_login.HTTP_FAST_PATH = False  # 快速路径用 requests 直连真实站点，替身接管不了
+    auto_login.TOTP_TIME_URL = standin.base
+    auto_login.Totp.offset = None
+
+    account = {
+        'username': 'bench',
+        'password': PASSWORD,
+        'session': VALID_SESSION if with_session else '',
+        'state': '',
+        'totp': TOTP_SECRET if local_totp else '',
+    }
+    start = time.time()
+    try:
+        with redirect_stdout(sys.stdout if verbose else open(os.devnull, 'w')):
+            bot = auto_login.AutoLogin(account)
+            bot.context_hooks.append(standin.attach)
+            try:
+                bot.run()
+                ok = True
+            except SystemExit as e:
+                ok = not e.code
+    finally:
+        standin.stop()
+    return {
+        'scenario': name,
+        'ok': ok,
+        'wall': time.time() - start,
+        'navigations': standin.navigations,
+        'outbound': standin.outbound,
+        'hits': dict(standin.hits),
+        'telegram_calls': len(standin.messages),
+        'steps': bot.tracer.summary(),
+    }
+
+
+def report(results):
+    print(f"\n{'场景':<10}{'成功':>6}{'耗时中位':>10}{'最快':>8}{'导航':>6}{'请求':>6}  说明")
+    for name in SCENARIOS:
+        runs = [r for r in results if r['scenario'] == name]
+        if not runs:
+            continue
+        walls = [r['wall'] for r in runs]
+        ok = sum(r['ok'] for r in runs)
+        print(f"{name:<12}{ok}/{len(runs):<5}{statistics.median(walls):>9.1f}s{min(walls):>7.1f}s"
+              f"{statistics.median(r['navigations'] for r in runs):>7.0f}"
+              f"{statistics.median(r['outbound'] for r in runs):>7.0f}  {SCENARIOS[name][0]}")
+    for r in results:
+        steps = "，".join(f"{k} {v:.1f}s" for k, v in r['steps'].items())
+        hits = "，".join(f"{k} {v}" for k, v in sorted(r['hits'].items()))
+        print(f"\n[{r['scenario']}] {'✅' if r['ok'] else '❌'} {r['wall']:.1f}s")
+        print(f"  步骤: {steps}")
+        print(f"  请求: {hits}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="ClawCloud 自动登录离线基准测试")
+    parser.add_argument('scenarios', nargs='*', metavar='scenario',
+                        help=f"要跑的场景（默认全部）：{', '.join(SCENARIOS)}")
+    parser.add_argument('-n', '--repeat', type=int, default=1, help="每个场景重复次数")
+    parser.add_argument('--approve-after', type=float, default=2.0, help="设备验证 / Mobile 批准延迟（秒）")
+    parser.add_argument('--no-proxy', action='store_true', help="不启动假的 Hysteria2 代理")
+    parser.add_argument('--json', help="结果另存为 JSON")
+    parser.add_argument('-v', '--verbose', action='store_true', help="显示 AutoLogin 输出")
+    args = parser.parse_args(argv)
+    unknown = [s for s in args.scenarios if s not in SCENARIOS]
+    if unknown:
+        parser.error(f"未知场景: {', '.join(unknown)}")
+
+    tmp = tempfile.mkdtemp(prefix='claw-bench-')
+    prepare_env(tmp, proxy=not args.no_proxy)
+
+    results = []
+    for name in args.scenarios or list(SCENARIOS):
+        for i in range(args.repeat):
+            print(f"▶️ {name} #{i + 1}", flush=True)
+            results.append(run_scenario(name, args.approve_after, args.verbose))
+
+    report(results)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+        print(f"\n结果已保存: {args.json}")
+    return 0 if all(r['ok'] for r in results) else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# auto_login 是单文件脚本，不是包；requests / playwright 等依赖都是用到时才导入，测试环境不需要安装
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'scripts'))
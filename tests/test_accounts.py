@@ -0,0 +1,47 @@
+import pytest
+
+from auto_login import FleetRunner, Preflight
+
+
+@pytest.fixture
+def env(monkeypatch):
+    for name in ('GH_SESSION_ALICE', 'CLAW_STATE_ALICE', 'CLAW_REGION_ALICE', 'GH_TOTP_SECRET_ALICE'):
+        monkeypatch.delenv(name, raising=False)
+    return monkeypatch
+
+
+def test_suffixed_secrets(env):
+    env.setenv('ACCOUNTS', '[{"username": "alice", "password": "p", "region": "us-west-1"}]')
+    env.setenv('GH_SESSION_ALICE', 'sess')
+    env.setenv('CLAW_REGION_ALICE', 'eu-central-1')
+    [account] = FleetRunner.load_accounts()
+    assert account['session'] == 'sess'
+    assert account['region'] == 'us-west-1'  # ACCOUNTS 里写的优先
+    assert account['secret_suffix'] == 'ALICE'
+    assert account['loaded'] == {'GH_SESSION_ALICE': 'sess', 'CLAW_STATE_ALICE': '', 'CLAW_REGION_ALICE': 'eu-central-1'}
+
+
+def test_suffix_from_username(env):
+    env.setenv('ACCOUNTS', '[{"username": "bob.smith-2"}, {"username": "c", "secret_suffix": "X"}]')
+    assert [a['secret_suffix'] for a in FleetRunner.load_accounts()] == ['BOB_SMITH_2', 'X']
+
+
+@pytest.mark.parametrize('raw, usernames, error', [
+    ('{"username": "alice"}', [], '应为 JSON 数组'),
+    ('["alice", "bob"]', [], '第 1 项应为对象'),
+    ('[{"username": "alice"}, 3]', ['alice'], '第 2 项应为对象'),
+    ('[{"password": "p"}, {"username": "alice"}]', ['alice'], None),
+    ('[{"username": ', [], '解析 ACCOUNTS 失败'),
+])
+def test_malformed_accounts(env, capsys, raw, usernames, error):
+    env.setenv('ACCOUNTS', raw)
+    assert [a['username'] for a in FleetRunner.load_accounts()] == usernames
+    out = capsys.readouterr().out
+    assert (error in out) if error else out == ''
+
+
+def test_check_reports_malformed_accounts(env):
+    env.setenv('ACCOUNTS', '[{"username": "alice", "password": "p"}, "bob"]')
+    results = Preflight().credentials()
+    assert ('❌', "ACCOUNTS", 'ACCOUNTS 格式错误: 第 2 项应为对象 {"username": ..., "password": ...}，已跳过') in results
+    assert results[-1][:2] == ('✅', 'alice')
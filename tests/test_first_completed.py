@@ -0,0 +1,46 @@
+import asyncio
+import gc
+
+from auto_login import first_completed
+
+
+def run(waits, timeout=1):
+    return asyncio.run(first_completed(waits, timeout))
+
+
+async def ok(delay=0):
+    await asyncio.sleep(delay)
+    return True
+
+
+async def fail(delay=0):
+    await asyncio.sleep(delay)
+    raise TimeoutError("locator")
+
+
+def test_first_success_wins():
+    assert run({'url': ok(0.05), 'selector': ok(0)}) == 'selector'
+
+
+def test_failures_are_skipped():
+    assert run({'selector': fail(0), 'url': ok(0.02)}) == 'url'
+
+
+def test_timeout_and_all_failed():
+    assert run({'url': ok(1)}, timeout=0.02) is None
+    assert run({'a': fail(), 'b': fail()}) is None
+
+
+def test_failed_task_in_same_batch_is_retrieved():
+    """成功和失败在同一批完成时，失败那个的异常也要被取走"""
+    errors = []
+
+    async def main():
+        asyncio.get_running_loop().set_exception_handler(lambda loop, context: errors.append(context))
+        hit = await first_completed({'url': ok(), 'selector': fail()}, 1)
+        gc.collect()
+        return hit
+
+    assert asyncio.run(main()) == 'url'
+    gc.collect()
+    assert errors == []
@@ -0,0 +1,97 @@
+import json
+
+import pytest
+
+from auto_login import HarArchive
+
+PASSWORD = 'hunter2-correct-horse'
+SESSION = 'Gh_5e55i0n_c00kie_value_0123456789'
+AUTH_TOKEN = 'aT0ken-aT0ken-aT0ken-aT0ken'
+OAUTH_CODE = 'oauthcode1234567'
+
+
+def entry(request, response=None):
+    response = {'status': 200, 'headers': [], 'cookies': [], 'redirectURL': '',
+                'content': {'text': ''}, **(response or {})}
+    return {'request': {'method': 'GET', 'headers': [], 'cookies': [], **request}, 'response': response}
+
+
+@pytest.fixture
+def har(tmp_path):
+    form = f'login=alice&password={PASSWORD.replace("-", "%2D")}&authenticity_token={AUTH_TOKEN}&otp=123456'
+    entries = [
+        entry({'url': 'https://console.run.claw.cloud/signin'}),
+        entry({'method': 'POST', 'url': 'https://github.com/session',
+               'headers': [{'name': 'Cookie', 'value': f'user_session={SESSION}; tz=UTC'},
+                           {'name': 'Authorization', 'value': 'Bearer abc'}],
+               'cookies': [{'name': 'user_session', 'value': SESSION}, {'name': 'tz', 'value': 'UTC'}],
+               'postData': {'mimeType': 'application/x-www-form-urlencoded', 'text': form}},
+              {'status': 302, 'redirectURL': f'https://console.run.claw.cloud/callback?code={OAUTH_CODE}&state=x',
+               'headers': [{'name': 'Set-Cookie', 'value': f'user_session={SESSION}; path=/; secure\n'
+                                                            f'logged_in=yes; path=/'}]}),
+        entry({'url': f'https://console.run.claw.cloud/callback?code={OAUTH_CODE}&state=x'},
+              {'content': {'text': f'<script>var s="{SESSION}"; var t="{AUTH_TOKEN}";</script>'}}),
+    ]
+    path = tmp_path / 'login.har'
+    path.write_text(json.dumps({'log': {'entries': entries}}), encoding='utf-8')
+    return path
+
+
+def redacted(har, known=None):
+    count = HarArchive(str(har)).redact(known)
+    return count, har.read_text(encoding='utf-8'), json.loads(har.read_text(encoding='utf-8'))['log']['entries']
+
+
+def test_secrets_removed_everywhere(har):
+    count, text, _ = redacted(har)
+    for secret in (SESSION, AUTH_TOKEN, OAUTH_CODE, 'Bearer abc'):
+        assert secret not in text
+    assert PASSWORD.replace('-', '%2D') not in text
+    assert count == 4  # Cookie、密码、表单 token、OAuth code
+
+
+def test_placeholders_are_consistent(har):
+    _, text, entries = redacted(har)
+    cookie = HarArchive.placeholder('cookie_user_session')
+    assert cookie == 'REDACTED_COOKIE_USER_SESSION'
+    # 同一个 Cookie 在请求头、cookies 数组、Set-Cookie 和响应正文里换成同一个占位符
+    assert text.count(cookie) == 4
+    login = entries[1]
+    assert {'name': 'Cookie', 'value': f'user_session={cookie}; tz=UTC'} in login['request']['headers']
+    assert {'name': 'Authorization', 'value': 'REDACTED'} in login['request']['headers']
+    code = HarArchive.placeholder('code')
+    assert login['response']['redirectURL'].startswith(f'https://console.run.claw.cloud/callback?code={code}&')
+    assert entries[2]['request']['url'].startswith(f'https://console.run.claw.cloud/callback?code={code}&')
+
+
+def test_short_cookie_values_kept(har):
+    _, _, entries = redacted(har)
+    assert {'name': 'tz', 'value': 'UTC'} in entries[1]['request']['cookies']
+    assert 'logged_in=yes' in entries[1]['response']['headers'][0]['value']
+
+
+def test_form_matches_live_redaction(har):
+    """回放时实时请求的表单按同样规则脱敏后，要和 HAR 里的正文完全一致才能命中"""
+    _, _, entries = redacted(har)
+    post = entries[1]['request']['postData']
+    live = 'login=alice&password=another-password&authenticity_token=fresh&otp=654321'
+    assert HarArchive.redact_form(live, 'application/x-www-form-urlencoded; charset=UTF-8') == post['text']
+    assert {'name': 'login', 'value': 'alice'} in post['params']
+    assert {'name': 'otp', 'value': 'REDACTED_OTP'} in post['params']
+
+
+def test_known_values_replaced(tmp_path):
+    """已知凭据（密码、GH_SESSION）即使没出现在表单或 Cookie 里也会被替换"""
+    path = tmp_path / 'known.har'
+    page = entry({'url': 'https://github.com/settings'}, {'content': {'text': f'{{"debug": "{PASSWORD}"}}'}})
+    path.write_text(json.dumps({'log': {'entries': [page]}}), encoding='utf-8')
+    count, text, _ = redacted(path, {PASSWORD: 'password', 'short': 'username'})
+    assert PASSWORD not in text
+    assert 'REDACTED_PASSWORD' in text
+    assert count == 1  # 太短的值不做全文替换
+
+
+def test_redact_form_ignores_other_bodies():
+    assert HarArchive.redact_form('{"password": "x"}', 'application/json') is None
+    assert HarArchive.redact_form('q=search', 'application/x-www-form-urlencoded') is None
+    assert HarArchive.redact_form('', 'application/x-www-form-urlencoded') is None
@@ -0,0 +1,75 @@
+import time
+
+import pytest
+
+from auto_login import History
+
+
+@pytest.mark.parametrize('values, q, expected', [
+    ([5.0], 90, 5.0),
+    ([1.0, 2.0, 3.0, 4.0], 50, 2.5),
+    ([1.0, 2.0, 3.0, 4.0, 5.0], 50, 3.0),
+    ([1.0, 2.0, 3.0, 4.0, 5.0], 90, 4.6),
+    ([1.0, 2.0, 3.0, 4.0, 5.0], 0, 1.0),
+    ([1.0, 2.0, 3.0, 4.0, 5.0], 100, 5.0),
+])
+def test_percentile_interpolates(values, q, expected):
+    assert History.percentile(values, q) == pytest.approx(expected)
+
+
+def make_runs(durations, account='alice', step='login_github', start=1000.0):
+    return [{'account': account, 'started': start + i, 'steps': {step: dur}} for i, dur in enumerate(durations)]
+
+
+def test_regression_flagged_against_rolling_median():
+    history = make_runs([10, 11, 9, 10, 10, 20])
+    flagged = History().regressions(history[-1:], history, threshold=0.5, baseline=20)
+    assert [(name, dur, median) for _, name, dur, median in flagged] == [('login_github', 20, 10)]
+
+
+def test_within_threshold_not_flagged():
+    history = make_runs([10, 11, 9, 10, 10, 14])
+    assert History().regressions(history[-1:], history, threshold=0.5, baseline=20) == []
+
+
+def test_small_absolute_delta_not_flagged():
+    """短步骤翻倍但只慢了零点几秒，不算回归"""
+    history = make_runs([0.2, 0.2, 0.2, 0.2, 0.2, 0.6])
+    assert History().regressions(history[-1:], history, threshold=0.5, baseline=20) == []
+
+
+def test_needs_min_samples():
+    history = make_runs([10, 10, 10, 10, 30])
+    assert History().regressions(history[-1:], history, threshold=0.5, baseline=20) == []
+
+
+def test_baseline_is_per_account_and_uses_latest_runs():
+    slow_bob = make_runs([30] * 5, account='bob')
+    history = make_runs([50] * 5 + [10] * 5 + [20]) + slow_bob
+    run = history[10]
+    # 只看 alice 最近 5 次（中位数 10），不看更早的 50，也不看 bob
+    flagged = History().regressions([run], history, threshold=0.5, baseline=5)
+    assert [(dur, median) for _, _, dur, median in flagged] == [(20, 10)]
+
+
+def test_add_load_and_report(tmp_path, capsys):
+    history = History(str(tmp_path / 'history.db'))
+    now = time.time()
+    for i, dur in enumerate([10, 10, 11, 9, 10, 25]):
+        history.add({'run_id': str(i), 'started': now - 3600 * (6 - i), 'account': 'alice', 'region': 'us-west-1',
+                     'proxy': 'hk', 'failovers': 0, 'engine': 'sync', 'ok': int(i != 5),
+                     'error': None, 'failed_step': 'wait_redirect' if i == 5 else None, 'elapsed': dur + 5},
+                    {'login_github': dur, 'keepalive': 2.0})
+    runs = history.load(now - 86400)
+    assert [run['steps']['login_github'] for run in runs] == [10, 10, 11, 9, 10, 25]
+    assert history.load(now - 86400, account='bob') == []
+
+    assert history.report(days=1) == 1
+    out = capsys.readouterr().out
+    assert '6 次运行，成功 5' in out
+    assert 'wait_redirect 1' in out
+    assert 'login_github 25.0s（基线 10.0s' in out
+
+
+def test_add_without_path_is_noop():
+    History('').add({'run_id': 'x'}, {})
@@ -0,0 +1,89 @@
+import pytest
+
+from auto_login import Hysteria2Client
+
+TS = '2024-05-01T08:00:00Z'
+
+
+@pytest.fixture
+def client():
+    return Hysteria2Client('hysteria2://pw@example.com:443#hk', {'server': 'example.com:443'}, 51080, 51081)
+
+
+def log(*parts):
+    return '\t'.join((TS,) + parts)
+
+
+def test_connected_clears_down_state(client):
+    client.down_since = 123.0
+    client.parse_line(log('INFO', 'connected to server', '{"udpEnabled": true, "count": 1}'))
+    assert client.stats['connects'] == 1
+    assert client.connected.is_set()
+    assert client.down_since is None
+
+
+def test_requests_traffic_and_rtt(client):
+    client.parse_line(log('DEBUG', 'TCP request', '{"addr": "github.com:443"}'))
+    client.parse_line(log('DEBUG', 'TCP request', '{"addr": "api.github.com:443"}'))
+    client.parse_line(log('DEBUG', 'UDP request', '{"addr": "1.1.1.1:53"}'))
+    client.parse_line(log('DEBUG', 'TCP closed', '{"addr": "github.com:443", "tx": 1024, "rx": 4096}'))
+    client.parse_line(log('DEBUG', 'TCP closed', '{"addr": "api.github.com:443", "tx": 100, "rx": 200}'))
+    client.parse_line(log('INFO', 'stats', '{"rtt": "35ms"}'))
+    stats = client.stats
+    assert (stats['tcp'], stats['udp'], stats['tx'], stats['rx']) == (2, 1, 1124, 4296)
+    assert stats['rtt'] == 35.0
+
+
+def test_tcp_error_counted_but_not_tunnel_error(client):
+    client.parse_line(log('ERROR', 'TCP error', '{"addr": "x:443", "error": "connection refused"}'))
+    assert client.stats['tcp_errors'] == 1
+    assert client.stats['errors'] == 0
+    assert client.down_since is None
+
+
+def test_connection_error_marks_tunnel_down(client):
+    client.parse_line(log('ERROR', 'failed to connect', '{"error": "timeout: no recent network activity"}'))
+    assert client.stats['errors'] == 1
+    assert client.stats['last_error'] == 'timeout: no recent network activity'
+    first = client.down_since
+    assert first is not None
+    client.parse_line(log('ERROR', 'connection closed', '{}'))
+    assert client.down_since == first  # 记的是第一次出错的时间
+
+
+def test_other_error_does_not_mark_down(client):
+    client.parse_line(log('FATAL', 'invalid config', '{"error": "bad sni"}'))
+    assert client.stats['errors'] == 1
+    assert client.down_since is None
+
+
+def test_plain_lines_and_bad_json(client):
+    client.parse_line('connected to server')
+    client.parse_line(log('INFO', 'TCP request', '{not json}'))
+    client.parse_line('')
+    assert client.stats['connects'] == 1
+    assert client.stats['tcp'] == 1
+
+
+@pytest.mark.parametrize('value, ms', [
+    (12, 12.0),
+    (1.5, 1.5),
+    ('35ms', 35.0),
+    ('1.2s', 1200.0),
+    ('500us', 0.5),
+    ('40', 40.0),
+])
+def test_rtt_units(value, ms):
+    assert Hysteria2Client.to_ms(value) == pytest.approx(ms)
+
+
+def test_rtt_unparseable():
+    assert Hysteria2Client.to_ms('soon') is None
+
+
+def test_describe_omits_request_stats_without_debug_lines(client):
+    client.parse_line(log('INFO', 'connected to server', '{}'))
+    assert client.describe() == '连接 1 次'
+    client.parse_line(log('DEBUG', 'TCP request', '{"addr": "github.com:443"}'))
+    client.parse_line(log('DEBUG', 'TCP closed', '{"tx": 2097152, "rx": 1048576}'))
+    assert client.describe() == '连接 1 次，TCP 1（失败 0），↑2.0MB ↓1.0MB'
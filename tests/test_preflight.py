@@ -0,0 +1,51 @@
+import importlib.util
+
+import pytest
+
+from auto_login import Preflight
+
+ENV = ('ACCOUNTS', 'GH_USERNAME', 'GH_PASSWORD', 'GH_SESSION', 'CLAW_STATE', 'CLAW_REGION', 'GH_TOTP_SECRET',
+       'PROXY_HY2', 'TG_BOT_TOKEN', 'TG_CHAT_ID', 'REPO_TOKEN', 'GITHUB_REPOSITORY')
+
+
+@pytest.fixture
+def bare(monkeypatch):
+    """没有任何 Secret、没有安装任何依赖的环境；Telegram / REPO_TOKEN 未配置时不会联网"""
+    for name in ENV:
+        monkeypatch.delenv(name, raising=False)
+    installed = set()
+    monkeypatch.setattr(importlib.util, 'find_spec', lambda name, *a: object() if name in installed else None)
+    return installed
+
+
+def test_bare_environment_fails(bare, capsys):
+    assert Preflight().run() == 1
+    out = capsys.readouterr().out
+    assert '❌ GH_USERNAME: 缺少 username、password' in out
+    assert '❌ 依赖: 未安装: requests, playwright, nacl, socks' in out
+    assert '⚠️ pyyaml' in out
+    assert '⚠️ PROXY_HY2' in out
+    assert '⚠️ Telegram' in out
+    assert '⚠️ REPO_TOKEN' in out
+    assert '2 项未通过' in out
+
+
+def test_missing_yaml_is_only_a_warning(bare, monkeypatch):
+    monkeypatch.setattr(Preflight, 'dependencies', lambda self: [('✅', "依赖", "ok"), ('⚠️', "pyyaml", "未安装")])
+    monkeypatch.setenv('GH_USERNAME', 'alice')
+    monkeypatch.setenv('GH_PASSWORD', 'secret')
+    assert Preflight().run() == 0
+
+
+def test_dependencies_without_yaml(bare):
+    bare.update({'requests', 'playwright', 'nacl', 'socks'})
+    assert [level for level, _, _ in Preflight().dependencies()] == ['✅', '⚠️']
+    bare.add('yaml')
+    assert [level for level, _, _ in Preflight().dependencies()] == ['✅']
+
+
+def test_invalid_totp_secret_fails(bare, monkeypatch):
+    monkeypatch.setenv('GH_USERNAME', 'alice')
+    monkeypatch.setenv('GH_PASSWORD', 'secret')
+    monkeypatch.setenv('GH_TOTP_SECRET', 'not base32!')
+    assert Preflight().credentials()[0][0] == '❌'
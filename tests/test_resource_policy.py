@@ -0,0 +1,85 @@
+import pytest
+
+from auto_login import ResourcePolicy
+
+
+@pytest.fixture
+def policy():
+    p = ResourcePolicy()
+    p.policy = {'*': ['image', 'media', 'font'], 'github.com': ['image', 'font', 'stylesheet'], 'console.run.claw.cloud': [],
+                'example.com/static': ['image', 'script']}
+    return p
+
+
+@pytest.mark.parametrize('url, resource_type, reason', [
+    ('https://example.com/logo.png', 'image', 'image'),
+    ('https://example.com/app.js', 'script', None),
+    ('https://example.com/api', 'xhr', None),
+    ('https://example.com/talk.mp4', 'media', 'media'),
+    # 最长匹配的域名规则优先于 "*"，子域名也算
+    ('https://github.com/site.css', 'stylesheet', 'stylesheet'),
+    ('https://github.githubassets.com/x.mp4', 'media', 'media'),
+    ('https://assets.github.com/x.mp4', 'media', None),
+    ('https://console.run.claw.cloud/bg.png', 'image', None),
+    ('https://ap-southeast-1.run.claw.cloud/bg.png', 'image', 'image'),
+    # 带路径的规则只作用于该路径前缀
+    ('https://example.com/static/app.js', 'script', 'script'),
+    ('https://cdn.example.com/static/v2/app.js', 'script', 'script'),
+    ('https://example.com/dynamic/app.js', 'script', None),
+    ('https://example.com/static/talk.mp4', 'media', None),
+    ('https://example.com/other/talk.mp4', 'media', 'media'),
+])
+def test_resource_types_by_host(policy, url, resource_type, reason):
+    assert policy.verdict(url, resource_type) == reason
+
+
+@pytest.mark.parametrize('url', [
+    'https://collector.github.com/github/collect',
+    'https://www.google-analytics.com/g/collect',
+    'https://api.github.com/_private/browser/stats',
+])
+def test_trackers_blocked_for_any_type(policy, url):
+    assert policy.verdict(url, 'xhr') == 'tracker'
+
+
+def test_tracker_rule_respects_path_prefix(policy):
+    assert policy.verdict('https://api.github.com/_private/browser/errors', 'xhr') is None
+
+
+@pytest.mark.parametrize('url', [
+    'https://challenges.cloudflare.com/turnstile/v0/api.js',
+    'https://www.google.com/recaptcha/api2/anchor',
+    'https://octocaptcha.com/image.png',
+])
+def test_captcha_hosts_always_allowed(policy, url):
+    assert policy.verdict(url, 'image') is None
+
+
+def test_non_http_urls_allowed(policy):
+    assert policy.verdict('data:image/png;base64,AAAA', 'image') is None
+    assert policy.verdict('blob:https://github.com/123', 'image') is None
+
+
+class Request:
+    def __init__(self, url, resource_type):
+        self.url = url
+        self.resource_type = resource_type
+
+
+class Route:
+    def __init__(self, url, resource_type):
+        self.request = Request(url, resource_type)
+
+    def fallback(self):
+        return 'fallback'
+
+    def abort(self, reason):
+        return f'abort:{reason}'
+
+
+def test_handle_aborts_and_counts(policy):
+    assert policy.handle(Route('https://example.com/a.png', 'image')) == 'abort:blockedbyclient'
+    assert policy.handle(Route('https://collector.github.com/c', 'ping')) == 'abort:blockedbyclient'
+    assert policy.handle(Route('https://example.com/a.js', 'script')) == 'fallback'
+    assert policy.blocked == {'image': 1, 'tracker': 1}
+    assert policy.blocked_types == {'image': 1, 'ping': 1}
@@ -0,0 +1,119 @@
+import pytest
+
+import auto_login
+from auto_login import RouteSelector
+
+URL = 'https://api.telegram.org/botX/sendMessage'
+
+
+class Proxy:
+    def get_requests_proxies(self):
+        return {'https': 'socks5h://127.0.0.1:1080'}
+
+
+@pytest.fixture
+def selector(monkeypatch):
+    monkeypatch.setattr(auto_login, 'BREAKER_FAILURES', 2)
+    monkeypatch.setattr(auto_login, 'BREAKER_COOLDOWN', 30)
+    clock = [1000.0]
+    monkeypatch.setattr('auto_login.time.time', lambda: clock[0])
+    monkeypatch.setattr(RouteSelector, 'probe', lambda self, url, route: None)  # 不真的联网探测
+    s = RouteSelector(Proxy())
+    s.clock = clock
+    return s
+
+
+def probing(selector, route):
+    return selector.circuits[('api.telegram.org', route)]['probing']
+
+
+def order(selector, default='proxy'):
+    return [route for route, _ in selector.routes(URL, default)]
+
+
+def test_default_route_first_then_remembers_success(selector):
+    assert order(selector) == ['proxy', 'direct']
+    assert order(selector, default='direct') == ['direct', 'proxy']
+    selector.success(URL, 'direct')
+    assert order(selector) == ['direct', 'proxy']
+
+
+def test_opens_after_consecutive_failures(selector):
+    selector.failure(URL, 'proxy', 'timeout')
+    assert order(selector) == ['proxy', 'direct']  # 一次失败不熔断
+    selector.failure(URL, 'proxy', 'timeout')
+    assert order(selector) == ['direct']
+    assert not probing(selector, 'proxy')
+
+
+def test_success_closes_circuit(selector):
+    selector.failure(URL, 'proxy', 'timeout')
+    selector.failure(URL, 'proxy', 'timeout')
+    selector.success(URL, 'proxy')
+    assert selector.circuits == {}
+    assert order(selector) == ['proxy', 'direct']
+
+
+def test_half_open_probe_after_cooldown(selector):
+    selector.failure(URL, 'proxy', 'timeout')
+    selector.failure(URL, 'proxy', 'timeout')
+    selector.clock[0] += 31
+    assert order(selector) == ['direct']  # 探测在后台进行，结果出来前仍跳过
+    assert probing(selector, 'proxy')
+
+
+def test_all_open_still_tries_first(selector):
+    for route in ('proxy', 'direct'):
+        selector.failure(URL, route, 'timeout')
+        selector.failure(URL, route, 'timeout')
+    assert order(selector) == ['proxy']
+
+
+def test_circuits_are_per_host(selector):
+    selector.failure(URL, 'proxy', 'timeout')
+    selector.failure(URL, 'proxy', 'timeout')
+    assert order(selector) == ['direct']
+    assert [route for route, _ in selector.routes('https://api.github.com/repos')] == ['proxy', 'direct']
+
+
+class Response:
+    def __init__(self, status_code):
+        self.status_code = status_code
+
+
+class Session:
+    """按线路返回预设的状态码，记录每次请求走的线路"""
+
+    def __init__(self, statuses):
+        self.statuses = statuses
+        self.calls = []
+
+    def request(self, method, url, proxies=None, **kwargs):
+        route = 'proxy' if proxies else 'direct'
+        self.calls.append(route)
+        return Response(self.statuses[route])
+
+
+def test_server_errors_count_as_route_failures(selector):
+    session = Session({'proxy': 502, 'direct': 200})
+    assert selector.request('GET', URL, session=session).status_code == 200
+    assert session.calls == ['proxy', 'direct']
+    assert selector.request('GET', URL, session=session).status_code == 200
+    assert session.calls == ['proxy', 'direct', 'direct']  # 直连成功后优先直连
+    selector.preferred.clear()
+    selector.request('GET', URL, session=session)
+    assert order(selector) == ['direct']  # 代理连续两次 502，熔断
+
+
+def test_all_routes_server_error_returns_last_response(selector):
+    session = Session({'proxy': 503, 'direct': 500})
+    assert selector.request('GET', URL, session=session).status_code == 500
+    assert selector.circuits[('api.telegram.org', 'proxy')]['failures'] == 1
+    assert selector.circuits[('api.telegram.org', 'direct')]['failures'] == 1
+
+
+def test_client_errors_are_route_successes(selector):
+    session = Session({'proxy': 404, 'direct': 200})
+    assert selector.request('GET', URL, session=session).status_code == 404
+    assert session.calls == ['proxy']
+    assert selector.circuits == {}
@@ -0,0 +1,41 @@
+import pytest
+
+from auto_login import Totp
+
+# RFC 6238 附录 B 的 SHA1 测试向量，密钥为 ASCII "12345678901234567890"
+SECRET = 'GEZDGNBVGY3TQOJQGEZDGNBVGY3TQOJQ'
+
+
+@pytest.mark.parametrize('t, code', [
+    (59, '94287082'),
+    (1111111109, '07081804'),
+    (1111111111, '14050471'),
+    (1234567890, '89005924'),
+    (2000000000, '69279037'),
+    (20000000000, '65353130'),
+])
+def test_rfc6238_vectors(t, code):
+    assert Totp(SECRET, digits=8).at(t) == code
+
+
+def test_six_digits_is_rfc_code_truncated():
+    assert Totp(SECRET).at(59) == '287082'
+    assert Totp(SECRET).at(1111111109) == '081804'
+
+
+def test_secret_formatting_is_ignored():
+    """验证器里显示的密钥常带空格 / 短横线、小写，且没有 = 填充"""
+    spaced = ' '.join(SECRET[i:i + 4] for i in range(0, len(SECRET), 4)).lower()
+    assert Totp(spaced).at(59) == Totp(SECRET).at(59)
+    assert Totp('JBSW-Y3DP-EHPK-3PXP').key == b'Hello!\xde\xad\xbe\xef'
+
+
+def test_now_waits_for_next_window_near_expiry(monkeypatch):
+    clock = [89.0]  # 当前窗口只剩 1 秒
+    monkeypatch.setattr('auto_login.time.time', lambda: clock[0])
+    monkeypatch.setattr('auto_login.time.sleep', lambda s: clock.__setitem__(0, clock[0] + s))
+    monkeypatch.setattr(Totp, 'offset', None)
+    totp = Totp(SECRET)
+    assert totp.now(min_remaining=3) == totp.at(90)
+    clock[0] = 61.0
+    assert totp.now(min_remaining=3) == totp.at(61)